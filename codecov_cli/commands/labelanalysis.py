@@ -1,20 +1,31 @@
 import json
 import logging
 import pathlib
+import threading
 import time
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
 
 import click
+import ijson
 import requests
 
 from codecov_cli.fallbacks import CodecovOption, FallbackFieldEnum
 from codecov_cli.helpers.config import CODECOV_API_URL
+from codecov_cli.helpers.request import PollBackoff, get_retry_after
 from codecov_cli.helpers.validators import validate_commit_sha
 from codecov_cli.runners import get_runner
+from codecov_cli.runners.sharding import (
+    index_test_durations,
+    load_test_durations,
+    split_in_shards,
+    update_test_durations,
+)
 from codecov_cli.runners.types import (
     LabelAnalysisRequestResult,
     LabelAnalysisRunnerInterface,
 )
+from codecov_cli.services.labelanalysis import local_label_analysis
 
 logger = logging.getLogger("codecovcli")
 
@@ -71,6 +82,52 @@ logger = logging.getLogger("codecovcli")
     type=click.Choice(["json", "space-separated-list"]),
     default="json",
 )
+@click.option(
+    "--local-report",
+    "local_report",
+    help=(
+        "Report with contexts of the base commit (e.g. coverage.codecov.json from the compress-pycoverage plugin), "
+        + "or its label index (label_index_file option of the plugin). "
+        + "If Codecov fails or takes longer than --max-wait-time, tests to run are selected locally, "
+        + "from the labels of the lines changed since the base commit, instead of running all tests."
+    ),
+    type=click.Path(path_type=pathlib.Path, dir_okay=False, exists=True),
+    default=None,
+)
+@click.option(
+    "--offline",
+    "offline",
+    help="Select tests to run locally with --local-report only, without requesting label analysis from Codecov.",
+    is_flag=True,
+)
+@click.option(
+    "--shards",
+    "shards",
+    help=(
+        "Dry run only. Also split the tests to run in N groups that take about the same time, "
+        + "using the durations in --test-durations-file (e.g. one group per CI job)."
+    ),
+    type=click.IntRange(min=1),
+    default=None,
+)
+@click.option(
+    "--test-durations-file",
+    "test_durations_file",
+    help=(
+        "JSON file with the duration of each test (same format as pytest-split's .test_durations). "
+        + "Dry runs print the estimated duration of each test to run. "
+        + "Defaults to the test_durations_file of the runner, or .test_durations"
+    ),
+    type=click.Path(path_type=pathlib.Path, dir_okay=False),
+    default=None,
+)
+@click.option(
+    "--junit-xml",
+    "junit_xml_files",
+    help="Junit xml report (pytest --junitxml) of a previous run, to add its test durations to --test-durations-file. Can be used multiple times.",
+    type=click.Path(path_type=pathlib.Path, dir_okay=False, exists=True),
+    multiple=True,
+)
 @click.pass_context
 def label_analysis(
     ctx: click.Context,
@@ -81,6 +138,11 @@ def label_analysis(
     max_wait_time: str,
     dry_run: bool,
     dry_run_format: str,
+    local_report: Optional[pathlib.Path],
+    offline: bool,
+    shards: Optional[int],
+    test_durations_file: Optional[pathlib.Path],
+    junit_xml_files: List[pathlib.Path],
 ):
     enterprise_url = ctx.obj.get("enterprise_url")
     logger.debug(
@@ -94,9 +156,15 @@ def label_analysis(
                 enterprise_url=enterprise_url,
                 max_wait_time=max_wait_time,
                 dry_run=dry_run,
+                local_report=local_report,
+                offline=offline,
+                shards=shards,
+                test_durations_file=test_durations_file,
             )
         ),
     )
+    if offline and local_report is None:
+        raise click.UsageError("--offline requires --local-report")
     if head_commit_sha == base_commit_sha:
         logger.error(
             "Base and head sha can't be the same",
@@ -119,6 +187,26 @@ def label_analysis(
         f"Selected runner: {runner}",
         extra=dict(extra_log_attributes=dict(config=runner.params)),
     )
+    test_durations = _get_test_durations(
+        runner, test_durations_file, junit_xml_files, dry_run=dry_run, shards=shards
+    )
+
+    if offline:
+        logger.info("Collecting labels...")
+        requested_labels = runner.collect_tests()
+        logger.info(f"Collected {len(requested_labels)} test labels")
+        _run_local_label_analysis(
+            local_report,
+            base_commit_sha,
+            head_commit_sha,
+            requested_labels,
+            runner,
+            dry_run=dry_run,
+            dry_run_format=dry_run_format,
+            test_durations=test_durations,
+            shards=shards,
+        )
+        return
 
     upload_url = enterprise_url or CODECOV_API_URL
     url = f"{upload_url}/labels/labels-analysis"
@@ -128,48 +216,66 @@ def label_analysis(
         "head_commit": head_commit_sha,
         "requested_labels": None,
     }
-    # Send the initial label analysis request without labels
-    # Because labels might take a long time to collect
-    eid = _send_labelanalysis_request(payload, url, token_header)
-
-    logger.info("Collecting labels...")
-    requested_labels = runner.collect_tests()
-    logger.info(f"Collected {len(requested_labels)} test labels")
-    logger.debug(
-        "Labels collected",
-        extra=dict(extra_log_attributes=dict(labels_collected=requested_labels)),
-    )
+    poll_backoff = PollBackoff()
+    # Send the initial label analysis request without labels while labels are collected
+    # Because labels might take a long time to collect, and Codecov can start calculating
+    # the lines and labels affected by the diff in the meantime
+    collection_done = threading.Event()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        initial_request = executor.submit(
+            _send_initial_request,
+            dict(payload),
+            url,
+            token_header,
+            collection_done,
+            poll_backoff.initial_delay,
+        )
+        try:
+            logger.info("Collecting labels...")
+            requested_labels = runner.collect_tests()
+        finally:
+            collection_done.set()
+        logger.info(f"Collected {len(requested_labels)} test labels")
+        logger.debug(
+            "Labels collected",
+            extra=dict(extra_log_attributes=dict(labels_collected=requested_labels)),
+        )
+        eid, first_poll = initial_request.result()
     payload["requested_labels"] = requested_labels
 
     if eid:
-        # Initial request with no labels was successful
-        # Now we PATCH the labels in
-        patch_url = f"{upload_url}/labels/labels-analysis/{eid}"
-        _patch_labels(payload, patch_url, token_header)
+        if first_poll is None:
+            # Initial request with no labels was successful
+            # Now we PATCH the labels in
+            patch_url = f"{upload_url}/labels/labels-analysis/{eid}"
+            _patch_labels(payload, patch_url, token_header)
     else:
         # Initial request with no labels failed
         # Retry it
         eid = _send_labelanalysis_request(payload, url, token_header)
         if eid is None:
-            _fallback_to_collected_labels(
+            _fallback(
                 requested_labels,
                 runner,
+                local_report,
+                base_commit_sha,
+                head_commit_sha,
                 dry_run=dry_run,
                 dry_run_format=dry_run_format,
+                test_durations=test_durations,
+                shards=shards,
             )
             return
 
-    has_result = False
     logger.info("Waiting for list of tests to run...")
+    poll_url = f"{upload_url}/labels/labels-analysis/{eid}"
     start_wait = time.monotonic()
-    time.sleep(1)
-    while not has_result:
-        resp_data = requests.get(
-            f"{upload_url}/labels/labels-analysis/{eid}",
-            headers={"Authorization": token_header},
-        )
-        resp_json = resp_data.json()
-        if resp_json["state"] == "finished":
+    if first_poll is None:
+        time.sleep(poll_backoff.next_delay())
+        first_poll = _poll_labelanalysis(poll_url, token_header)
+    resp_json, retry_after = first_poll
+    while True:
+        if resp_json.get("state") == "finished":
             logger.info(
                 "Received list of tests from Codecov",
                 extra=dict(
@@ -181,16 +287,16 @@ def label_analysis(
             request_result = _potentially_calculate_absent_labels(
                 resp_json["result"], requested_labels
             )
-            if not dry_run:
-                runner.process_labelanalysis_result(request_result)
-            else:
-                _dry_run_output(
-                    LabelAnalysisRequestResult(request_result),
-                    runner,
-                    dry_run_format,
-                )
+            _process_result(
+                request_result,
+                runner,
+                dry_run=dry_run,
+                dry_run_format=dry_run_format,
+                test_durations=test_durations,
+                shards=shards,
+            )
             return
-        if resp_json["state"] == "error":
+        if resp_json.get("state") == "error":
             logger.error(
                 "Request had problems calculating",
                 extra=dict(
@@ -201,26 +307,169 @@ def label_analysis(
                     )
                 ),
             )
-            _fallback_to_collected_labels(
-                collected_labels=requested_labels,
-                runner=runner,
+            _fallback(
+                requested_labels,
+                runner,
+                local_report,
+                base_commit_sha,
+                head_commit_sha,
                 dry_run=dry_run,
                 dry_run_format=dry_run_format,
+                test_durations=test_durations,
+                shards=shards,
             )
             return
-        if max_wait_time and (time.monotonic() - start_wait) > max_wait_time:
+        waited_time = time.monotonic() - start_wait
+        if max_wait_time and waited_time > max_wait_time:
             logger.error(
                 f"Exceeded max waiting time of {max_wait_time} seconds. Running all tests.",
             )
-            _fallback_to_collected_labels(
-                collected_labels=requested_labels,
-                runner=runner,
+            _fallback(
+                requested_labels,
+                runner,
+                local_report,
+                base_commit_sha,
+                head_commit_sha,
                 dry_run=dry_run,
                 dry_run_format=dry_run_format,
+                test_durations=test_durations,
+                shards=shards,
             )
             return
-        logger.info("Waiting more time for result...")
-        time.sleep(5)
+        delay = poll_backoff.next_delay(retry_after=retry_after)
+        if max_wait_time:
+            # The last poll happens right at max_wait_time
+            delay = min(delay, max_wait_time - waited_time)
+        logger.info(
+            "Waiting more time for result...",
+            extra=dict(extra_log_attributes=dict(delay=round(delay, 2))),
+        )
+        time.sleep(delay)
+        resp_json, retry_after = _poll_labelanalysis(poll_url, token_header)
+
+
+def _poll_labelanalysis(url: str, token_header: str) -> Tuple[dict, Optional[float]]:
+    """Returns the label analysis request and when the server asked to poll again, if it did"""
+    resp_data = requests.get(url, headers={"Authorization": token_header})
+    # Server is busy, it tells us when to try again (Retry-After)
+    resp_json = resp_data.json() if resp_data.status_code not in (429, 503) else {}
+    return resp_json, get_retry_after(resp_data)
+
+
+def _send_initial_request(
+    payload: dict,
+    url: str,
+    token_header: str,
+    collection_done: threading.Event,
+    first_poll_delay: float,
+) -> Tuple[Optional[str], Optional[Tuple[dict, Optional[float]]]]:
+    """
+    Sends the label analysis request without labels, while labels are being collected.
+    If collection is still running first_poll_delay after the request, polls it once:
+    when Codecov is done by then there's no need to send the labels,
+    absent labels are calculated locally.
+
+    Returns the request id (None if the request failed) and the first poll,
+    if it got a finished (or failed) result.
+    """
+    eid = _send_labelanalysis_request(payload, url, token_header)
+    if eid is None or collection_done.wait(first_poll_delay):
+        return eid, None
+    first_poll = _poll_labelanalysis(f"{url}/{eid}", token_header)
+    if first_poll[0].get("state") in ("finished", "error"):
+        return eid, first_poll
+    return eid, None
+
+
+def _run_local_label_analysis(
+    local_report: pathlib.Path,
+    base_commit_sha: str,
+    head_commit_sha: str,
+    requested_labels: List[str],
+    runner: LabelAnalysisRunnerInterface,
+    *,
+    dry_run: bool = False,
+    dry_run_format: Optional[str] = None,
+    test_durations: Optional[Dict[str, float]] = None,
+    shards: Optional[int] = None,
+):
+    request_result = _potentially_calculate_absent_labels(
+        local_label_analysis(local_report, base_commit_sha, head_commit_sha),
+        requested_labels,
+    )
+    _process_result(
+        request_result,
+        runner,
+        dry_run=dry_run,
+        dry_run_format=dry_run_format,
+        test_durations=test_durations,
+        shards=shards,
+    )
+
+
+def _process_result(
+    request_result: LabelAnalysisRequestResult,
+    runner: LabelAnalysisRunnerInterface,
+    *,
+    dry_run: bool = False,
+    dry_run_format: Optional[str] = None,
+    test_durations: Optional[Dict[str, float]] = None,
+    shards: Optional[int] = None,
+):
+    if not dry_run:
+        runner.process_labelanalysis_result(request_result)
+    else:
+        _dry_run_output(
+            request_result,
+            runner,
+            dry_run_format,
+            test_durations=test_durations,
+            shards=shards,
+        )
+
+
+def _fallback(
+    requested_labels: List[str],
+    runner: LabelAnalysisRunnerInterface,
+    local_report: Optional[pathlib.Path],
+    base_commit_sha: str,
+    head_commit_sha: str,
+    *,
+    dry_run: bool = False,
+    dry_run_format: Optional[str] = None,
+    test_durations: Optional[Dict[str, float]] = None,
+    shards: Optional[int] = None,
+):
+    """Selects tests locally if there's a local report, otherwise runs all collected tests"""
+    if local_report is not None:
+        logger.info("Selecting tests to run locally, from the local report")
+        try:
+            request_result = _potentially_calculate_absent_labels(
+                local_label_analysis(local_report, base_commit_sha, head_commit_sha),
+                requested_labels,
+            )
+        except (click.ClickException, OSError, ValueError, ijson.JSONError) as exp:
+            logger.error(
+                "Unable to select tests locally",
+                extra=dict(extra_log_attributes=dict(error=str(exp))),
+            )
+        else:
+            return _process_result(
+                request_result,
+                runner,
+                dry_run=dry_run,
+                dry_run_format=dry_run_format,
+                test_durations=test_durations,
+                shards=shards,
+            )
+    return _fallback_to_collected_labels(
+        collected_labels=requested_labels,
+        runner=runner,
+        dry_run=dry_run,
+        dry_run_format=dry_run_format,
+        test_durations=test_durations,
+        shards=shards,
+    )
 
 
 def _potentially_calculate_absent_labels(
@@ -321,20 +570,43 @@ def _send_labelanalysis_request(payload, url, token_header):
 
 
 def _dry_run_json_output(
-    labels_to_run: set, labels_to_skip: set, runner_options: List[str]
+    labels_to_run: set,
+    labels_to_skip: set,
+    runner_options: List[str],
+    *,
+    durations: Optional[Dict[str, Optional[float]]] = None,
+    shard_groups: Optional[List[List[str]]] = None,
 ) -> None:
     output_as_dict = dict(
         runner_options=runner_options,
         ats_tests_to_run=sorted(labels_to_run),
         ats_tests_to_skip=sorted(labels_to_skip),
     )
+    if durations is not None:
+        output_as_dict["ats_tests_durations"] = durations
+        output_as_dict["ats_estimated_duration"] = _estimated_duration(
+            labels_to_run, durations
+        )
+    if shard_groups is not None:
+        output_as_dict["ats_shards"] = [
+            dict(
+                tests=shard_group,
+                estimated_duration=_estimated_duration(shard_group, durations),
+            )
+            for shard_group in shard_groups
+        ]
     # ⚠️ DON'T use logger
     # logger goes to stderr, we want it in stdout
     click.echo(json.dumps(output_as_dict))
 
 
 def _dry_run_list_output(
-    labels_to_run: set, labels_to_skip: set, runner_options: List[str]
+    labels_to_run: set,
+    labels_to_skip: set,
+    runner_options: List[str],
+    *,
+    durations: Optional[Dict[str, Optional[float]]] = None,
+    shard_groups: Optional[List[List[str]]] = None,
 ) -> None:
     to_run_line = " ".join(
         sorted(map(lambda l: f"'{l}'", runner_options))
@@ -348,12 +620,61 @@ def _dry_run_list_output(
     # logger goes to stderr, we want it in stdout
     click.echo(f"TESTS_TO_RUN={to_run_line}")
     click.echo(f"TESTS_TO_SKIP={to_skip_line}")
+    for idx, shard_group in enumerate(shard_groups or []):
+        shard_line = " ".join(
+            sorted(map(lambda l: f"'{l}'", runner_options))
+            + sorted(map(lambda l: f"'{l}'", shard_group))
+        )
+        click.echo(f"TESTS_TO_RUN_SHARD_{idx}={shard_line}")
+
+
+def _estimated_duration(
+    labels: Iterable[str], durations: Optional[Dict[str, Optional[float]]]
+) -> float:
+    """Sum of the known durations of labels, in seconds"""
+    return round(sum((durations or {}).get(label) or 0 for label in labels), 3)
+
+
+def _get_test_durations(
+    runner: LabelAnalysisRunnerInterface,
+    test_durations_file: Optional[pathlib.Path],
+    junit_xml_files: List[pathlib.Path],
+    *,
+    dry_run: bool = False,
+    shards: Optional[int] = None,
+) -> Optional[Dict[str, float]]:
+    """
+    Adds the durations of junit_xml_files to the durations file.
+    Returns the index of the test durations (see index_test_durations) if a dry run
+    needs them, None otherwise.
+    Dry runs only print durations if asked to by one of the options, so the output
+    doesn't change because a durations file (e.g. from pytest-split) happens to exist.
+    """
+    durations_requested = (
+        shards is not None or test_durations_file is not None or bool(junit_xml_files)
+    )
+    if test_durations_file is None:
+        test_durations_file = pathlib.Path(
+            getattr(runner.params, "test_durations_file", None) or ".test_durations"
+        )
+    if junit_xml_files:
+        durations = update_test_durations(test_durations_file, junit_xml_files)
+    elif dry_run and durations_requested:
+        durations = load_test_durations(test_durations_file)
+    else:
+        return None
+    if not dry_run:
+        return None
+    return index_test_durations(durations)
 
 
 def _dry_run_output(
     result: LabelAnalysisRequestResult,
     runner: LabelAnalysisRunnerInterface,
     dry_run_format: str,
+    *,
+    test_durations: Optional[Dict[str, float]] = None,
+    shards: Optional[int] = None,
 ):
     labels_to_run = set(
         result.absent_labels + result.global_level_labels + result.present_diff_labels
@@ -367,7 +688,23 @@ def _dry_run_output(
     # Because dry_run_format is a click.Choice we can
     # be sure the value will be in the dict of choices
     fn_to_use = format_lookup[dry_run_format]
-    fn_to_use(labels_to_run, labels_to_skip, runner.dry_run_runner_options)
+    durations = None
+    shard_groups = None
+    if test_durations is not None:
+        durations = {
+            label: test_durations.get(label) for label in sorted(labels_to_run)
+        }
+        if shards is not None:
+            shard_groups = split_in_shards(
+                sorted(labels_to_run), shards, test_durations
+            )
+    fn_to_use(
+        labels_to_run,
+        labels_to_skip,
+        runner.dry_run_runner_options,
+        durations=durations,
+        shard_groups=shard_groups,
+    )
 
 
 def _fallback_to_collected_labels(
@@ -376,6 +713,8 @@ def _fallback_to_collected_labels(
     *,
     dry_run: bool = False,
     dry_run_format: Optional[pathlib.Path] = None,
+    test_durations: Optional[Dict[str, float]] = None,
+    shards: Optional[int] = None,
 ) -> dict:
     logger.info("Trying to fallback on collected labels")
     if collected_labels:
@@ -392,7 +731,11 @@ def _fallback_to_collected_labels(
             return runner.process_labelanalysis_result(fake_response)
         else:
             return _dry_run_output(
-                LabelAnalysisRequestResult(fake_response), runner, dry_run_format
+                LabelAnalysisRequestResult(fake_response),
+                runner,
+                dry_run_format,
+                test_durations=test_durations,
+                shards=shards,
             )
     logger.error("Cannot fallback to collected labels because no labels were collected")
     raise click.ClickException("Failed to get list of labels to run")
@@ -71,6 +71,25 @@ _global_upload_options = [
         is_flag=True,
         default=False,
     ),
+    click.option(
+        "--file-fixes-cache",
+        "file_fixes_cache_file",
+        help="File to cache file fixes in between runs. Files that didn't change since they were cached are not read again.",
+        type=click.Path(path_type=pathlib.Path),
+        default=None,
+    ),
+    click.option(
+        "--limit-network-to-reports",
+        help="Only include in the network (and apply file fixes to) files referenced by the coverage reports found. Reduces the upload size of big repositories.",
+        is_flag=True,
+        default=False,
+    ),
+    click.option(
+        "--network-format",
+        help="Format of the network section of the upload. 'front-coded' is a compact encoding for repositories with deeply nested paths",
+        type=click.Choice(["legacy", "front-coded"]),
+        default="legacy",
+    ),
     click.option(
         "-b",
         "--build",
@@ -185,6 +204,9 @@ def do_upload(
     coverage_files_search_explicitly_listed_files: typing.List[pathlib.Path],
     disable_search: bool,
     disable_file_fixes: bool,
+    file_fixes_cache_file: typing.Optional[pathlib.Path],
+    limit_network_to_reports: bool,
+    network_format: str,
     token: typing.Optional[uuid.UUID],
     plugin_names: typing.List[str],
     branch: typing.Optional[str],
@@ -226,6 +248,9 @@ def do_upload(
                 enterprise_url=enterprise_url,
                 disable_search=disable_search,
                 disable_file_fixes=disable_file_fixes,
+                file_fixes_cache_file=file_fixes_cache_file,
+                limit_network_to_reports=limit_network_to_reports,
+                network_format=network_format,
                 handle_no_reports_found=handle_no_reports_found,
             )
         ),
@@ -263,4 +288,7 @@ def do_upload(
         disable_search=disable_search,
         handle_no_reports_found=handle_no_reports_found,
         disable_file_fixes=disable_file_fixes,
+        file_fixes_cache_file=file_fixes_cache_file,
+        limit_network_to_reports=limit_network_to_reports,
+        network_format=network_format,
     )
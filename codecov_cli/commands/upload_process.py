@@ -38,6 +38,9 @@ def upload_process(
     coverage_files_search_explicitly_listed_files: typing.List[pathlib.Path],
     disable_search: bool,
     disable_file_fixes: bool,
+    file_fixes_cache_file: typing.Optional[pathlib.Path],
+    limit_network_to_reports: bool,
+    network_format: str,
     token: typing.Optional[uuid.UUID],
     plugin_names: typing.List[str],
     branch: typing.Optional[str],
@@ -74,6 +77,9 @@ def upload_process(
                 git_service=git_service,
                 disable_search=disable_search,
                 disable_file_fixes=disable_file_fixes,
+                file_fixes_cache_file=file_fixes_cache_file,
+                limit_network_to_reports=limit_network_to_reports,
+                network_format=network_format,
                 fail_on_error=fail_on_error,
                 handle_no_reports_found=handle_no_reports_found,
             )
@@ -126,4 +132,7 @@ def upload_process(
         git_service=git_service,
         handle_no_reports_found=handle_no_reports_found,
         disable_file_fixes=disable_file_fixes,
+        file_fixes_cache_file=file_fixes_cache_file,
+        limit_network_to_reports=limit_network_to_reports,
+        network_format=network_format,
     )
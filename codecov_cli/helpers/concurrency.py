@@ -0,0 +1,21 @@
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+T = typing.TypeVar("T")
+R = typing.TypeVar("R")
+
+
+def run_in_threads(
+    function: typing.Callable[[T], R],
+    items: typing.Iterable[T],
+    max_workers: typing.Optional[int] = None,
+) -> typing.List[R]:
+    """
+    Calls function on every item, at most max_workers at once, and returns the results in order.
+
+    Meant for work that waits on subprocesses (gcov, llvm-cov, coverage.py, pytest) or on disk reads.
+    The GIL is released while waiting, so threads are enough to bound how many run at once,
+    without the cost of starting processes and pickling arguments and results.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(function, items))
@@ -1,4 +1,7 @@
+import base64
+import os
 import re
+import typing
 
 slug_without_subgroups_regex = re.compile(r"[^/\s]+\/[^/\s]+$")
 slug_with_subgroups_regex = re.compile(r"[^/\s]+(\/[^/\s]+)+$")
@@ -27,3 +30,80 @@ def slug_with_subgroups_is_invalid(slug: str):
     Returns True if it's invalid, otherwise return False
     """
     return not slug or not slug_with_subgroups_regex.match(slug)
+
+
+def front_code_paths(paths: typing.List[str]) -> typing.List[typing.List]:
+    """
+    Encodes a list of paths as a front-coded sorted list.
+    Each path is stored as the length of the prefix it shares with the
+    previous path, followed by the rest of the path.
+
+    Example:
+    - ["a/b/c.py", "a/b/d.py", "a/e.py"] returns [[0, "a/b/c.py"], [4, "d.py"], [2, "e.py"]]
+    """
+    encoded = []
+    previous_path = ""
+    for path in sorted(paths):
+        prefix_length = len(os.path.commonprefix([previous_path, path]))
+        encoded.append([prefix_length, path[prefix_length:]])
+        previous_path = path
+    return encoded
+
+
+def decode_front_coded_paths(encoded: typing.List[typing.List]) -> typing.List[str]:
+    paths = []
+    previous_path = ""
+    for prefix_length, suffix in encoded:
+        previous_path = previous_path[:prefix_length] + suffix
+        paths.append(previous_path)
+    return paths
+
+
+def encode_label_indexes(label_indexes: typing.Iterable[int]) -> str:
+    """
+    Encodes a set of label indexes as base64 delta-encoded varints.
+    Indexes are sorted, and each one is stored as the difference to the previous one,
+    as an unsigned LEB128 varint (7 bits per byte, high bit set if more bytes follow).
+
+    Example:
+    - [1, 2, 300] is stored as the deltas [1, 1, 298], encoded as "AQGqAg=="
+    """
+    return base64.b64encode(encode_label_indexes_bytes(label_indexes)).decode("ascii")
+
+
+def decode_label_indexes(encoded: str) -> typing.List[int]:
+    return decode_label_indexes_bytes(base64.b64decode(encoded, validate=True))
+
+
+def encode_label_indexes_bytes(label_indexes: typing.Iterable[int]) -> bytes:
+    """Same as encode_label_indexes, without the base64 encoding."""
+    encoded = bytearray()
+    previous_index = 0
+    for index in sorted(set(label_indexes)):
+        if index < 0:
+            raise ValueError("Label indexes can't be negative")
+        delta = index - previous_index
+        previous_index = index
+        while delta >= 0x80:
+            encoded.append((delta & 0x7F) | 0x80)
+            delta >>= 7
+        encoded.append(delta)
+    return bytes(encoded)
+
+
+def decode_label_indexes_bytes(encoded: bytes) -> typing.List[int]:
+    label_indexes = []
+    previous_index = 0
+    delta = 0
+    shift = 0
+    for byte in encoded:
+        delta |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            previous_index += delta
+            label_indexes.append(previous_index)
+            delta = 0
+            shift = 0
+    if shift:
+        raise ValueError("Encoded label indexes end in the middle of a varint")
+    return label_indexes
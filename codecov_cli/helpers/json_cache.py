@@ -0,0 +1,46 @@
+import json
+import logging
+import pathlib
+import typing
+
+logger = logging.getLogger("codecovcli")
+
+
+def load_json_cache(
+    cache_file: pathlib.Path,
+    version: int,
+    key: str,
+    expected: typing.Optional[typing.Dict[str, typing.Any]] = None,
+    description: str = "cache",
+) -> typing.Optional[typing.Any]:
+    """
+    Returns the entry `key` of a JSON cache written as {"version": version, key: ..., ...}.
+    None if the file doesn't exist, is from another version, or was built with different
+    inputs (any of the `expected` entries has another value), so it has to be rebuilt.
+
+    Caches only save time, so a cache that can't be read is logged and ignored.
+    """
+    if not cache_file.exists():
+        return None
+    try:
+        with open(cache_file, "r") as f:
+            content = json.load(f)
+        if content.get("version") != version:
+            logger.debug(
+                f"Ignoring {description} {cache_file} from a different version",
+                extra=dict(extra_log_attributes=dict(version=content.get("version"))),
+            )
+            return None
+        for expected_key, expected_value in (expected or {}).items():
+            if content[expected_key] != expected_value:
+                logger.debug(
+                    f"Ignoring {description} {cache_file}, {expected_key} changed"
+                )
+                return None
+        return content[key]
+    except (OSError, ValueError, KeyError, AttributeError) as exp:
+        logger.warning(
+            f"Unable to read {description} {cache_file}. Ignoring it.",
+            extra=dict(extra_log_attributes=dict(error=str(exp))),
+        )
+        return None
@@ -1,5 +1,9 @@
 import logging
+import random
+import time
+import typing
 import uuid
+from email.utils import parsedate_to_datetime
 from time import sleep
 
 import click
@@ -37,6 +41,59 @@ def retry_request(func):
     return wrapper
 
 
+class PollBackoff(object):
+    """
+    Delays between polls of a result that is being calculated.
+    Polls start fast, so results ready in a second or two are picked up right away,
+    and back off exponentially (with jitter, so CI jobs started together don't poll
+    in lockstep) up to max_delay.
+    """
+
+    def __init__(
+        self,
+        initial_delay: float = 0.5,
+        max_delay: float = 5,
+        multiplier: float = 1.5,
+        jitter: float = 0.2,
+        rng: typing.Optional[random.Random] = None,
+    ):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.rng = rng or random.Random()
+        self.polls = 0
+
+    def next_delay(self, retry_after: typing.Optional[float] = None) -> float:
+        """
+        Returns how long to wait before the next poll.
+        If the server said when to retry (Retry-After), that's used instead.
+        """
+        if retry_after is not None:
+            self.polls += 1
+            return retry_after
+        delay = min(self.initial_delay * self.multiplier**self.polls, self.max_delay)
+        self.polls += 1
+        return delay * self.rng.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+def get_retry_after(resp: requests.Response) -> typing.Optional[float]:
+    """Returns the seconds to wait from the Retry-After header, if the response has one"""
+    retry_after = resp.headers.get("Retry-After")
+    if retry_after is None:
+        return None
+    try:
+        return max(float(retry_after), 0)
+    except ValueError:
+        pass
+    try:
+        # It can also be a HTTP date
+        retry_at = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0)
+
+
 @retry_request
 def send_post_request(
     url: str, data: dict = None, headers: dict = None, params: dict = None
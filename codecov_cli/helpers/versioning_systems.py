@@ -9,6 +9,8 @@ from codecov_cli.helpers.git import parse_git_service, parse_slug
 
 logger = logging.getLogger("codecovcli")
 
+LS_FILES_CHUNK_SIZE = 64 * 1024
+
 
 class VersioningSystemInterface(object):
     def __repr__(self) -> str:
@@ -27,6 +29,15 @@ class VersioningSystemInterface(object):
     ) -> typing.List[str]:
         pass
 
+    def get_file_blob_ids(
+        self, root_folder: typing.Optional[Path] = None
+    ) -> typing.Dict[str, str]:
+        """
+        Maps file paths to an identifier of their contents.
+        Files whose content can't be identified are left out.
+        """
+        return {}
+
 
 def get_versioning_system() -> VersioningSystemInterface:
     for klass in [GitVersioningSystem, NoVersioningSystem]:
@@ -106,20 +117,76 @@ class GitVersioningSystem(VersioningSystemInterface):
     def list_relevant_files(
         self, root_folder: typing.Optional[Path] = None
     ) -> typing.List[str]:
+        return list(self.iter_relevant_files(root_folder))
+
+    def iter_relevant_files(
+        self, root_folder: typing.Optional[Path] = None
+    ) -> typing.Iterator[str]:
+        """
+        Yields the files tracked by git as they are listed.
+        Paths are NUL-delimited (-z), so git doesn't quote or escape them,
+        and paths with spaces or newlines are kept whole.
+        """
+        dir_to_use = root_folder or self.get_network_root()
+        if dir_to_use is None:
+            raise ValueError("Can't determine root folder")
+
+        with subprocess.Popen(
+            ["git", "-C", str(dir_to_use), "ls-files", "-z"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        ) as process:
+            remainder = b""
+            for chunk in iter(lambda: process.stdout.read(LS_FILES_CHUNK_SIZE), b""):
+                *filenames, remainder = (remainder + chunk).split(b"\0")
+                for filename in filenames:
+                    yield filename.decode(errors="surrogateescape")
+            if remainder:
+                yield remainder.decode(errors="surrogateescape")
+            stderr = process.stderr.read()
+            if process.wait() != 0:
+                # e.g. "detected dubious ownership" in CI containers
+                logger.warning(
+                    "Unable to list the files tracked by git. The network may be incomplete.",
+                    extra=dict(
+                        extra_log_attributes=dict(
+                            returncode=process.returncode,
+                            stderr=stderr.decode(errors="replace").strip(),
+                        )
+                    ),
+                )
+
+    def get_file_blob_ids(
+        self, root_folder: typing.Optional[Path] = None
+    ) -> typing.Dict[str, str]:
         dir_to_use = root_folder or self.get_network_root()
         if dir_to_use is None:
             raise ValueError("Can't determine root folder")
 
-        res = subprocess.run(
-            ["git", "-C", str(dir_to_use), "ls-files"], capture_output=True
+        staged = subprocess.run(
+            ["git", "-C", str(dir_to_use), "ls-files", "-s", "-z"],
+            capture_output=True,
+        )
+        # The blob ids from the index don't reflect uncommitted changes
+        modified = subprocess.run(
+            ["git", "-C", str(dir_to_use), "ls-files", "-m", "-z"],
+            capture_output=True,
+        )
+        modified_files = set(
+            filename
+            for filename in modified.stdout.decode(errors="surrogateescape").split("\0")
+            if filename
         )
 
-        return [
-            filename[1:-1]
-            if filename.startswith('"') and filename.endswith('"')
-            else filename
-            for filename in res.stdout.decode("unicode_escape").strip().split()
-        ]
+        blob_ids = {}
+        for entry in staged.stdout.decode(errors="surrogateescape").split("\0"):
+            if not entry:
+                continue
+            # Each entry is "<mode> <blob id> <stage>\t<path>"
+            info, filename = entry.split("\t", 1)
+            if filename not in modified_files:
+                blob_ids[filename] = info.split(" ")[1]
+        return blob_ids
 
 
 class NoVersioningSystem(VersioningSystemInterface):
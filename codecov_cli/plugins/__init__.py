@@ -61,12 +61,18 @@ def _load_plugin_from_yaml(plugin_dict: typing.Dict):
 
 def _get_plugin(cli_config, plugin_name):
     if plugin_name == "gcov":
-        return GcovPlugin()
+        config = cli_config.get("plugins", {}).get("gcov", {})
+        return GcovPlugin(
+            **_get_plugin_params(
+                config, ["batch_size", "max_workers", "manifest_file", "output_format"]
+            )
+        )
     if plugin_name == "pycoverage":
         config = cli_config.get("plugins", {}).get("pycoverage", {})
         return Pycoverage(config)
     if plugin_name == "xcode":
-        return XcodePlugin()
+        config = cli_config.get("plugins", {}).get("xcode", {})
+        return XcodePlugin(**_get_plugin_params(config, ["max_workers"]))
     if plugin_name == "compress-pycoverage":
         config = cli_config.get("plugins", {}).get("compress-pycoverage", {})
         return CompressPycoverageContexts(config)
@@ -74,3 +80,8 @@ def _get_plugin(cli_config, plugin_name):
         return _load_plugin_from_yaml(cli_config["plugins"][plugin_name])
     click.secho(f"Unable to find plugin {plugin_name}", fg="magenta", err=True)
     return NoopPlugin()
+
+
+def _get_plugin_params(config: typing.Dict, param_names: typing.List[str]):
+    """Picks the constructor params of a builtin plugin set in its config, so the plugin defaults apply to the others"""
+    return {name: config[name] for name in param_names if name in config}
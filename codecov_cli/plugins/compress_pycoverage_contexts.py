@@ -1,16 +1,24 @@
+import itertools
 import json
 import logging
 import pathlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from decimal import Decimal
-from typing import Any, List
+from io import StringIO
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import ijson
 from smart_open import open
 
+from codecov_cli.helpers.encoder import encode_label_indexes
 from codecov_cli.plugins.types import PreparationPluginReturn
+from codecov_cli.services.labelanalysis.label_index_file import write_label_index
 
 logger = logging.getLogger("codecovcli")
 
+FILES_PER_CHUNK = 64
+
 
 class Encoder(json.JSONEncoder):
     def default(self, o: Any) -> Any:
@@ -37,6 +45,39 @@ class CompressPycoverageContextsConfig(dict):
         """
         return self.get("delete_uncompressed", True)
 
+    @property
+    def label_encoding(self) -> str:
+        """
+        How the label indexes of each line are written in the contexts.
+        'list' writes a JSON list of indexes.
+        'varint' writes the sorted indexes as base64 delta-encoded varints
+        (see codecov_cli.helpers.encoder.decode_label_indexes), which is a lot smaller
+        for lines covered by many labels.
+        label_encoding: str [values list|varint; default list]
+        """
+        return self.get("label_encoding", "list")
+
+    @property
+    def workers(self) -> int:
+        """
+        Number of processes compressing the files' contexts.
+        With more than 1 worker the report is read twice: once to build the labels table,
+        and again to compress chunks of files in parallel, that are written in order.
+        workers: int [default 1]
+        """
+        return self.get("workers", 1)
+
+    @property
+    def label_index_file(self) -> Optional[pathlib.Path]:
+        """
+        If set, a label index (line -> labels) of the compressed report is written to this file.
+        It can be kept in CI caches and used with `label-analysis --local-report`,
+        which looks up the lines changed without loading the whole report.
+        label_index_file: Optional[Union[str, pathlib.Path]] [default None]
+        """
+        label_index_file = self.get("label_index_file")
+        return pathlib.Path(label_index_file) if label_index_file else None
+
 
 class CompressPycoverageContexts(object):
     def __init__(self, config: dict = None) -> None:
@@ -49,6 +90,11 @@ class CompressPycoverageContexts(object):
         )
 
     def run_preparation(self, collector) -> PreparationPluginReturn:
+        if self.config.label_encoding not in ("list", "varint"):
+            return PreparationPluginReturn(
+                success=False,
+                messages=[f"label encoding {self.config.label_encoding} unknown"],
+            )
         if not self.file_to_compress.exists():
             logger.warning(
                 f"File to compress {self.file_to_compress} not found. Aborting"
@@ -69,21 +115,60 @@ class CompressPycoverageContexts(object):
         fd_in = open(self.file_to_compress, "rb")
         fd_out = open(self.file_to_write, "w")
         # Compress the file
-        fd_out.write("{")
-        self._copy_meta(fd_in, fd_out)
-        files_in_report = ijson.kvitems(fd_in, "files")
-        self._compress_files(files_in_report, fd_out)
-        fd_out.write("}")
+        logger.debug(f"Parsing {self.file_to_compress} with ijson {ijson.backend}")
+        labels_table = None
+        if self.config.workers > 1:
+            labels_table = self._build_labels_table()
+        self._compress_report(ijson.parse(fd_in), fd_out, labels_table)
         # Close streams
         fd_in.close()
         fd_out.close()
         logger.info(f"Compressed report written to {self.file_to_write}")
+        if self.config.label_index_file is not None:
+            write_label_index(self.file_to_write, self.config.label_index_file)
         # Delete original file if needed
         if self.config.delete_uncompressed:
             logger.info(f"Deleting file {self.file_to_compress}")
             self.file_to_compress.unlink()
         return PreparationPluginReturn(success=True, messages=[])
 
+    def _build_labels_table(self) -> Dict[str, int]:
+        """
+        Builds the labels table in a streaming pass over the report,
+        assigning indexes in the same order _compress_files would.
+        """
+        labels_table = {}
+        with open(self.file_to_compress, "rb") as fd_in:
+            for _, file_coverage_details in ijson.kvitems(fd_in, "files"):
+                for labels in file_coverage_details["contexts"].values():
+                    for label in labels:
+                        stripped_label = label.split("|")[0]
+                        if stripped_label not in labels_table:
+                            labels_table[stripped_label] = len(labels_table)
+        return labels_table
+
+    def _compress_report(self, parse_events, fd_out, labels_table=None) -> None:
+        """
+        Compress the report in a single pass over the parser events.
+        Only one entry of 'files' is in memory at any time
+        (or a few chunks of them if compressing in parallel).
+        Other top level entries (e.g. 'meta', 'totals') are copied as they are.
+        """
+        other_entries = []
+        files_events = _split_files_events(parse_events, other_entries)
+        files_in_report = ijson.kvitems(files_events, "files")
+        fd_out.write("{")
+        if labels_table is None:
+            self._compress_files(files_in_report, fd_out)
+        else:
+            self._compress_files_in_parallel(files_in_report, fd_out, labels_table)
+        if self.config.label_encoding != "list":
+            # So the contexts can be decoded when processing the report
+            fd_out.write(f',"labels_encoding": "{self.config.label_encoding}"')
+        # Other entries are small, and kept until 'files' is fully parsed
+        self._copy_entries(other_entries, fd_out)
+        fd_out.write("}")
+
     def _compress_files(self, files_in_report, fd_out) -> None:
         """
         Compress the 'files' entry in the coverage data.
@@ -91,37 +176,82 @@ class CompressPycoverageContexts(object):
         This index then substitutes the label itself in the contexts
         """
         labels_table = {}
-        nxt_idx = 0
 
         fd_out.write('"files":{')
+        is_first_file = True
         for file_name, file_coverage_details in files_in_report:
-            self._copy_file_details(file_name, file_coverage_details, fd_out)
-            fd_out.write('"contexts": {')
-            contexts = file_coverage_details["contexts"]
-            for line_number, labels in contexts.items():
-                fd_out.write(f'"{line_number}":')
-                new_labels = []
-                for label in labels:
-                    stripped_label = label.split("|")[0]  # removes '|run' from label
-                    if stripped_label not in labels_table:
-                        labels_table[stripped_label] = nxt_idx
-                        nxt_idx += 1
-                    new_labels.append(labels_table[stripped_label])
-                fd_out.write(json.dumps(new_labels))
-                # fd_out.write(self._bitmask_label_indexes(new_labels))
+            if not is_first_file:
                 fd_out.write(",")
-            if len(contexts):  # Avoid removing '{' if contexts == {}
-                # Because there will be an extra ',' after the last line
-                fd_out.seek(fd_out.tell() - 1)
-            # One curly brace for the 'contexts', one for the file_name
-            fd_out.write("}},")
-        # Because there will be an extra ',' after the last file_name
-        fd_out.seek(fd_out.tell() - 1)
-        fd_out.write("},")
+            is_first_file = False
+            self._compress_file(file_name, file_coverage_details, labels_table, fd_out)
+        fd_out.write("}")
+        self._write_labels_table(labels_table, fd_out)
+
+    def _compress_files_in_parallel(
+        self, files_in_report, fd_out, labels_table: Dict[str, int]
+    ) -> None:
+        """
+        Compress the 'files' entry with a pool of processes, in chunks of files.
+        labels_table must already have every label in the report,
+        so files can be compressed independently.
+        Chunks are written in the order they are read, and only a few of them
+        are in flight at any time to bound memory usage.
+        """
+        fd_out.write('"files":{')
+        max_pending_chunks = self.config.workers * 2
+        pending_chunks = deque()
+        is_first_chunk = True
+
+        def write_next_chunk():
+            nonlocal is_first_chunk
+            compressed_chunk = pending_chunks.popleft().result()
+            if not is_first_chunk:
+                fd_out.write(",")
+            is_first_chunk = False
+            fd_out.write(compressed_chunk)
+
+        with ProcessPoolExecutor(
+            max_workers=self.config.workers,
+            initializer=_init_compression_worker,
+            initargs=(self, labels_table),
+        ) as executor:
+            for chunk in _iter_chunks(files_in_report, FILES_PER_CHUNK):
+                pending_chunks.append(executor.submit(_compress_files_chunk, chunk))
+                if len(pending_chunks) >= max_pending_chunks:
+                    write_next_chunk()
+            while pending_chunks:
+                write_next_chunk()
+        fd_out.write("}")
+        self._write_labels_table(labels_table, fd_out)
+
+    def _compress_file(
+        self, file_name, file_coverage_details, labels_table: Dict[str, int], fd_out
+    ) -> None:
+        """
+        Writes one file of the report, with labels in contexts replaced by their index.
+        Labels not yet in the labels_table are added to it.
+        """
+        self._copy_file_details(file_name, file_coverage_details, fd_out)
+        encode_labels = self.config.label_encoding == "varint"
+        compressed_contexts = {}
+        for line_number, labels in file_coverage_details["contexts"].items():
+            new_labels = []
+            for label in labels:
+                stripped_label = label.split("|")[0]  # removes '|run' from label
+                label_idx = labels_table.get(stripped_label)
+                if label_idx is None:
+                    label_idx = labels_table[stripped_label] = len(labels_table)
+                new_labels.append(label_idx)
+            compressed_contexts[line_number] = (
+                encode_label_indexes(new_labels) if encode_labels else new_labels
+            )
+        fd_out.write(f'"contexts": {json.dumps(compressed_contexts)}}}')
+
+    def _write_labels_table(self, labels_table: Dict[str, int], fd_out) -> None:
         # Save the inverted index of labels table in the report
         # So when we are processing the result we have int -> label
         fd_out.write(
-            f'"labels_table": {json.dumps({ value: key for key, value in labels_table.items() })}'
+            f',"labels_table": {json.dumps({ value: key for key, value in labels_table.items() })}'
         )
 
     def _copy_file_details(self, file_name, file_details, fd_out) -> None:
@@ -131,10 +261,74 @@ class CompressPycoverageContexts(object):
         fd_out.write(f'"missing_lines": {file_details["missing_lines"]},')
         fd_out.write(f'"excluded_lines": {file_details["excluded_lines"]},')
 
-    def _copy_meta(self, fd_in, fd_out) -> None:
-        meta = ijson.kvitems(fd_in, "")
-        for key, value in meta:
-            if key == "files":
-                continue
-            fd_out.write(f'"{key}": {json.dumps(value, cls=Encoder)},')
-        fd_in.seek(0)
+    def _copy_entries(self, entries: List[Tuple[str, Any]], fd_out) -> None:
+        """Copies top level entries other than 'files'."""
+        for key, value in entries:
+            fd_out.write(f',"{key}": {json.dumps(value, cls=Encoder)}')
+
+
+def _iter_chunks(iterable, chunk_size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+_worker_plugin = None
+_worker_labels_table = None
+
+
+def _init_compression_worker(plugin, labels_table: Dict[str, int]) -> None:
+    # The labels table is sent once per worker, instead of once per chunk
+    global _worker_plugin, _worker_labels_table
+    _worker_plugin = plugin
+    _worker_labels_table = labels_table
+
+
+def _compress_files_chunk(chunk: List[Tuple[str, Any]]) -> str:
+    fd_out = StringIO()
+    for idx, (file_name, file_coverage_details) in enumerate(chunk):
+        if idx:
+            fd_out.write(",")
+        _worker_plugin._compress_file(
+            file_name, file_coverage_details, _worker_labels_table, fd_out
+        )
+    return fd_out.getvalue()
+
+
+def _split_files_events(
+    parse_events, other_entries: List[Tuple[str, Any]]
+) -> Iterator[Tuple[str, str, Any]]:
+    """
+    Yields the parser events of the top level 'files' entry, and the events
+    around it, so it can be consumed by ijson.kvitems(..., 'files').
+    Other top level entries are built and appended to other_entries as they are parsed.
+    """
+    current_key = None
+    builder = None
+    for prefix, event, value in parse_events:
+        if prefix == "":
+            if event == "map_key":
+                current_key = value
+                if current_key != "files":
+                    builder = ijson.ObjectBuilder()
+                    continue
+            elif event == "start_map":
+                pass
+            elif event == "end_map":
+                current_key = None
+            else:
+                raise ValueError("Report to compress is not a JSON object")
+        elif current_key != "files":
+            builder.event(event, value)
+            if prefix == current_key and event not in (
+                "start_map",
+                "start_array",
+                "map_key",
+            ):
+                # The value of this entry is complete
+                other_entries.append((current_key, builder.value))
+            continue
+        yield prefix, event, value
@@ -1,15 +1,55 @@
+import hashlib
+import json
 import logging
+import math
 import os
 import pathlib
+import re
 import shutil
 import subprocess
+import tempfile
 import typing
 
+from codecov_cli.helpers.concurrency import run_in_threads
 from codecov_cli.helpers.folder_searcher import globs_to_regex, search_files
+from codecov_cli.helpers.json_cache import load_json_cache
+from codecov_cli.plugins.gcov_json import MergedGcovReport, add_gcov_json_output
 from codecov_cli.plugins.types import PreparationPluginReturn
 
 logger = logging.getLogger("codecovcli")
 
+gcov_source_header_regex = re.compile(rb"^\s*-:\s*0:Source:(?P<source>.+?)\r?$")
+gcov_graph_header_regex = re.compile(rb"^\s*-:\s*0:Graph:(?P<graph>.+?)\r?$")
+
+
+GCOV_MANIFEST_VERSION = 1
+LCOV_OUTPUT_FILENAME = "coverage.gcov.lcov"
+
+
+def _get_gcov_fingerprint(gcno_path: pathlib.Path) -> typing.List:
+    """
+    Identifies the coverage data of an object: the .gcno is only rewritten when the
+    object is rebuilt, so its mtime and size are enough. The .gcda counters change
+    whenever tests run, and are small, so they are hashed.
+    """
+    gcno_stat = gcno_path.stat()
+    gcda_path = gcno_path.with_suffix(".gcda")
+    gcda_hash = None
+    if gcda_path.exists():
+        gcda_hash = hashlib.sha256(gcda_path.read_bytes()).hexdigest()
+    return [gcno_stat.st_mtime_ns, gcno_stat.st_size, gcda_hash]
+
+
+def _get_object_key(path: str, project_root: pathlib.Path) -> str:
+    """Identifies an object by its path without extension, as gcov names its .gcno in the 'Graph' header"""
+    return os.path.normpath(os.path.join(project_root, os.path.splitext(path)[0]))
+
+
+def _mangle_path(source: bytes) -> str:
+    """Names the .gcov file of a source the same way 'gcov -p' does"""
+    parts = source.decode(errors="replace").split("/")
+    return "#".join("^" if part == ".." else part for part in parts)
+
 
 class GcovPlugin(object):
     def __init__(
@@ -19,12 +59,26 @@ class GcovPlugin(object):
         patterns_to_ignore: typing.Optional[typing.List[str]] = None,
         folders_to_ignore: typing.Optional[typing.List[str]] = None,
         extra_arguments: typing.Optional[typing.List[str]] = None,
+        batch_size: int = 500,
+        max_workers: typing.Optional[int] = None,
+        manifest_file: typing.Optional[str] = None,
+        output_format: str = "gcov",
     ):
         self.project_root = project_root or pathlib.Path(os.getcwd())
         self.patterns_to_include = patterns_to_include or []
         self.patterns_to_ignore = patterns_to_ignore or []
         self.folders_to_ignore = folders_to_ignore or []
         self.extra_arguments = extra_arguments or []
+        # Bounds the argv length of each gcov call
+        self.batch_size = batch_size
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # If set, only objects with changed .gcno/.gcda since the last run are processed
+        self.manifest_file = (
+            self.project_root / manifest_file if manifest_file is not None else None
+        )
+        # 'gcov' writes .gcov text files, 'lcov' merges gcov's JSON output into
+        # a single lcov report (needs gcov from GCC 9+)
+        self.output_format = output_format
 
     def run_preparation(self, collector) -> PreparationPluginReturn:
         logger.debug(
@@ -56,9 +110,258 @@ class GcovPlugin(object):
         for path in matched_paths:
             logger.warning(path)
 
-        s = subprocess.run(
-            ["gcov", "-pb", *self.extra_arguments, *matched_paths],
+        if self.output_format == "lcov":
+            if self.manifest_file is not None:
+                logger.warning(
+                    "The gcov manifest is ignored when merging into a lcov report"
+                )
+            return self._run_lcov(matched_paths)
+        if self.manifest_file is not None:
+            return self._run_incremental(matched_paths)
+
+        batches = self._split_in_batches(matched_paths)
+        if len(batches) == 1:
+            s = subprocess.run(
+                ["gcov", "-pb", *self.extra_arguments, *matched_paths],
+                cwd=self.project_root,
+                capture_output=True,
+            )
+            return PreparationPluginReturn(success=True, messages=[s.stdout])
+
+        logger.info(
+            f"Running gcov in {len(batches)} batches",
+            extra=dict(extra_log_attributes=dict(max_workers=self.max_workers)),
+        )
+        batch_outputs = run_in_threads(self._run_gcov_batch, batches, self.max_workers)
+        self._merge_batch_outputs([output_dir for _, output_dir, _ in batch_outputs])
+        return PreparationPluginReturn(
+            success=True, messages=[message for message, _, _ in batch_outputs]
+        )
+
+    def _split_in_batches(
+        self, matched_paths: typing.List[str]
+    ) -> typing.List[typing.List[str]]:
+        # Small projects are still split across workers, up to batch_size files each
+        batch_size = min(
+            self.batch_size, math.ceil(len(matched_paths) / self.max_workers)
+        )
+        return [
+            matched_paths[idx : idx + batch_size]
+            for idx in range(0, len(matched_paths), batch_size)
+        ]
+
+    def _run_gcov_batch(
+        self, paths: typing.List[str]
+    ) -> typing.Tuple[bytes, pathlib.Path, typing.Dict[str, str]]:
+        """
+        Runs gcov on a batch of files, writing its .gcov files in a directory of its own,
+        so batches running at the same time don't overwrite each other's files.
+
+        gcov has no option for the output directory, and it has to run in the project root
+        to find the sources, so the annotated sources are read from its stdout (-t),
+        and split into one .gcov file per source.
+
+        Also returns the .gcno ('Graph' header) each .gcov file was created from.
+        """
+        output_dir = pathlib.Path(tempfile.mkdtemp(prefix="codecov-gcov-"))
+        files_created = 0
+        gcov_file = None
+        graphs = {}
+        with subprocess.Popen(
+            ["gcov", "-pbt", *self.extra_arguments, *paths],
             cwd=self.project_root,
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        ) as process:
+            for line in process.stdout:
+                match = gcov_source_header_regex.match(line)
+                if match:
+                    if gcov_file is not None:
+                        gcov_file.close()
+                    gcov_file = open(
+                        output_dir
+                        / f"{_mangle_path(match.group('source'))}.{files_created}.gcov",
+                        "wb",
+                    )
+                    files_created += 1
+                if gcov_file is not None:
+                    gcov_file.write(line)
+                    match = gcov_graph_header_regex.match(line)
+                    if match:
+                        graphs[pathlib.Path(gcov_file.name).name] = match.group(
+                            "graph"
+                        ).decode(errors="replace")
+        if gcov_file is not None:
+            gcov_file.close()
+        if process.returncode != 0:
+            logger.warning(
+                "gcov failed for a batch of files",
+                extra=dict(
+                    extra_log_attributes=dict(
+                        returncode=process.returncode, files=paths
+                    )
+                ),
+            )
+        message = f"Created {files_created} .gcov files from {len(paths)} files"
+        return message.encode(), output_dir, graphs
+
+    def _merge_batch_outputs(
+        self,
+        output_dirs: typing.List[pathlib.Path],
+        written_files: typing.Optional[typing.Set[str]] = None,
+    ) -> typing.List[typing.Dict[str, str]]:
+        """
+        Moves the .gcov files of every batch to the project root.
+        A source (usually a header) covered in more than one batch has a .gcov file
+        per batch. Those are kept side by side, and merged by Codecov when processed,
+        as each .gcov file has the source path in its header.
+        Files in written_files are not overwritten.
+
+        Returns the name in the project root of each .gcov file of each batch.
+        """
+        written_files = set(written_files or [])
+        batch_files = []
+        for output_dir in output_dirs:
+            batch_files.append({})
+            for gcov_file in sorted(output_dir.glob("*.gcov")):
+                # Removes the index used to keep names unique within the batch
+                source_name = gcov_file.name.rsplit(".", 2)[0]
+                name = f"{source_name}.gcov"
+                copy_idx = 1
+                while name in written_files:
+                    name = f"{source_name}.{copy_idx}.gcov"
+                    copy_idx += 1
+                written_files.add(name)
+                batch_files[-1][gcov_file.name] = name
+                shutil.move(str(gcov_file), str(self.project_root / name))
+            shutil.rmtree(output_dir, ignore_errors=True)
+        return batch_files
+
+    def _run_incremental(
+        self, matched_paths: typing.List[str]
+    ) -> PreparationPluginReturn:
+        """
+        Runs gcov only for the objects whose .gcno or .gcda changed since the last run.
+        The manifest keeps the fingerprint of each object and the .gcov files created for it,
+        so the outputs of unchanged objects are kept and the stale ones are removed.
+
+        Changed objects run in batches. Each .gcov file is attributed to the object
+        named in its 'Graph' header.
+        """
+        manifest = (
+            load_json_cache(
+                self.manifest_file,
+                GCOV_MANIFEST_VERSION,
+                "objects",
+                description="gcov manifest",
+            )
+            or {}
         )
-        return PreparationPluginReturn(success=True, messages=[s.stdout])
+        new_manifest = {}
+        changed_paths = []
+        for path in matched_paths:
+            fingerprint = _get_gcov_fingerprint(pathlib.Path(path))
+            entry = manifest.pop(path, None)
+            if (
+                entry is not None
+                and entry["fingerprint"] == fingerprint
+                and all(
+                    (self.project_root / name).exists() for name in entry["outputs"]
+                )
+            ):
+                new_manifest[path] = entry
+                continue
+            if entry is not None:
+                # Still in the manifest are the objects that changed or disappeared
+                manifest[path] = entry
+            changed_paths.append(path)
+            new_manifest[path] = dict(fingerprint=fingerprint, outputs=[])
+
+        for entry in manifest.values():
+            for name in entry["outputs"]:
+                (self.project_root / name).unlink(missing_ok=True)
+        logger.info(
+            f"Running gcov on {len(changed_paths)} out of {len(matched_paths)} files that changed since the last run"
+        )
+
+        messages = []
+        if changed_paths:
+            batches = self._split_in_batches(changed_paths)
+            batch_outputs = run_in_threads(
+                self._run_gcov_batch, batches, self.max_workers
+            )
+            unchanged_outputs = set(
+                name for entry in new_manifest.values() for name in entry["outputs"]
+            )
+            batch_files = self._merge_batch_outputs(
+                [output_dir for _, output_dir, _ in batch_outputs], unchanged_outputs
+            )
+            objects_by_key = {
+                _get_object_key(path, self.project_root): path for path in changed_paths
+            }
+            for batch, (_, _, graphs), files in zip(
+                batches, batch_outputs, batch_files
+            ):
+                for batch_file, name in files.items():
+                    graph = graphs.get(batch_file)
+                    path = graph and objects_by_key.get(
+                        _get_object_key(graph, self.project_root)
+                    )
+                    # Outputs of an unknown object (e.g. gcov ran with -o) are
+                    # removed when any object of their batch changes
+                    for owner in [path] if path else batch:
+                        new_manifest[owner]["outputs"].append(name)
+            messages = [message for message, _, _ in batch_outputs]
+
+        try:
+            with open(self.manifest_file, "w") as f:
+                json.dump(
+                    {"version": GCOV_MANIFEST_VERSION, "objects": new_manifest}, f
+                )
+        except OSError as exp:
+            # The .gcov files are there, the next run just processes every object
+            logger.warning(
+                f"Unable to save gcov manifest to {self.manifest_file}",
+                extra=dict(extra_log_attributes=dict(error=str(exp))),
+            )
+        return PreparationPluginReturn(success=True, messages=messages)
+
+    def _run_lcov(self, matched_paths: typing.List[str]) -> PreparationPluginReturn:
+        """
+        Runs gcov with JSON output on batches of files, and merges the results
+        of all objects into a single lcov report in the project root.
+        """
+        batches = self._split_in_batches(matched_paths)
+        batch_reports = run_in_threads(
+            self._run_gcov_json_batch, batches, self.max_workers
+        )
+        report = MergedGcovReport()
+        for batch_report in batch_reports:
+            report.merge(batch_report)
+        output_file = self.project_root / LCOV_OUTPUT_FILENAME
+        with open(output_file, "w") as fd_out:
+            sources_written = report.write_lcov(fd_out)
+        message = f"Wrote {sources_written} sources from {len(matched_paths)} files to {output_file}"
+        logger.info(message)
+        return PreparationPluginReturn(success=True, messages=[message.encode()])
+
+    def _run_gcov_json_batch(self, paths: typing.List[str]) -> MergedGcovReport:
+        report = MergedGcovReport()
+        with subprocess.Popen(
+            ["gcov", "-b", "--json-format", "--stdout", *self.extra_arguments, *paths],
+            cwd=self.project_root,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        ) as process:
+            # One JSON document per object, merged as it's read
+            add_gcov_json_output(report, process.stdout, self.project_root.resolve())
+        if process.returncode != 0:
+            logger.warning(
+                "gcov failed for a batch of files",
+                extra=dict(
+                    extra_log_attributes=dict(
+                        returncode=process.returncode, files=paths
+                    )
+                ),
+            )
+        return report
@@ -0,0 +1,126 @@
+import json
+import os
+import pathlib
+import typing
+
+
+class MergedGcovReport(object):
+    """
+    Merges the output of `gcov --json-format` for many objects into one report per source.
+    Sources compiled into several objects (e.g. headers) have their counts added up.
+    """
+
+    def __init__(self):
+        # path -> line number -> count
+        self.lines: typing.Dict[str, typing.Dict[int, int]] = {}
+        # path -> line number -> branch index -> count
+        self.branches: typing.Dict[str, typing.Dict[int, typing.Dict[int, int]]] = {}
+        # path -> function name -> [start line, count]
+        self.functions: typing.Dict[str, typing.Dict[str, typing.List[int]]] = {}
+
+    def add_object(
+        self, gcov_json: dict, relative_to: typing.Optional[pathlib.Path] = None
+    ) -> None:
+        """Adds the result of gcov for one object (one line of `gcov --json-format --stdout`)"""
+        cwd = gcov_json.get("current_working_directory", "")
+        for file_data in gcov_json.get("files", []):
+            path = _resolve_path(file_data["file"], cwd, relative_to)
+            file_lines = self.lines.setdefault(path, {})
+            file_branches = self.branches.setdefault(path, {})
+            for line in file_data.get("lines", []):
+                line_number = line["line_number"]
+                file_lines[line_number] = file_lines.get(line_number, 0) + line["count"]
+                if line.get("branches"):
+                    line_branches = file_branches.setdefault(line_number, {})
+                    for idx, branch in enumerate(line["branches"]):
+                        line_branches[idx] = line_branches.get(idx, 0) + branch["count"]
+            file_functions = self.functions.setdefault(path, {})
+            for function in file_data.get("functions", []):
+                name = function["name"]
+                if name in file_functions:
+                    file_functions[name][1] += function["execution_count"]
+                else:
+                    file_functions[name] = [
+                        function["start_line"],
+                        function["execution_count"],
+                    ]
+
+    def merge(self, other: "MergedGcovReport") -> None:
+        for path, other_lines in other.lines.items():
+            file_lines = self.lines.setdefault(path, {})
+            for line_number, count in other_lines.items():
+                file_lines[line_number] = file_lines.get(line_number, 0) + count
+        for path, other_branches in other.branches.items():
+            file_branches = self.branches.setdefault(path, {})
+            for line_number, other_line_branches in other_branches.items():
+                line_branches = file_branches.setdefault(line_number, {})
+                for idx, count in other_line_branches.items():
+                    line_branches[idx] = line_branches.get(idx, 0) + count
+        for path, other_functions in other.functions.items():
+            file_functions = self.functions.setdefault(path, {})
+            for name, (start_line, count) in other_functions.items():
+                if name in file_functions:
+                    file_functions[name][1] += count
+                else:
+                    file_functions[name] = [start_line, count]
+
+    def write_lcov(self, fd_out) -> int:
+        """Writes the report in lcov format. Returns the number of sources written."""
+        for path in sorted(self.lines):
+            lines = self.lines[path]
+            branches = self.branches.get(path, {})
+            functions = self.functions.get(path, {})
+            fd_out.write(f"SF:{path}\n")
+            for name, (start_line, _) in sorted(
+                functions.items(), key=lambda item: item[1][0]
+            ):
+                fd_out.write(f"FN:{start_line},{name}\n")
+            for name, (_, count) in functions.items():
+                fd_out.write(f"FNDA:{count},{name}\n")
+            fd_out.write(f"FNF:{len(functions)}\n")
+            fd_out.write(f"FNH:{sum(1 for _, count in functions.values() if count)}\n")
+            branches_found = branches_hit = 0
+            for line_number in sorted(branches):
+                for idx, count in sorted(branches[line_number].items()):
+                    # '-' means the line with the branch was never executed
+                    taken = count if lines.get(line_number) else "-"
+                    fd_out.write(f"BRDA:{line_number},0,{idx},{taken}\n")
+                    branches_found += 1
+                    branches_hit += 1 if count else 0
+            fd_out.write(f"BRF:{branches_found}\nBRH:{branches_hit}\n")
+            for line_number in sorted(lines):
+                fd_out.write(f"DA:{line_number},{lines[line_number]}\n")
+            fd_out.write(f"LF:{len(lines)}\n")
+            fd_out.write(f"LH:{sum(1 for count in lines.values() if count)}\n")
+            fd_out.write("end_of_record\n")
+        return len(self.lines)
+
+
+def add_gcov_json_output(
+    report: MergedGcovReport,
+    gcov_stdout: typing.Iterable[bytes],
+    relative_to: typing.Optional[pathlib.Path] = None,
+) -> int:
+    """
+    Adds the objects in the output of `gcov --json-format --stdout` to the report,
+    one object (line) at a time. Returns the number of objects added.
+    """
+    objects_added = 0
+    for line in gcov_stdout:
+        if not line.strip():
+            continue
+        report.add_object(json.loads(line), relative_to)
+        objects_added += 1
+    return objects_added
+
+
+def _resolve_path(
+    path: str, cwd: str, relative_to: typing.Optional[pathlib.Path]
+) -> str:
+    # Sources are relative to the directory the object was compiled in
+    full_path = os.path.normpath(os.path.join(cwd, path))
+    if relative_to is not None and os.path.isabs(full_path):
+        relative_path = os.path.relpath(full_path, relative_to)
+        if not relative_path.startswith(".."):
+            return pathlib.PurePath(relative_path).as_posix()
+    return pathlib.PurePath(full_path).as_posix()
@@ -1,12 +1,22 @@
+import importlib.util
 import logging
 import os
 import pathlib
 import shutil
+import sqlite3
 import subprocess
 import typing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from glob import iglob
 
+from codecov_cli.helpers.concurrency import run_in_threads
 from codecov_cli.helpers.folder_searcher import globs_to_regex, search_files
+from codecov_cli.plugins.pycoverage_sqlite import (
+    combine_coverage_data_files,
+    load_source_analysis,
+    write_codecov_report_from_coverage_data,
+)
 from codecov_cli.plugins.types import PreparationPluginReturn
 
 coverage_files_regex = globs_to_regex([".coverage", ".coverage.*"])
@@ -27,7 +37,10 @@ class PycoverageConfig(dict):
         """
         Report type to generate.
         Overrided if include_contexts == True
-        report_type: str [values xml|json; default xml]
+        'codecov' reads the .coverage data directly, without running coverage.py reports.
+        It needs coverage.py to be importable by the CLI, to find the missing lines in the source code.
+        Otherwise a JSON report is generated instead.
+        report_type: str [values xml|json|codecov; default xml]
         """
         return self.get("report_type", "xml")
 
@@ -48,6 +61,25 @@ class PycoverageConfig(dict):
         """
         return self.get("include_contexts", True)
 
+    @property
+    def parallel_combine(self) -> bool:
+        """
+        Combines .coverage.* shards in parallel, merging them pairwise across processes,
+        instead of running `coverage combine -a`. Also used if coverage.py can't be found.
+        [paths] remapping from the coverage.py config is not applied.
+        parallel_combine: bool [default False]
+        """
+        return self.get("parallel_combine", False)
+
+    @property
+    def max_workers(self) -> typing.Optional[int]:
+        """
+        How many coverage data folders have reports generated at the same time,
+        when the project has more than one (e.g. one .coverage per package).
+        max_workers: int [default min(32, os.cpu_count() + 4)]
+        """
+        return self.get("max_workers", None)
+
 
 class Pycoverage(object):
     def __init__(self, config: dict):
@@ -55,56 +87,128 @@ class Pycoverage(object):
 
     def run_preparation(self, collector) -> PreparationPluginReturn:
 
-        if shutil.which("coverage") is None:
+        if self.config.report_type != "codecov" and shutil.which("coverage") is None:
             logger.warning("coverage.py is not installed or can't be found.")
             return
 
-        path_to_coverage_data = self._get_path_to_coverage()
-        if path_to_coverage_data is None:
+        coverage_dirs = self._get_coverage_dirs()
+        if not coverage_dirs:
             logger.warning("No coverage data found to transform")
             return
-        coverage_dir = pathlib.Path(path_to_coverage_data).parent
+        if self.config.report_type not in ("xml", "json", "codecov"):
+            return PreparationPluginReturn(
+                success=False,
+                messages=[f"report type {self.config.report_type} unknown"],
+            )
+        if len(coverage_dirs) == 1:
+            return self._generate_report(coverage_dirs[0])
+
+        logger.info(
+            f"Generating reports for {len(coverage_dirs)} coverage data folders",
+            extra=dict(extra_log_attributes=dict(max_workers=self.config.max_workers)),
+        )
+        # Each folder combines its shards across processes.
+        # The folders generated at the same time share the cores instead of each using all of them
+        concurrent_dirs = min(
+            len(coverage_dirs),
+            self.config.max_workers or min(32, (os.cpu_count() or 1) + 4),
+        )
+        combine_max_workers = max(1, (os.cpu_count() or 1) // concurrent_dirs)
+        results = run_in_threads(
+            partial(self._generate_report, combine_max_workers=combine_max_workers),
+            coverage_dirs,
+            self.config.max_workers,
+        )
+        return PreparationPluginReturn(
+            success=all(result.success for result in results),
+            messages=[message for result in results for message in result.messages],
+        )
+
+    def _generate_report(
+        self,
+        coverage_dir: pathlib.Path,
+        combine_max_workers: typing.Optional[int] = None,
+    ) -> PreparationPluginReturn:
         if self.config.report_type == "xml":
-            return self._generate_XML_report(coverage_dir)
+            return self._generate_XML_report(coverage_dir, combine_max_workers)
         if self.config.report_type == "json":
             return self._generate_JSON_report(coverage_dir)
-        return PreparationPluginReturn(
-            success=False, messages=[f"report type {self.config.report_type} unknown"]
-        )
+        return self._generate_codecov_report(coverage_dir, combine_max_workers)
 
-    def _get_path_to_coverage(self) -> pathlib.Path:
+    def _get_coverage_dirs(self) -> typing.List[pathlib.Path]:
         if self.config.path_to_coverage_file:
             path = pathlib.Path(self.config.path_to_coverage_file)
             if path.exists():
-                return pathlib.Path(self.config.path_to_coverage_file)
+                return [path.parent]
             logger.warning(
                 f"Dir {self.config.path_to_coverage_file} doesn't exist or doesn't have .coverage file. Falling back to search"
             )
-        return next(
-            search_files(
-                self.config.project_root,
-                [],
-                filename_include_regex=coverage_files_regex,
-                filename_exclude_regex=None,
-            ),
-            None,
-        )
+        # A single walk finds the coverage data of every package.
+        # Shards are combined per folder, so each folder is reported once
+        coverage_dirs = {}
+        for path in search_files(
+            self.config.project_root,
+            [],
+            filename_include_regex=coverage_files_regex,
+            filename_exclude_regex=None,
+        ):
+            coverage_dirs.setdefault(path.parent, None)
+        return list(coverage_dirs)
 
-    def _generate_XML_report(self, dir: pathlib.Path) -> PreparationPluginReturn:
-        """Generates up-to-date XML report in the given directory"""
+    def _run_and_log_output(self, command: typing.List[str], dir: pathlib.Path) -> bool:
+        """Runs command in dir, logging its output as it's produced. Returns True if it succeeds."""
+        with subprocess.Popen(
+            command,
+            cwd=dir,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        ) as process:
+            for line in process.stdout:
+                line = line.rstrip()
+                if line:
+                    logger.info(
+                        line, extra=dict(extra_log_attributes=dict(dir=str(dir)))
+                    )
+        if process.returncode != 0:
+            logger.warning(
+                f"{' '.join(command)} failed in {dir}",
+                extra=dict(extra_log_attributes=dict(returncode=process.returncode)),
+            )
+            return False
+        return True
+
+    def _combine_coverage_data(
+        self, dir: pathlib.Path, max_workers: typing.Optional[int] = None
+    ) -> None:
         # the following if conditions avoid creating dummy .coverage file
         if next(iglob(str(dir / ".coverage.*")), None) is not None:
+            coverage_installed = shutil.which("coverage") is not None
+            if self.config.parallel_combine or not coverage_installed:
+                try:
+                    combine_coverage_data_files(dir, max_workers)
+                    return
+                except (ValueError, sqlite3.Error) as exp:
+                    logger.warning(
+                        f"Unable to combine coverage data in {dir}: {exp}",
+                    )
+                    if not coverage_installed:
+                        return
             logger.info(f"Running coverage combine -a in {dir}")
             subprocess.run(["coverage", "combine", "-a"], cwd=dir)
 
+    def _generate_XML_report(
+        self, dir: pathlib.Path, combine_max_workers: typing.Optional[int] = None
+    ) -> PreparationPluginReturn:
+        """Generates up-to-date XML report in the given directory"""
+        self._combine_coverage_data(dir, combine_max_workers)
+
         if (dir / ".coverage").exists():
             logger.info(f"Generating coverage.xml report in {dir}")
-            completed_process = subprocess.run(
-                ["coverage", "xml", "-i"], cwd=dir, capture_output=True
-            )
-
-            output = completed_process.stdout.decode().strip()
-            logger.info(output)
+            if not self._run_and_log_output(["coverage", "xml", "-i"], dir):
+                return PreparationPluginReturn(
+                    success=False, messages=[f"coverage xml failed in {dir}."]
+                )
         return PreparationPluginReturn(success=True, messages=[])
 
     def _generate_JSON_report(self, dir: pathlib.Path):
@@ -120,12 +224,73 @@ class Pycoverage(object):
             command = ["coverage", "json"]
             if self.config.include_contexts:
                 command.append("--show-contexts")
-            completed_process = subprocess.run(command, cwd=dir, capture_output=True)
-
-            output = completed_process.stdout.decode().strip()
-            logger.info(output)
+            if not self._run_and_log_output(command, dir):
+                return PreparationPluginReturn(
+                    success=False, messages=[f"coverage json failed in {dir}."]
+                )
             return PreparationPluginReturn(success=True, messages=[])
         logger.warning(f".coverage file not found at {dir}. Parsing failed")
         return PreparationPluginReturn(
             success=False, messages=[f".coverage file not found at {dir}."]
         )
+
+    def _generate_codecov_report(
+        self, dir: pathlib.Path, combine_max_workers: typing.Optional[int] = None
+    ) -> PreparationPluginReturn:
+        """Generates the compact codecov report from the .coverage data in the given directory"""
+        if importlib.util.find_spec("coverage") is None:
+            if shutil.which("coverage") is None:
+                logger.warning("coverage.py is not installed or can't be found.")
+                return PreparationPluginReturn(
+                    success=False, messages=["coverage.py can't be found."]
+                )
+            logger.info(
+                "coverage.py can't be imported by the CLI, generating a JSON report instead"
+            )
+            return self._generate_JSON_report(dir)
+
+        self._combine_coverage_data(dir, combine_max_workers)
+
+        if not (dir / ".coverage").exists():
+            logger.warning(f".coverage file not found at {dir}. Parsing failed")
+            return PreparationPluginReturn(
+                success=False, messages=[f".coverage file not found at {dir}."]
+            )
+        output_file = dir.resolve() / "coverage.codecov.json"
+        logger.info(
+            f"Generating codecov report in {dir}",
+            extra=dict(
+                extra_log_attributes=dict(include_contexts=self.config.include_contexts)
+            ),
+        )
+        # The report runs in its own process, in dir, so coverage.py reads the config
+        # and resolves relative paths from dir, same as the `coverage` command
+        with ProcessPoolExecutor(
+            max_workers=1, initializer=os.chdir, initargs=(str(dir),)
+        ) as executor:
+            future = executor.submit(
+                _write_codecov_report, output_file, self.config.include_contexts
+            )
+            try:
+                files_written = future.result()
+            except (sqlite3.DatabaseError, ValueError) as exp:
+                output_file.unlink(missing_ok=True)
+                logger.warning(f"Unable to read coverage data at {dir}: {exp}")
+                return PreparationPluginReturn(
+                    success=False, messages=[f"Unable to read coverage data at {dir}."]
+                )
+        logger.info(f"Wrote codecov report with {files_written} files to {output_file}")
+        return PreparationPluginReturn(success=True, messages=[])
+
+
+def _write_codecov_report(output_file: pathlib.Path, include_contexts: bool) -> int:
+    """Writes the codecov report of the .coverage data in the current directory"""
+    data_file = pathlib.Path(".coverage").resolve()
+    with open(output_file, "w") as fd_out:
+        return write_codecov_report_from_coverage_data(
+            data_file,
+            fd_out,
+            load_source_analysis(data_file),
+            include_contexts=include_contexts,
+            relative_to=data_file.parent,
+        )
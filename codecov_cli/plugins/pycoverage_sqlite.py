@@ -0,0 +1,333 @@
+import itertools
+import json
+import logging
+import os
+import pathlib
+import sqlite3
+import typing
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger("codecovcli")
+
+
+def numbits_to_lines(numbits: bytes) -> typing.List[int]:
+    """
+    Converts a coverage.py numbits blob into the list of line numbers it represents.
+    Bit N of byte M is set if line M * 8 + N was executed.
+    """
+    lines = []
+    for byte_idx, byte in enumerate(numbits):
+        for bit in range(8):
+            if byte & (1 << bit):
+                lines.append(byte_idx * 8 + bit)
+    return lines
+
+
+def numbits_union(numbits1: bytes, numbits2: bytes) -> bytes:
+    """Returns the numbits with the lines of both numbits set."""
+    byte_pairs = itertools.zip_longest(numbits1 or b"", numbits2 or b"", fillvalue=0)
+    return bytes(byte1 | byte2 for byte1, byte2 in byte_pairs)
+
+
+def _relative_path(path: str, relative_to: typing.Optional[pathlib.Path]) -> str:
+    if relative_to is None:
+        return path
+    try:
+        return pathlib.Path(path).relative_to(relative_to).as_posix()
+    except ValueError:
+        # Same as coverage.py, paths outside of the folder stay absolute
+        return path
+
+
+def _iter_file_contexts(
+    connection: sqlite3.Connection, has_arcs: bool
+) -> typing.Iterator[
+    typing.Tuple[str, typing.Iterator[typing.Tuple[str, typing.Set[int]]]]
+]:
+    """
+    Yields (path, [(context, lines)]) for every file in the coverage data, one file at a time.
+    """
+    if has_arcs:
+        rows = connection.execute(
+            "SELECT file.path, context.context, arc.fromno, arc.tono FROM arc "
+            "JOIN file ON file.id = arc.file_id "
+            "JOIN context ON context.id = arc.context_id "
+            "ORDER BY file.path, context.context"
+        )
+        for path, file_rows in itertools.groupby(rows, key=lambda row: row[0]):
+            yield path, (
+                (
+                    context,
+                    set(
+                        line
+                        for _, _, fromno, tono in context_rows
+                        for line in (fromno, tono)
+                        if line > 0
+                    ),
+                )
+                for context, context_rows in itertools.groupby(
+                    file_rows, key=lambda row: row[1]
+                )
+            )
+    else:
+        rows = connection.execute(
+            "SELECT file.path, context.context, line_bits.numbits FROM line_bits "
+            "JOIN file ON file.id = line_bits.file_id "
+            "JOIN context ON context.id = line_bits.context_id "
+            "ORDER BY file.path"
+        )
+        for path, file_rows in itertools.groupby(rows, key=lambda row: row[0]):
+            yield path, (
+                (context, set(numbits_to_lines(numbits)))
+                for _, context, numbits in file_rows
+            )
+
+
+# Executable statements, excluded lines and missing lines of a source file
+FileAnalysis = typing.Tuple[typing.List[int], typing.List[int], typing.List[int]]
+
+
+def load_source_analysis(
+    data_file: pathlib.Path,
+) -> typing.Callable[[str], typing.Optional[FileAnalysis]]:
+    """
+    Returns a function that analyses the source of a measured file with coverage.py,
+    same as its reports do (exclusions from the coverage.py config included).
+    Needs coverage.py to be importable. Paths and the coverage.py config are relative
+    to the current directory, as they are for the `coverage` command.
+    Raises ValueError if the data or a source file can't be read.
+    """
+    import coverage
+    from coverage.misc import ConfigError
+
+    try:
+        # Reads the coverage.py config, ConfigError is not a CoverageException
+        cov = coverage.Coverage(data_file=str(data_file))
+        cov.load()
+    except (coverage.CoverageException, ConfigError) as exp:
+        raise ValueError(str(exp)) from exp
+
+    def analyse_file(path: str) -> typing.Optional[FileAnalysis]:
+        try:
+            _, statements, excluded, missing, _ = cov.analysis2(path)
+        except coverage.CoverageException as exp:
+            # e.g. the source file is not found
+            if not cov.get_option("report:ignore_errors"):
+                raise ValueError(str(exp)) from exp
+            logger.warning(
+                f"Unable to analyse {path}. Ignoring it.",
+                extra=dict(extra_log_attributes=dict(error=str(exp))),
+            )
+            return None
+        return statements, excluded, missing
+
+    return analyse_file
+
+
+def write_codecov_report_from_coverage_data(
+    data_file: pathlib.Path,
+    fd_out,
+    analyse_file: typing.Callable[[str], typing.Optional[FileAnalysis]],
+    include_contexts: bool = True,
+    relative_to: typing.Optional[pathlib.Path] = None,
+) -> int:
+    """
+    Writes a compact report straight from the .coverage SQLite database,
+    without going through coverage.py's XML/JSON reports.
+    The output has the same structure as the CompressPycoverageContexts output
+    (labels replaced by indexes in a 'labels_table').
+
+    Executable, missing and excluded lines come from analyse_file (see load_source_analysis).
+    Files it returns None for are left out of the report.
+    Branch data is exported as the lines of the branches, without the branches themselves.
+
+    Returns the number of files written.
+    """
+    connection = sqlite3.connect(f"file:{data_file}?mode=ro", uri=True)
+    try:
+        meta = dict(connection.execute("SELECT key, value FROM meta"))
+        # Stored as "0"/"1" by coverage.py 5+
+        has_arcs = bool(json.loads(meta.get("has_arcs", "0")))
+        labels_table = {}
+        files_written = 0
+
+        fd_out.write("{")
+        report_meta = {
+            "version": meta.get("version"),
+            "timestamp": meta.get("when"),
+            "branch_coverage": False,
+            "show_contexts": include_contexts,
+        }
+        fd_out.write(f'"meta": {json.dumps(report_meta)},')
+        fd_out.write('"files": {')
+        for path, file_contexts in _iter_file_contexts(connection, has_arcs):
+            analysis = analyse_file(path)
+            if analysis is None:
+                continue
+            statements, excluded, missing = analysis
+            line_labels = {}
+            for context, lines in file_contexts:
+                if not include_contexts:
+                    continue
+                label = context.split("|")[0]  # removes '|run' from label
+                label_idx = labels_table.setdefault(label, len(labels_table))
+                for line in lines:
+                    line_labels.setdefault(line, []).append(label_idx)
+            executed_lines = sorted(set(statements) - set(missing))
+            file_report = {
+                "executed_lines": executed_lines,
+                "summary": {
+                    "covered_lines": len(executed_lines),
+                    "num_statements": len(statements),
+                    "missing_lines": len(missing),
+                    "excluded_lines": len(excluded),
+                },
+                "missing_lines": sorted(missing),
+                "excluded_lines": sorted(excluded),
+            }
+            if include_contexts:
+                file_report["contexts"] = {
+                    str(line): sorted(line_labels[line]) for line in sorted(line_labels)
+                }
+            if files_written:
+                fd_out.write(",")
+            fd_out.write(
+                f"{json.dumps(_relative_path(path, relative_to))}: {json.dumps(file_report)}"
+            )
+            files_written += 1
+        fd_out.write("}")
+        if include_contexts:
+            # Save the inverted index of labels table in the report
+            # So when we are processing the result we have int -> label
+            fd_out.write(
+                f', "labels_table": {json.dumps({ value: key for key, value in labels_table.items() })}'
+            )
+        fd_out.write("}")
+        return files_written
+    finally:
+        connection.close()
+
+
+def _read_data_info(data_file: pathlib.Path) -> typing.Tuple[int, bool, bool]:
+    """Returns (schema version, has_arcs, has_data) of a .coverage file."""
+    connection = sqlite3.connect(f"file:{data_file}?mode=ro", uri=True)
+    try:
+        (schema_version,) = connection.execute(
+            "SELECT version FROM coverage_schema"
+        ).fetchone()
+        meta = dict(connection.execute("SELECT key, value FROM meta"))
+        has_arcs = bool(json.loads(meta.get("has_arcs", "0")))
+        has_data = connection.execute("SELECT 1 FROM file LIMIT 1").fetchone()
+        return schema_version, has_arcs, has_data is not None
+    finally:
+        connection.close()
+
+
+def merge_coverage_data(target_file: pathlib.Path, source_file: pathlib.Path) -> None:
+    """
+    Merges the data in source_file into target_file.
+    Merging is idempotent (line numbits are OR'ed, arcs are a set),
+    so merging the same data twice doesn't change the result.
+    """
+    connection = sqlite3.connect(target_file)
+    connection.create_function("numbits_union", 2, numbits_union)
+    try:
+        connection.execute("ATTACH DATABASE ? AS source", (str(source_file),))
+        with connection:
+            connection.execute(
+                "INSERT OR IGNORE INTO file (path) SELECT path FROM source.file"
+            )
+            connection.execute(
+                "INSERT OR IGNORE INTO context (context) SELECT context FROM source.context"
+            )
+            # 'WHERE true' is needed by sqlite to parse the upsert after a join
+            connection.execute(
+                "INSERT INTO line_bits (file_id, context_id, numbits) "
+                "SELECT file.id, context.id, source_line_bits.numbits "
+                "FROM source.line_bits AS source_line_bits "
+                "JOIN source.file AS source_file ON source_file.id = source_line_bits.file_id "
+                "JOIN file ON file.path = source_file.path "
+                "JOIN source.context AS source_context ON source_context.id = source_line_bits.context_id "
+                "JOIN context ON context.context = source_context.context "
+                "WHERE true "
+                "ON CONFLICT (file_id, context_id) "
+                "DO UPDATE SET numbits = numbits_union(numbits, excluded.numbits)"
+            )
+            connection.execute(
+                "INSERT OR IGNORE INTO arc (file_id, context_id, fromno, tono) "
+                "SELECT file.id, context.id, source_arc.fromno, source_arc.tono "
+                "FROM source.arc AS source_arc "
+                "JOIN source.file AS source_file ON source_file.id = source_arc.file_id "
+                "JOIN file ON file.path = source_file.path "
+                "JOIN source.context AS source_context ON source_context.id = source_arc.context_id "
+                "JOIN context ON context.context = source_context.context"
+            )
+            connection.execute(
+                "INSERT OR IGNORE INTO tracer (file_id, tracer) "
+                "SELECT file.id, source_tracer.tracer "
+                "FROM source.tracer AS source_tracer "
+                "JOIN source.file AS source_file ON source_file.id = source_tracer.file_id "
+                "JOIN file ON file.path = source_file.path"
+            )
+            # has_arcs is only '1' if data was recorded with branches
+            connection.execute(
+                "INSERT OR REPLACE INTO meta (key, value) "
+                "SELECT 'has_arcs', MAX(value) FROM ("
+                "SELECT value FROM meta WHERE key = 'has_arcs' "
+                "UNION ALL SELECT value FROM source.meta WHERE key = 'has_arcs')"
+                "HAVING COUNT(*) > 0"
+            )
+        connection.execute("DETACH DATABASE source")
+    finally:
+        connection.close()
+
+
+def _merge_and_remove(files: typing.Tuple[pathlib.Path, pathlib.Path]) -> None:
+    target_file, source_file = files
+    merge_coverage_data(target_file, source_file)
+    source_file.unlink()
+
+
+def combine_coverage_data_files(
+    directory: pathlib.Path, max_workers: typing.Optional[int] = None
+) -> typing.Optional[pathlib.Path]:
+    """
+    Combines the .coverage.* shards in directory into its .coverage file,
+    keeping the data already in .coverage (same as `coverage combine -a`).
+    Shards are merged pairwise in rounds, each round in parallel across processes,
+    so N shards take log2(N) rounds instead of N sequential merges.
+    Combined shards are deleted.
+
+    [paths] remapping from the coverage.py config is not applied.
+    Raises ValueError if the shards can't be combined (different schema versions,
+    or line and branch data mixed), before any file is changed.
+
+    Returns the path to the combined .coverage file, or None if there were no shards.
+    """
+    data_file = directory / ".coverage"
+    shards = sorted(directory.glob(".coverage.*"))
+    if not shards:
+        return None
+    # The existing .coverage goes first so it's the target of every round
+    files = ([data_file] if data_file.exists() else []) + shards
+
+    data_info = [_read_data_info(file) for file in files]
+    if len(set(schema_version for schema_version, _, _ in data_info)) > 1:
+        raise ValueError("Coverage data files have different schema versions")
+    if len(set(has_arcs for _, has_arcs, has_data in data_info if has_data)) > 1:
+        raise ValueError("Can't combine line data with branch data")
+
+    logger.info(
+        f"Combining {len(files)} coverage data files in {directory}",
+        extra=dict(extra_log_attributes=dict(max_workers=max_workers)),
+    )
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        while len(files) > 1:
+            pairs = list(zip(files[0::2], files[1::2]))
+            leftover = files[len(pairs) * 2 :]
+            # Consuming the results re-raises errors from the workers
+            list(executor.map(_merge_and_remove, pairs))
+            files = [target for target, _ in pairs] + leftover
+    if files[0] != data_file:
+        os.replace(files[0], data_file)
+    return data_file
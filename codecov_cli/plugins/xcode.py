@@ -5,19 +5,25 @@ import re
 import shutil
 import subprocess
 import typing
-from fnmatch import translate
 
+from codecov_cli.helpers.concurrency import run_in_threads
 from codecov_cli.helpers.folder_searcher import globs_to_regex, search_files
 from codecov_cli.plugins.types import PreparationPluginReturn
 
 logger = logging.getLogger("codecovcli")
 
 
+# Bundles with binaries to build reports for, in the order reports are built
+bundle_types = ["app", "framework", "xctest"]
+bundles_regex = globs_to_regex([f"*.{type}" for type in bundle_types])
+
+
 class XcodePlugin(object):
     def __init__(
         self,
         derived_data_folder: typing.Optional[pathlib.Path] = None,
         app_name: typing.Optional[pathlib.Path] = None,
+        max_workers: typing.Optional[int] = None,
     ):
         self.derived_data_folder = pathlib.Path(
             derived_data_folder or "~/Library/Developer/Xcode/DerivedData"
@@ -26,6 +32,8 @@ class XcodePlugin(object):
         # this is to speed up processing and to build reports for the project being tested,
         # if empty the plugin will build reports for every xcode project it finds
         self.app_name = app_name or ""
+        # how many llvm-cov processes run at the same time
+        self.max_workers = max_workers or os.cpu_count() or 1
 
     def run_preparation(self, collector) -> PreparationPluginReturn:
         logger.debug("Running xcode plugin...")
@@ -55,39 +63,72 @@ class XcodePlugin(object):
             extra=dict(extra_log_attributes=dict(matched_paths=matched_paths)),
         )
 
+        # Profiles in the same build dir share its bundles, so it's only walked once
+        bundles_by_build_dir = {}
+        llvm_cov_jobs = {}
         for path in matched_paths:
-            self.swiftcov(path, self.app_name)
+            llvm_cov_jobs.update(
+                self._get_llvm_cov_jobs(path, self.app_name, bundles_by_build_dir)
+            )
+        self._run_llvm_cov_jobs(llvm_cov_jobs)
 
         return PreparationPluginReturn(success=True, messages="")
 
     def swiftcov(self, path, app_name: str):
+        self._run_llvm_cov_jobs(self._get_llvm_cov_jobs(path, app_name, {}))
+
+    def _find_bundles(
+        self, build_dir: pathlib.Path
+    ) -> typing.List[typing.Tuple[pathlib.Path, str]]:
+        """Finds the bundles of every type in build_dir, in a single walk"""
+        bundles = [
+            (dir_path, dir_path.suffix[1:])
+            for dir_path in search_files(
+                folder_to_search=build_dir,
+                folders_to_ignore=[],
+                filename_include_regex=bundles_regex,
+                search_for_directories=True,
+            )
+        ]
+        return sorted(bundles, key=lambda bundle: bundle_types.index(bundle[1]))
+
+    def _get_llvm_cov_jobs(
+        self,
+        path,
+        app_name: str,
+        bundles_by_build_dir: typing.Dict[pathlib.Path, list],
+    ) -> typing.Dict[str, typing.Tuple[str, str, pathlib.Path]]:
+        """
+        Returns the llvm-cov runs needed for the profile in path, keyed by output file.
+        """
         directory = os.path.dirname(path)
         build_dir = pathlib.Path(re.sub("(Build).*", "Build", directory))
-
-        for type in ["app", "framework", "xctest"]:
-            filename_include_regex = re.compile(translate(f"*.{type}"))
-            matched_dir_paths = [
-                str(path)
-                for path in search_files(
-                    folder_to_search=pathlib.Path(build_dir),
-                    folders_to_ignore=[],
-                    filename_include_regex=filename_include_regex,
-                    search_for_directories=True,
+        if build_dir not in bundles_by_build_dir:
+            bundles_by_build_dir[build_dir] = self._find_bundles(build_dir)
+
+        jobs = {}
+        for dir_path, type in bundles_by_build_dir[build_dir]:
+            # proj name without extension
+            proj = dir_path.stem
+            if app_name == "" or (app_name.lower() in proj.lower()):
+                logger.info(f"+ Building reports for {proj} {type}")
+                proj_path = pathlib.Path(dir_path / proj)
+                dest = (
+                    proj_path
+                    if proj_path.is_file()
+                    else pathlib.Path(f"{dir_path}/Contents/MacOS/{proj}")
                 )
-            ]
-            for dir_path in matched_dir_paths:
-                # proj name without extension
-                proj = pathlib.Path(dir_path).stem
-                if app_name == "" or (app_name.lower() in proj.lower()):
-                    logger.info(f"+ Building reports for {proj} {type}")
-                    proj_path = pathlib.Path(pathlib.Path(dir_path) / proj)
-                    dest = (
-                        proj_path
-                        if proj_path.is_file()
-                        else pathlib.Path(f"{dir_path}/Contents/MacOS/{proj}")
-                    )
-                    output_file_name = f"{proj}.{type}.coverage.txt".replace(" ", "")
-                    self.run_llvm_cov(output_file_name, path, dest)
+                output_file_name = f"{proj}.{type}.coverage.txt".replace(" ", "")
+                jobs[output_file_name] = (output_file_name, path, dest)
+        return jobs
+
+    def _run_llvm_cov_jobs(
+        self, jobs: typing.Dict[str, typing.Tuple[str, str, pathlib.Path]]
+    ) -> None:
+        # Jobs are keyed by output file, so no two of them write the same file
+        run_in_threads(
+            lambda job: self.run_llvm_cov(*job), jobs.values(), self.max_workers
+        )
 
     def run_llvm_cov(self, output_file_name, path, dest):
         with open(output_file_name, "w") as output_file:
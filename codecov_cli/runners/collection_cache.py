@@ -0,0 +1,203 @@
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import typing
+
+from codecov_cli.helpers.folder_searcher import globs_to_regex, search_files
+from codecov_cli.helpers.json_cache import load_json_cache
+
+logger = logging.getLogger("codecovcli")
+
+CACHE_FORMAT_VERSION = 1
+
+# Changes to these can change what is collected from every test file
+pytest_config_files = ["pytest.ini", "pyproject.toml", "tox.ini", "setup.cfg"]
+folders_to_ignore = [
+    ".git",
+    ".hg",
+    ".tox",
+    ".nox",
+    ".venv",
+    "venv",
+    "env",
+    "__pycache__",
+    "node_modules",
+    ".pytest_cache",
+    ".mypy_cache",
+]
+
+
+def _hash_file(path: pathlib.Path) -> str:
+    return hashlib.sha1(path.read_bytes()).hexdigest()
+
+
+def get_label_file(label: str) -> str:
+    """The test file a label (pytest node id) was collected from"""
+    return label.split("::")[0]
+
+
+class CollectionCache(object):
+    """
+    Stores the tests collected from each test file, keyed by the hash of the file.
+
+    The cache is only used if the collection options and the pytest configuration
+    (conftest.py files, pytest.ini, pyproject.toml, ...) didn't change since it was saved.
+    Test files that changed are collected again, the tests of the other files come
+    from the cache.
+    New test files, and changed files without tests, need a full collection:
+    only pytest knows if they are excluded by the options or the configuration.
+    """
+
+    def __init__(
+        self,
+        cache_file: pathlib.Path,
+        options: typing.List[str],
+        config_hashes: typing.Dict[str, str],
+        test_file_hashes: typing.Dict[str, str],
+        entries: typing.Optional[typing.Dict[str, dict]] = None,
+        root: typing.Optional[pathlib.Path] = None,
+    ):
+        self.cache_file = cache_file
+        self.root = root or pathlib.Path(".")
+        self.options = options
+        self.config_hashes = config_hashes
+        # Hashes of the test files in the project now
+        self.test_file_hashes = test_file_hashes
+        # path -> {"hash": ..., "labels": [...]} of the last collection
+        self.entries = entries
+
+    @classmethod
+    def load(
+        cls,
+        cache_file: pathlib.Path,
+        options: typing.List[str],
+        test_file_patterns: typing.List[str],
+        root: typing.Optional[pathlib.Path] = None,
+    ) -> "CollectionCache":
+        root = root or pathlib.Path(".")
+        config_hashes = {}
+        test_file_hashes = {}
+        test_file_regex = globs_to_regex(test_file_patterns)
+        for path in search_files(
+            root,
+            folders_to_ignore,
+            filename_include_regex=globs_to_regex(["conftest.py", *test_file_patterns]),
+        ):
+            relative_path = pathlib.PurePath(os.path.relpath(path, root)).as_posix()
+            if path.name == "conftest.py":
+                config_hashes[relative_path] = _hash_file(path)
+            if test_file_regex.match(path.name):
+                test_file_hashes[relative_path] = _hash_file(path)
+        for config_file in pytest_config_files:
+            if (root / config_file).is_file():
+                config_hashes[config_file] = _hash_file(root / config_file)
+
+        entries = load_json_cache(
+            cache_file,
+            CACHE_FORMAT_VERSION,
+            "test_files",
+            expected=dict(options=options, config_files=config_hashes),
+            description="collection cache",
+        )
+
+        if entries is not None:
+            # Test files not matching the patterns (e.g. custom python_files)
+            for path in entries:
+                if path not in test_file_hashes and (root / path).is_file():
+                    test_file_hashes[path] = _hash_file(root / path)
+        return cls(cache_file, options, config_hashes, test_file_hashes, entries, root)
+
+    def get_files_to_collect(self) -> typing.Optional[typing.List[str]]:
+        """
+        Returns the test files that need to be collected again,
+        or None if all tests need to be collected.
+        """
+        if self.entries is None:
+            return None
+        files_to_collect = []
+        for path, file_hash in self.test_file_hashes.items():
+            entry = self.entries.get(path)
+            if entry is None or (entry["hash"] != file_hash and not entry["labels"]):
+                return None
+            if entry["hash"] != file_hash:
+                files_to_collect.append(path)
+        return files_to_collect
+
+    def get_labels(self) -> typing.List[str]:
+        """Returns the cached labels of the test files that still exist"""
+        return [
+            label
+            for path, entry in self.entries.items()
+            if path in self.test_file_hashes
+            for label in entry["labels"]
+        ]
+
+    def set_labels(self, labels: typing.List[str]) -> bool:
+        """
+        Replaces the cache with the labels of a full collection.
+        Returns False if the labels can't be cached
+        (e.g. pytest's rootdir is not the current folder).
+        """
+        entries = {}
+        for label in labels:
+            path = get_label_file(label)
+            if path not in entries:
+                if path not in self.test_file_hashes:
+                    if not (self.root / path).is_file():
+                        logger.debug(
+                            "Not saving collection cache, test file not found",
+                            extra=dict(extra_log_attributes=dict(path=path)),
+                        )
+                        self.entries = None
+                        return False
+                    self.test_file_hashes[path] = _hash_file(self.root / path)
+                entries[path] = dict(hash=self.test_file_hashes[path], labels=[])
+            entries[path]["labels"].append(label)
+        for path, file_hash in self.test_file_hashes.items():
+            if path not in entries:
+                entries[path] = dict(hash=file_hash, labels=[])
+        self.entries = entries
+        return True
+
+    def update_files(self, paths: typing.List[str], labels: typing.List[str]) -> None:
+        """Updates the labels of test files that were collected again"""
+        for path in paths:
+            self.entries[path] = dict(
+                hash=self.test_file_hashes[path],
+                labels=[label for label in labels if get_label_file(label) == path],
+            )
+
+    def save(self) -> None:
+        if self.entries is None:
+            return
+        # Deleted test files are dropped
+        entries = {
+            path: entry
+            for path, entry in self.entries.items()
+            if path in self.test_file_hashes
+        }
+        try:
+            with open(self.cache_file, "w") as f:
+                json.dump(
+                    {
+                        "version": CACHE_FORMAT_VERSION,
+                        "options": self.options,
+                        "config_files": self.config_hashes,
+                        "test_files": entries,
+                    },
+                    f,
+                    separators=(",", ":"),
+                )
+        except OSError as exp:
+            # The cache only saves time, failing to write it shouldn't fail the collection
+            logger.warning(
+                f"Unable to save collection cache to {self.cache_file}",
+                extra=dict(extra_log_attributes=dict(error=str(exp))),
+            )
+            return
+        logger.debug(
+            f"Collection cache saved to {self.cache_file}",
+            extra=dict(extra_log_attributes=dict(test_files=len(entries))),
+        )
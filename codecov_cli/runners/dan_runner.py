@@ -1,5 +1,7 @@
 import json
+import os
 import subprocess
+import tempfile
 from typing import List, Optional, Union
 
 from codecov_cli.runners.types import (
@@ -7,6 +9,8 @@ from codecov_cli.runners.types import (
     LabelAnalysisRunnerInterface,
 )
 
+RESULT_DELIVERY_OPTIONS = ["argument", "stdin", "file"]
+
 
 class DoAnythingNowConfigParams(dict):
     @property
@@ -15,6 +19,7 @@ class DoAnythingNowConfigParams(dict):
         Command to run when collecting tests.
         The output of this command needs to be a list of test labels,
         one test label per line.
+        Labels are read as the command outputs them, empty lines are ignored.
         """
         return self.get("collect_tests_command", None)
 
@@ -22,10 +27,22 @@ class DoAnythingNowConfigParams(dict):
     def process_labelanalysis_result_command(self) -> Union[List[str], str]:
         """
         Command to run that handles the label analysis result.
-        The result will be passed as an argument to the command in JSON format.
+        The result is passed to the command in JSON format, as set by process_labelanalysis_result_delivery.
         """
         return self.get("process_labelanalysis_result_command", None)
 
+    @property
+    def process_labelanalysis_result_delivery(self) -> str:
+        """
+        How the label analysis result is passed to process_labelanalysis_result_command:
+        - argument: as the last argument of the command. Large results can exceed
+            the maximum length of a command line.
+        - stdin: written to the standard input of the command.
+        - file: written to a temporary file, whose path is the last argument of the command.
+        process_labelanalysis_result_delivery: str [default "argument"]
+        """
+        return self.get("process_labelanalysis_result_delivery", "argument")
+
 
 class DoAnythingNowRunner(LabelAnalysisRunnerInterface):
     def __init__(self, config_params: Optional[dict] = None) -> None:
@@ -40,25 +57,59 @@ class DoAnythingNowRunner(LabelAnalysisRunnerInterface):
             raise Exception(
                 "DAN runner missing 'collect_tests_command' configuration value"
             )
-        return list(
-            subprocess.run(command, check=True, capture_output=True)
-            .stdout.decode()
-            .splitlines()
-        )
+        labels = []
+        # stderr goes to a file, so a command writing a lot to it doesn't block
+        # while we read stdout
+        with tempfile.TemporaryFile() as stderr, subprocess.Popen(
+            command, stdout=subprocess.PIPE, stderr=stderr
+        ) as process:
+            for line in process.stdout:
+                label = line.decode().rstrip("\r\n")
+                if label:
+                    labels.append(label)
+            return_code = process.wait()
+            if return_code:
+                stderr.seek(0)
+                raise subprocess.CalledProcessError(
+                    return_code, command, stderr=stderr.read()
+                )
+        return labels
 
     def process_labelanalysis_result(self, result: LabelAnalysisRequestResult):
-        json_result = json.dumps(result)
         command = self.params.process_labelanalysis_result_command
         if command is None:
             raise Exception(
                 "DAN runner missing 'process_labelanalysis_result_command' configuration value"
             )
+        delivery = self.params.process_labelanalysis_result_delivery
+        if delivery not in RESULT_DELIVERY_OPTIONS:
+            raise Exception(
+                f"DAN runner 'process_labelanalysis_result_delivery' must be one of {RESULT_DELIVERY_OPTIONS}, got '{delivery}'"
+            )
         command_list = []
         if type(command) == list:
             command_list.extend(command)
         else:
             command_list.append(command)
-        command_list.append(json_result)
+        if delivery == "stdin":
+            return subprocess.run(
+                command_list,
+                input=json.dumps(result).encode(),
+                check=True,
+                capture_output=True,
+            ).stdout.decode()
+        if delivery == "file":
+            with tempfile.NamedTemporaryFile(
+                "w", suffix=".json", prefix="codecov_labelanalysis_", delete=False
+            ) as result_file:
+                json.dump(result, result_file)
+            try:
+                return subprocess.run(
+                    command_list + [result_file.name], check=True, capture_output=True
+                ).stdout.decode()
+            finally:
+                os.unlink(result_file.name)
+        command_list.append(json.dumps(result))
         return subprocess.run(
             command_list, check=True, capture_output=True
         ).stdout.decode()
@@ -0,0 +1,78 @@
+import contextlib
+import importlib.util
+import io
+import multiprocessing
+import sys
+import threading
+import typing
+
+
+class NodeidCollector(object):
+    """pytest plugin that keeps the node ids of the collected tests"""
+
+    def __init__(self):
+        self.nodeids: typing.List[str] = []
+
+    def pytest_collection_finish(self, session):
+        self.nodeids = [item.nodeid for item in session.items]
+
+
+def is_pytest_available() -> bool:
+    return importlib.util.find_spec("pytest") is not None
+
+
+def _run_collection(
+    options: typing.List[str],
+) -> typing.Tuple[int, typing.List[str], str]:
+    import pytest
+
+    collector = NodeidCollector()
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        exit_code = pytest.main(options, plugins=[collector])
+    return int(exit_code), collector.nodeids, output.getvalue()
+
+
+def _run_collection_in_child(options: typing.List[str], connection) -> None:
+    try:
+        connection.send(_run_collection(options))
+    except BaseException as exp:
+        connection.send((-1, [], f"{type(exp).__name__}: {exp}"))
+    finally:
+        connection.close()
+
+
+def _get_collection_context():
+    # fork is only safe on Linux: system frameworks on macOS aren't fork-safe,
+    # which is why CPython doesn't fork by default there.
+    # It's not safe either while other threads run (e.g. the initial label analysis request),
+    # as the child could inherit locks they hold (requests, ssl, logging) and never get them
+    if sys.platform.startswith("linux") and threading.active_count() == 1:
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context("spawn")
+
+
+def collect_nodeids(
+    options: typing.List[str],
+) -> typing.Tuple[int, typing.List[str], str]:
+    """
+    Collects tests with pytest.main, using the pytest installed with the CLI.
+    Returns (exit code, node ids, pytest output).
+
+    Collection runs in a child process, so the test modules imported during collection
+    don't stay in the CLI process. On Linux, if no other thread runs, the child is forked,
+    without a new interpreter to start, otherwise it's spawned.
+    """
+    context = _get_collection_context()
+    parent_connection, child_connection = context.Pipe(duplex=False)
+    process = context.Process(
+        target=_run_collection_in_child, args=(options, child_connection)
+    )
+    process.start()
+    child_connection.close()
+    try:
+        result = parent_connection.recv()
+    except EOFError:
+        result = (-1, [], f"Collection process exited with code {process.exitcode}")
+    process.join()
+    return result
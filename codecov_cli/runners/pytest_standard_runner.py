@@ -1,12 +1,27 @@
 import logging
+import os
+import pathlib
 import random
+import shutil
 import subprocess
+import tempfile
 from subprocess import CalledProcessError
 from sys import stdout
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 import click
 
+from codecov_cli.helpers.concurrency import run_in_threads
+from codecov_cli.plugins.pycoverage_sqlite import combine_coverage_data_files
+from codecov_cli.runners.collection_cache import CollectionCache, get_label_file
+from codecov_cli.runners.pytest_in_process import collect_nodeids, is_pytest_available
+from codecov_cli.runners.selected_tests_file import prepare_selected_tests_file
+from codecov_cli.runners.sharding import (
+    index_test_durations,
+    load_test_durations,
+    split_in_shards,
+    update_test_durations,
+)
 from codecov_cli.runners.types import (
     LabelAnalysisRequestResult,
     LabelAnalysisRunnerInterface,
@@ -37,6 +52,72 @@ class PytestStandardRunnerConfigParams(dict):
         """
         return self.get("coverage_root", "./")
 
+    @property
+    def collection_cache_file(self) -> Optional[str]:
+        """
+        File to cache collected tests in between runs.
+        Only test files that changed since the last run are collected again.
+        Default: None (tests are always collected)
+        """
+        return self.get("collection_cache_file", None)
+
+    @property
+    def test_file_patterns(self) -> List[str]:
+        """
+        Patterns of test files, to detect new test files when using the collection cache.
+        Should match pytest's python_files option.
+        Default: ["test_*.py", "*_test.py"]
+        """
+        return self.get("test_file_patterns", ["test_*.py", "*_test.py"])
+
+    @property
+    def collect_in_process(self) -> bool:
+        """
+        Collect tests calling pytest.main with a plugin that records the collected tests,
+        instead of running 'python -m pytest --collect-only' and parsing its output.
+        Uses the pytest installed with the CLI, so the CLI needs to be installed in the
+        same environment as the project. If pytest is not found tests are collected as usual.
+        Default: False
+        """
+        return self.get("collect_in_process", False)
+
+    @property
+    def shards(self) -> int:
+        """
+        Number of pytest processes to run the selected tests in, at the same time.
+        Tests are split so shards take about the same time, using test_durations_file.
+        Each shard writes its own coverage data, combined into .coverage (or COVERAGE_FILE) at the end.
+        Default: 1 (all tests run in a single pytest process)
+        """
+        return self.get("shards", 1)
+
+    @property
+    def test_durations_file(self) -> str:
+        """
+        JSON file with the duration in seconds of each test, keyed by test name
+        (same format as pytest-split's .test_durations). Used to balance shards.
+        Default: .test_durations
+        """
+        return self.get("test_durations_file", ".test_durations")
+
+    @property
+    def record_test_durations(self) -> bool:
+        """
+        Update test_durations_file with the durations of the tests that run,
+        from pytest's junit xml report.
+        Default: False
+        """
+        return self.get("record_test_durations", False)
+
+    @property
+    def max_tests_in_command_line(self) -> int:
+        """
+        Above this many selected tests, tests are passed to pytest in a file
+        instead of the command line, to avoid hitting the command line length limit.
+        Default: 500
+        """
+        return self.get("max_tests_in_command_line", 500)
+
 
 class PytestStandardRunner(LabelAnalysisRunnerInterface):
 
@@ -57,19 +138,26 @@ class PytestStandardRunner(LabelAnalysisRunnerInterface):
                 result += "\n" + out_stream
         return result
 
-    def _execute_pytest(self, pytest_args: List[str], capture_output: bool = True):
+    def _execute_pytest(
+        self,
+        pytest_args: List[str],
+        capture_output: bool = True,
+        env: Optional[Dict[str, str]] = None,
+    ):
         """Handles calling pytest using subprocess.run.
         Raises Exception if pytest fails
         Returns the complete pytest output
         """
         command = ["python", "-m", "pytest"] + pytest_args
+        run_kwargs = dict(
+            capture_output=capture_output,
+            check=True,
+            stdout=(stdout if not capture_output else None),
+        )
+        if env is not None:
+            run_kwargs["env"] = {**os.environ, **env}
         try:
-            result = subprocess.run(
-                command,
-                capture_output=capture_output,
-                check=True,
-                stdout=(stdout if not capture_output else None),
-            )
+            result = subprocess.run(command, **run_kwargs)
         except CalledProcessError as exp:
             message = f"Pytest exited with non-zero code {exp.returncode}."
             message += "\nThis is likely not a problem with label-analysis. Check pytest's output and options."
@@ -96,11 +184,64 @@ class PytestStandardRunner(LabelAnalysisRunnerInterface):
             ),
         )
 
-        output = self._execute_pytest(options_to_use)
+        if self.params.collection_cache_file is None:
+            return self._collect_test_names(options_to_use)
+
+        cache = CollectionCache.load(
+            pathlib.Path(self.params.collection_cache_file),
+            options_to_use,
+            self.params.test_file_patterns,
+        )
+        files_to_collect = cache.get_files_to_collect()
+        if files_to_collect:
+            logger.info(
+                f"Collecting tests from {len(files_to_collect)} test files that changed since the last run"
+            )
+            try:
+                test_names = self._collect_test_names(options_to_use + files_to_collect)
+            except click.ClickException:
+                # e.g. the tests in the file were removed (pytest exits with code 5)
+                logger.info("Collecting tests from changed files failed")
+                files_to_collect = None
+            else:
+                # Paths in the options are collected as well, only changed files are updated
+                files = set(files_to_collect)
+                cache.update_files(
+                    files_to_collect,
+                    [name for name in test_names if get_label_file(name) in files],
+                )
+        elif files_to_collect is not None:
+            logger.info("Using cached list of tests, no test files changed")
+
+        if files_to_collect is None:
+            test_names = self._collect_test_names(options_to_use)
+            cache.set_labels(test_names)
+            cache.save()
+            return test_names
+        cache.save()
+        return cache.get_labels()
+
+    def _collect_test_names(self, options: List[str]) -> List[str]:
+        if self.params.collect_in_process:
+            if is_pytest_available():
+                return self._collect_test_names_in_process(options)
+            logger.warning(
+                "pytest not found in the CLI environment. Collecting tests with 'python -m pytest'"
+            )
+        output = self._execute_pytest(options)
         lines = output.split(sep="\n")
         test_names = list(line for line in lines if ("::" in line and "test" in line))
         return test_names
 
+    def _collect_test_names_in_process(self, options: List[str]) -> List[str]:
+        exit_code, test_names, output = collect_nodeids(options)
+        if exit_code != 0:
+            message = f"Pytest exited with non-zero code {exit_code}."
+            message += "\nThis is likely not a problem with label-analysis. Check pytest's output and options."
+            message += "\nPYTEST OUTPUT:\n" + output
+            raise click.ClickException(message)
+        return test_names
+
     def process_labelanalysis_result(self, result: LabelAnalysisRequestResult):
         default_options = [
             f"--cov={self.params.coverage_root}",
@@ -135,7 +276,6 @@ class PytestStandardRunner(LabelAnalysisRunnerInterface):
         tests_to_run = [
             label.split("[")[0] if "[" in label else label for label in all_labels
         ]
-        command_array = default_options + tests_to_run
         logger.info(
             "Running tests. (run in verbose mode to get list of tests executed)"
         )
@@ -145,7 +285,115 @@ class PytestStandardRunner(LabelAnalysisRunnerInterface):
             "List of tests executed",
             extra=dict(extra_log_attributes=dict(executed_tests=tests_to_run)),
         )
-        output = self._execute_pytest(command_array, capture_output=False)
+        if self.params.shards > 1 and len(set(tests_to_run)) > 1:
+            self._execute_pytest_shards(default_options, tests_to_run)
+            output = None
+        else:
+            with tempfile.TemporaryDirectory(prefix="codecov-tests-") as tests_dir:
+                options = default_options
+                if self.params.record_test_durations:
+                    junit_file = pathlib.Path(tests_dir) / "junit.xml"
+                    options = options + [f"--junitxml={junit_file}"]
+                try:
+                    if len(tests_to_run) > self.params.max_tests_in_command_line:
+                        tests_args, env = prepare_selected_tests_file(
+                            tests_to_run, pathlib.Path(tests_dir)
+                        )
+                        output = self._execute_pytest(
+                            options + tests_args, capture_output=False, env=env
+                        )
+                    else:
+                        output = self._execute_pytest(
+                            options + tests_to_run, capture_output=False
+                        )
+                finally:
+                    # Durations of the tests that ran are recorded even if some failed
+                    self._record_test_durations(pathlib.Path(tests_dir))
         logger.info(f"Finished running {len(tests_to_run)} tests successfully")
         logger.info(f"  pytest options: \"{' '.join(default_options)}\"")
         logger.debug(output)
+
+    def _execute_pytest_shards(self, options: List[str], tests_to_run: List[str]):
+        """
+        Runs the tests in shards, each in its own pytest process, at the same time.
+        Each shard writes its coverage data to its own file, combined when all shards finish.
+        Raises Exception if pytest fails in any shard
+        """
+        # Parametrized tests selected by name run once, with all their parameters
+        tests = list(dict.fromkeys(tests_to_run))
+        durations = index_test_durations(
+            load_test_durations(pathlib.Path(self.params.test_durations_file))
+        )
+        shards = split_in_shards(tests, self.params.shards, durations)
+        logger.info(
+            f"Running tests in {len(shards)} shards",
+            extra=dict(
+                extra_log_attributes=dict(
+                    tests_per_shard=[len(shard) for shard in shards]
+                )
+            ),
+        )
+        data_dir = pathlib.Path(tempfile.mkdtemp(prefix="codecov-shards-"))
+        try:
+            return_codes = run_in_threads(
+                lambda item: self._execute_pytest_shard(
+                    item[0], options, item[1], data_dir
+                ),
+                enumerate(shards),
+                len(shards),
+            )
+            self._record_test_durations(data_dir)
+            data_file = combine_coverage_data_files(data_dir)
+            if data_file is not None:
+                shutil.move(
+                    str(data_file), os.environ.get("COVERAGE_FILE", ".coverage")
+                )
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+        failed_shards = [
+            idx for idx, return_code in enumerate(return_codes) if return_code != 0
+        ]
+        if failed_shards:
+            message = f"Pytest exited with non-zero code in shards {failed_shards}."
+            message += "\nThis is likely not a problem with label-analysis. Check pytest's output and options."
+            raise click.ClickException(message)
+
+    def _execute_pytest_shard(
+        self,
+        shard_idx: int,
+        options: List[str],
+        tests: List[str],
+        data_dir: pathlib.Path,
+    ) -> int:
+        env = {"COVERAGE_FILE": str(data_dir / f".coverage.{shard_idx}")}
+        if len(tests) > self.params.max_tests_in_command_line:
+            tests_args, tests_env = prepare_selected_tests_file(
+                tests, data_dir, f"selected_tests.{shard_idx}"
+            )
+            env.update(tests_env)
+        else:
+            tests_args = tests
+        if self.params.record_test_durations:
+            options = options + [f"--junitxml={data_dir / f'junit.{shard_idx}.xml'}"]
+        command = ["python", "-m", "pytest"] + options + tests_args
+        result = subprocess.run(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            env={**os.environ, **env},
+        )
+        # Output is printed when the shard finishes, so shards don't mix their lines
+        click.echo(f"---------- shard {shard_idx} ----------")
+        click.echo(result.stdout.decode(errors="replace"), nl=False)
+        return result.returncode
+
+    def _record_test_durations(self, junit_dir: pathlib.Path) -> None:
+        """Updates test_durations_file from the junit reports pytest wrote to junit_dir"""
+        if not self.params.record_test_durations:
+            return
+        junit_files = sorted(junit_dir.glob("junit*.xml"))
+        if junit_files:
+            update_test_durations(
+                pathlib.Path(self.params.test_durations_file), junit_files
+            )
@@ -0,0 +1,69 @@
+import os
+import pathlib
+import typing
+
+from codecov_cli.runners.collection_cache import get_label_file
+
+SELECT_TESTS_PLUGIN_NAME = "codecov_select_tests"
+SELECTED_TESTS_FILE_ENV = "CODECOV_SELECTED_TESTS_FILE"
+
+# The plugin is written next to the selected tests and loaded with '-p codecov_select_tests'.
+# It's kept as source, as the CLI can run from a bundle (e.g. PyInstaller) without .py files,
+# and it must not import anything from codecov_cli: the tests may run in an environment
+# without the CLI installed.
+SELECT_TESTS_PLUGIN_SOURCE = f'''"""
+pytest plugin that runs only the tests listed in a file, one node id per line.
+The file is given in the {SELECTED_TESTS_FILE_ENV} environment variable.
+Tests listed without parameters (e.g. 'test_a.py::test_a') run with all of them.
+"""
+import os
+
+
+def pytest_collection_modifyitems(config, items):
+    tests_file = os.environ.get("{SELECTED_TESTS_FILE_ENV}")
+    if not tests_file:
+        return
+    with open(tests_file, "r") as f:
+        selected_tests = set(line.strip() for line in f if line.strip())
+    selected_items = []
+    deselected_items = []
+    for item in items:
+        if item.nodeid in selected_tests or item.nodeid.split("[")[0] in selected_tests:
+            selected_items.append(item)
+        else:
+            deselected_items.append(item)
+    if deselected_items:
+        config.hook.pytest_deselected(items=deselected_items)
+        items[:] = selected_items
+'''
+
+
+def prepare_selected_tests_file(
+    tests: typing.List[str], directory: pathlib.Path, name: str = "selected_tests"
+) -> typing.Tuple[typing.List[str], typing.Dict[str, str]]:
+    """
+    Writes the tests to run to a file in directory, instead of passing them as arguments,
+    so a selection of any size fits in the command line.
+    Only the test files are given to pytest, and a plugin deselects the tests not in the file.
+
+    Returns the pytest arguments and the environment variables to run pytest with.
+    """
+    plugin_file = directory / f"{SELECT_TESTS_PLUGIN_NAME}.py"
+    if not plugin_file.exists():
+        # Shards running at the same time share the plugin, it's replaced atomically
+        tmp_plugin_file = directory / f"{SELECT_TESTS_PLUGIN_NAME}.{name}.tmp"
+        tmp_plugin_file.write_text(SELECT_TESTS_PLUGIN_SOURCE)
+        os.replace(tmp_plugin_file, plugin_file)
+    tests_file = directory / name
+    with open(tests_file, "w") as f:
+        f.writelines(f"{test}\n" for test in tests)
+
+    test_files = list(dict.fromkeys(get_label_file(test) for test in tests))
+    python_path = os.pathsep.join(
+        path for path in [str(directory), os.environ.get("PYTHONPATH")] if path
+    )
+    env = {
+        "PYTHONPATH": python_path,
+        SELECTED_TESTS_FILE_ENV: str(tests_file),
+    }
+    return ["-p", SELECT_TESTS_PLUGIN_NAME, *test_files], env
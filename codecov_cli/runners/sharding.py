@@ -0,0 +1,175 @@
+import heapq
+import json
+import logging
+import os
+import pathlib
+import typing
+from xml.etree import ElementTree
+
+logger = logging.getLogger("codecovcli")
+
+
+def load_test_durations(durations_file: pathlib.Path) -> typing.Dict[str, float]:
+    """
+    Loads the duration in seconds of each test, keyed by node id.
+    Same format as the .test_durations file of pytest-split.
+    """
+    if not durations_file.exists():
+        return {}
+    try:
+        with open(durations_file, "r") as f:
+            durations = json.load(f)
+        return {
+            str(test): float(duration) for test, duration in dict(durations).items()
+        }
+    except (ValueError, TypeError) as exp:
+        logger.warning(
+            f"Unable to read test durations from {durations_file}. Ignoring it.",
+            extra=dict(extra_log_attributes=dict(error=str(exp))),
+        )
+        return {}
+
+
+def save_test_durations(
+    durations_file: pathlib.Path, durations: typing.Dict[str, float]
+) -> None:
+    tmp_durations_file = durations_file.with_name(f"{durations_file.name}.tmp")
+    with open(tmp_durations_file, "w") as f:
+        json.dump(dict(sorted(durations.items())), f, indent=2)
+    os.replace(tmp_durations_file, durations_file)
+
+
+def _junit_testcase_nodeid(
+    testcase: ElementTree.Element, root: pathlib.Path
+) -> typing.Optional[str]:
+    """
+    pytest node id of a junit testcase.
+    pytest's junit classname is the dotted path of the module plus the test classes
+    (e.g. tests.test_a.TestA), the module is the longest prefix that is a file in root.
+    """
+    name = testcase.get("name")
+    classname = testcase.get("classname")
+    if not name or not classname:
+        return None
+    parts = classname.split(".")
+    for module_parts in range(len(parts), 0, -1):
+        path = "/".join(parts[:module_parts]) + ".py"
+        if (root / path).is_file():
+            return "::".join([path, *parts[module_parts:], name])
+    return None
+
+
+def read_junit_durations(
+    junit_file: pathlib.Path, root: typing.Optional[pathlib.Path] = None
+) -> typing.Dict[str, float]:
+    """
+    Durations of the tests in a junit xml report (pytest --junitxml), keyed by node id.
+    Skipped tests, and tests whose file isn't found under root, are left out.
+    """
+    root = root or pathlib.Path(".")
+    durations = {}
+    for testcase in ElementTree.parse(junit_file).iter("testcase"):
+        if testcase.find("skipped") is not None:
+            continue
+        nodeid = _junit_testcase_nodeid(testcase, root)
+        if nodeid is None:
+            continue
+        try:
+            durations[nodeid] = float(testcase.get("time", ""))
+        except ValueError:
+            continue
+    return durations
+
+
+def update_test_durations(
+    durations_file: pathlib.Path,
+    junit_files: typing.Iterable[pathlib.Path],
+    root: typing.Optional[pathlib.Path] = None,
+) -> typing.Dict[str, float]:
+    """
+    Adds the durations of the tests in junit reports to the durations file.
+    Tests in the reports replace their previous durations, other tests are kept.
+    Returns the updated durations.
+    """
+    durations = load_test_durations(durations_file)
+    updated_tests = 0
+    for junit_file in junit_files:
+        try:
+            junit_durations = read_junit_durations(junit_file, root)
+        except (OSError, ElementTree.ParseError) as exp:
+            logger.warning(
+                f"Unable to read test durations from {junit_file}. Ignoring it.",
+                extra=dict(extra_log_attributes=dict(error=str(exp))),
+            )
+            continue
+        durations.update(junit_durations)
+        updated_tests += len(junit_durations)
+    if updated_tests:
+        save_test_durations(durations_file, durations)
+    logger.debug(
+        f"Test durations updated in {durations_file}",
+        extra=dict(
+            extra_log_attributes=dict(
+                updated_tests=updated_tests, total_tests=len(durations)
+            )
+        ),
+    )
+    return durations
+
+
+def index_test_durations(durations: typing.Dict[str, float]) -> typing.Dict[str, float]:
+    """
+    Durations of tests keyed by every node id they can be selected with.
+    Parametrized tests (e.g. 'test_a[1]') are also keyed by their node id without
+    parameters ('test_a'), as those run with all of them, so their durations are added.
+    Built once, so looking up the duration of each test doesn't scan all durations.
+    """
+    params_durations = {}
+    for test, duration in durations.items():
+        params_idx = test.find("[")
+        if params_idx != -1:
+            base_test = test[:params_idx]
+            params_durations[base_test] = params_durations.get(base_test, 0) + duration
+    index = dict(durations)
+    for base_test, duration in params_durations.items():
+        index.setdefault(base_test, duration)
+    return index
+
+
+def split_in_shards(
+    tests: typing.List[str],
+    shards: int,
+    durations: typing.Dict[str, float],
+) -> typing.List[typing.List[str]]:
+    """
+    Splits tests in at most `shards` groups with about the same total duration.
+    durations is the index of the test durations (see index_test_durations).
+    Longest tests are assigned first, each to the group that finishes earliest (LPT).
+    Tests without a known duration count as the average duration.
+    Tests keep their original order within each group.
+    """
+    shards = max(1, min(shards, len(tests)))
+    known_durations = {}
+    for test in tests:
+        duration = durations.get(test)
+        if duration is not None:
+            known_durations[test] = duration
+    default_duration = (
+        sum(known_durations.values()) / len(known_durations) if known_durations else 1
+    )
+
+    # (total duration, shard index) of every shard
+    heap = [(0.0, idx) for idx in range(shards)]
+    test_shard = {}
+    by_duration = sorted(
+        enumerate(tests),
+        key=lambda item: (-known_durations.get(item[1], default_duration), item[0]),
+    )
+    for _, test in by_duration:
+        total, idx = heapq.heappop(heap)
+        test_shard[test] = idx
+        heapq.heappush(heap, (total + known_durations.get(test, default_duration), idx))
+    groups = [[] for _ in range(shards)]
+    for test in tests:
+        groups[test_shard[test]].append(test)
+    return [group for group in groups if group]
@@ -0,0 +1,133 @@
+import logging
+import pathlib
+import re
+import subprocess
+import typing
+
+import click
+
+from codecov_cli.runners.types import LabelAnalysisRequestResult
+from codecov_cli.services.labelanalysis.label_index import LabelIndex
+from codecov_cli.services.labelanalysis.label_index_file import (
+    MappedLabelIndex,
+    is_label_index_file,
+)
+
+logger = logging.getLogger("codecovcli")
+
+# git appends a TAB to paths with spaces, and quotes (C-style) paths with special characters
+diff_file_header_regex = re.compile(r'^--- (?P<path>"(?:[^"\\]|\\.)*"|[^"].*?)\t?$')
+diff_hunk_header_regex = re.compile(r"^@@ -(?P<start>\d+)(?:,(?P<count>\d+))? \+")
+git_quoted_path_regex = re.compile(r"\\(?P<escape>[0-7]{3}|.)|[^\\]+")
+git_quoted_path_escapes = {"a": 7, "b": 8, "t": 9, "n": 10, "v": 11, "f": 12, "r": 13}
+
+
+def _unquote_git_path(path: str) -> str:
+    """Decodes a path quoted by git: C-style escapes, and octal escapes for the bytes of non-ASCII characters"""
+    if not path.startswith('"'):
+        return path
+    raw_path = bytearray()
+    for match in git_quoted_path_regex.finditer(path[1:-1]):
+        escape = match.group("escape")
+        if escape is None:
+            raw_path += match.group(0).encode()
+        elif escape.isdigit():
+            raw_path.append(int(escape, 8))
+        else:
+            raw_path.append(git_quoted_path_escapes.get(escape, ord(escape)))
+    return raw_path.decode(errors="replace")
+
+
+def parse_diff_changed_lines(diff: str) -> typing.Dict[str, typing.Set[int]]:
+    """
+    Returns the lines of the base version of each file that a `git diff -U0` changes.
+    Lines added between two base lines mark both of them as changed,
+    as the code added most likely runs with the code around it.
+    """
+    changed_lines = {}
+    current_file_lines = None
+    # The '--- ' header is only looked for before the first hunk of each file,
+    # as removed lines starting with '-- ' look the same
+    in_file_header = False
+    for line in diff.splitlines():
+        if line.startswith("diff --git "):
+            current_file_lines = None
+            in_file_header = True
+            continue
+        file_match = in_file_header and diff_file_header_regex.match(line)
+        if file_match:
+            path = _unquote_git_path(file_match.group("path"))
+            # New files (--- /dev/null) aren't in the base report
+            current_file_lines = (
+                changed_lines.setdefault(path[2:], set())
+                if path.startswith("a/")
+                else None
+            )
+            continue
+        hunk_match = diff_hunk_header_regex.match(line)
+        if hunk_match:
+            in_file_header = False
+        if hunk_match and current_file_lines is not None:
+            start = int(hunk_match.group("start"))
+            count = int(hunk_match.group("count") or 1)
+            if count == 0:
+                # Lines added after line `start`
+                current_file_lines.update([start, start + 1])
+            else:
+                current_file_lines.update(range(start, start + count))
+    return changed_lines
+
+
+def get_changed_lines(
+    base_commit_sha: str, head_commit_sha: str
+) -> typing.Dict[str, typing.Set[int]]:
+    try:
+        diff = subprocess.run(
+            [
+                "git",
+                # Non-ASCII paths as they are, instead of quoted with octal escapes
+                "-c",
+                "core.quotePath=false",
+                "diff",
+                "-U0",
+                "--no-color",
+                "--no-ext-diff",
+                base_commit_sha,
+                head_commit_sha,
+            ],
+            capture_output=True,
+            check=True,
+        ).stdout.decode(errors="replace")
+    except (OSError, subprocess.CalledProcessError) as exp:
+        raise click.ClickException(
+            f"Unable to get the diff between {base_commit_sha} and {head_commit_sha}: {exp}"
+        )
+    return parse_diff_changed_lines(diff)
+
+
+def local_label_analysis(
+    report_file: pathlib.Path, base_commit_sha: str, head_commit_sha: str
+) -> LabelAnalysisRequestResult:
+    """
+    Selects the tests to run without Codecov: the labels that executed the lines changed
+    between base and head, according to the report of the base commit.
+    report_file can also be a label index written by write_label_index.
+    """
+    changed_lines = get_changed_lines(base_commit_sha, head_commit_sha)
+    if is_label_index_file(report_file):
+        with MappedLabelIndex(report_file) as label_index:
+            result = label_index.get_result(changed_lines)
+    else:
+        result = LabelIndex.from_report(report_file).get_result(changed_lines)
+    logger.info(
+        "Calculated tests to run locally",
+        extra=dict(
+            extra_log_attributes=dict(
+                report_file=str(report_file),
+                changed_files=len(changed_lines),
+                present_diff_labels=len(result.present_diff_labels),
+                global_level_labels=len(result.global_level_labels),
+            )
+        ),
+    )
+    return result
@@ -0,0 +1,131 @@
+import os
+import pathlib
+import typing
+
+import ijson
+
+from codecov_cli.helpers.encoder import decode_label_indexes
+from codecov_cli.runners.types import LabelAnalysisRequestResult
+
+# Label of lines executed outside of a test (e.g. module level code run on import)
+GLOBAL_LEVEL_LABEL = ""
+
+
+def read_report_labels(f) -> typing.Optional[typing.List[str]]:
+    """
+    Returns the labels in the labels_table of a compressed report (None if not compressed).
+    labels_table is written after the files, so this is a pass over the whole report,
+    and f is rewound for the pass over the files (the report is read twice).
+    """
+    labels_table = next(ijson.items(f, "labels_table"), None)
+    f.seek(0)
+    if labels_table is None:
+        return None
+    labels = [""] * len(labels_table)
+    for idx, label in labels_table.items():
+        labels[int(idx)] = label
+    return labels
+
+
+def iter_report_files(
+    f,
+    labels: typing.List[str],
+    root: typing.Optional[pathlib.Path] = None,
+) -> typing.Iterator[typing.Tuple[str, typing.Dict[int, typing.List[int]]]]:
+    """
+    Yields (path, line -> label indexes) for each file of the report, one file at a time.
+    The contexts of each line can be label indexes (compressed report), encoded as
+    a list or as varints (labels_encoding), or the labels themselves.
+    Labels found in the contexts are added to `labels`.
+    Absolute paths in the report are made relative to root (default: current folder).
+    """
+    root = root or pathlib.Path(".")
+    label_indexes = {label: idx for idx, label in enumerate(labels)}
+    for path, file_details in ijson.kvitems(f, "files"):
+        if os.path.isabs(path):
+            path = pathlib.PurePath(os.path.relpath(path, root)).as_posix()
+        file_lines = {}
+        for line_number, line_labels in (file_details.get("contexts") or {}).items():
+            # The encoding of the labels is known from their type, so the
+            # labels_encoding at the end of the report doesn't need a pass of its own
+            if isinstance(line_labels, str):
+                line_labels = decode_label_indexes(line_labels)
+            elif any(isinstance(label, str) for label in line_labels):
+                # Labels are in the contexts
+                line_label_indexes = []
+                for label in line_labels:
+                    label = label.split("|")[0]  # removes '|run' from label
+                    if label not in label_indexes:
+                        label_indexes[label] = len(labels)
+                        labels.append(label)
+                    line_label_indexes.append(label_indexes[label])
+                line_labels = line_label_indexes
+            file_lines[int(line_number)] = line_labels
+        yield path, file_lines
+
+
+def build_result(
+    labels: typing.List[str], diff_label_indexes: typing.Set[int]
+) -> LabelAnalysisRequestResult:
+    """
+    Result of the label analysis, in the same format Codecov returns,
+    from the indexes of the labels that executed the changed lines.
+    If a changed line ran outside of tests (e.g. on import), every label is global level,
+    as the change can affect any test.
+    """
+    global_changed = any(
+        labels[idx] == GLOBAL_LEVEL_LABEL for idx in diff_label_indexes
+    )
+    report_labels = [label for label in labels if label != GLOBAL_LEVEL_LABEL]
+    return LabelAnalysisRequestResult(
+        {
+            "present_report_labels": report_labels,
+            "absent_labels": [],
+            "present_diff_labels": sorted(
+                labels[idx]
+                for idx in diff_label_indexes
+                if labels[idx] != GLOBAL_LEVEL_LABEL
+            ),
+            "global_level_labels": report_labels if global_changed else [],
+        }
+    )
+
+
+class LabelIndex(object):
+    """
+    Inverted index of the labels (tests) that executed each line of a report:
+    file -> line -> indexes in `labels`.
+    """
+
+    def __init__(
+        self,
+        labels: typing.List[str],
+        lines: typing.Dict[str, typing.Dict[int, typing.List[int]]],
+    ):
+        self.labels = labels
+        self.lines = lines
+
+    @classmethod
+    def from_report(
+        cls, report_file: pathlib.Path, root: typing.Optional[pathlib.Path] = None
+    ) -> "LabelIndex":
+        """
+        Builds the index from a report with contexts, compressed by the
+        compress-pycoverage plugin (labels replaced by indexes in a 'labels_table')
+        or not (the labels themselves in the contexts).
+        """
+        with open(report_file, "rb") as f:
+            labels = read_report_labels(f) or []
+            lines = dict(iter_report_files(f, labels, root))
+        return cls(labels, lines)
+
+    def get_result(
+        self, changed_lines: typing.Dict[str, typing.Set[int]]
+    ) -> LabelAnalysisRequestResult:
+        """Result of the label analysis for the changed lines"""
+        diff_label_indexes = set()
+        for path, file_changed_lines in changed_lines.items():
+            file_lines = self.lines.get(path, {})
+            for line_number in file_changed_lines:
+                diff_label_indexes.update(file_lines.get(line_number, []))
+        return build_result(self.labels, diff_label_indexes)
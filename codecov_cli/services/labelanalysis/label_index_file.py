@@ -0,0 +1,244 @@
+import bisect
+import logging
+import mmap
+import os
+import pathlib
+import struct
+import typing
+
+from codecov_cli.helpers.encoder import (
+    decode_label_indexes_bytes,
+    encode_label_indexes_bytes,
+)
+from codecov_cli.runners.types import LabelAnalysisRequestResult
+from codecov_cli.services.labelanalysis.label_index import (
+    build_result,
+    iter_report_files,
+    read_report_labels,
+)
+
+logger = logging.getLogger("codecovcli")
+
+LABEL_INDEX_MAGIC = b"CCLI"
+LABEL_INDEX_VERSION = 1
+
+# All numbers are little endian.
+#
+# header:
+#   magic, version, number of labels, number of files,
+#   offsets of the file table, the paths, the label offsets and the labels
+# for each file, written while reading the report:
+#   line numbers (u32, sorted), offsets of the labels of each line in the label data (u32),
+#   label data (label indexes of each line, as delta-encoded varints)
+# file table, sorted by path, so a file is found with a binary search:
+#   offset and length of the path, offset of the file's lines, number of lines
+# paths (utf-8)
+# label offsets (u64, one more than labels), labels (utf-8)
+header_struct = struct.Struct("<4sIIIQQQ")
+file_entry_struct = struct.Struct("<QIQI")
+u32_struct = struct.Struct("<I")
+u64_struct = struct.Struct("<Q")
+
+
+def is_label_index_file(path: pathlib.Path) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(LABEL_INDEX_MAGIC)) == LABEL_INDEX_MAGIC
+
+
+def write_label_index(
+    report_file: pathlib.Path,
+    index_file: pathlib.Path,
+    root: typing.Optional[pathlib.Path] = None,
+) -> int:
+    """
+    Writes the label index of a report with contexts (see MappedLabelIndex).
+    The report is read one file at a time, so it doesn't need to fit in memory.
+    The index is written to a temporary file first, so a cached index is never half written.
+
+    Returns the number of files in the index.
+    """
+    tmp_index_file = index_file.with_name(f"{index_file.name}.tmp")
+    files = []
+    with open(report_file, "rb") as f, open(tmp_index_file, "wb") as fd_out:
+        labels = read_report_labels(f) or []
+        fd_out.write(b"\0" * header_struct.size)
+        for path, file_lines in iter_report_files(f, labels, root):
+            line_numbers = sorted(file_lines)
+            label_data = [
+                encode_label_indexes_bytes(file_lines[line_number])
+                for line_number in line_numbers
+            ]
+            files.append((path.encode(), fd_out.tell(), len(line_numbers)))
+            fd_out.write(struct.pack(f"<{len(line_numbers)}I", *line_numbers))
+            offset = 0
+            label_offsets = []
+            for line_label_data in label_data:
+                label_offsets.append(offset)
+                offset += len(line_label_data)
+            label_offsets.append(offset)
+            fd_out.write(struct.pack(f"<{len(label_offsets)}I", *label_offsets))
+            fd_out.write(b"".join(label_data))
+
+        files.sort()
+        files_table_offset = fd_out.tell()
+        path_offset = 0
+        for path, lines_offset, lines_count in files:
+            fd_out.write(
+                file_entry_struct.pack(
+                    path_offset, len(path), lines_offset, lines_count
+                )
+            )
+            path_offset += len(path)
+        paths_offset = fd_out.tell()
+        fd_out.write(b"".join(path for path, _, _ in files))
+
+        labels_offset = fd_out.tell()
+        encoded_labels = [label.encode() for label in labels]
+        offset = 0
+        for encoded_label in encoded_labels:
+            fd_out.write(u64_struct.pack(offset))
+            offset += len(encoded_label)
+        fd_out.write(u64_struct.pack(offset))
+        fd_out.write(b"".join(encoded_labels))
+
+        fd_out.seek(0)
+        fd_out.write(
+            header_struct.pack(
+                LABEL_INDEX_MAGIC,
+                LABEL_INDEX_VERSION,
+                len(labels),
+                len(files),
+                files_table_offset,
+                paths_offset,
+                labels_offset,
+            )
+        )
+    os.replace(tmp_index_file, index_file)
+    logger.info(
+        f"Label index written to {index_file}",
+        extra=dict(extra_log_attributes=dict(files=len(files), labels=len(labels))),
+    )
+    return len(files)
+
+
+class _U32Array(object):
+    """Read-only sequence of the u32 numbers at offset in buffer, for bisect"""
+
+    def __init__(self, buffer, offset: int, length: int):
+        self.buffer = buffer
+        self.offset = offset
+        self.length = length
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, idx: int) -> int:
+        return u32_struct.unpack_from(self.buffer, self.offset + idx * 4)[0]
+
+
+class MappedLabelIndex(object):
+    """
+    Label index (file -> line -> labels) read from a file written by write_label_index.
+    The file is memory mapped, so looking up the lines of a diff only reads the pages
+    of the files and lines changed, not the whole index.
+    """
+
+    def __init__(self, index_file: pathlib.Path):
+        with open(index_file, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (
+            magic,
+            version,
+            self.labels_count,
+            self.files_count,
+            self._files_table_offset,
+            self._paths_offset,
+            self._labels_offset,
+        ) = header_struct.unpack_from(self._mmap, 0)
+        if magic != LABEL_INDEX_MAGIC or version != LABEL_INDEX_VERSION:
+            self.close()
+            raise ValueError(f"{index_file} is not a label index of a known version")
+        self._labels = None
+
+    def close(self) -> None:
+        self._mmap.close()
+
+    def __enter__(self) -> "MappedLabelIndex":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    @property
+    def labels(self) -> typing.List[str]:
+        if self._labels is None:
+            offsets_end = self._labels_offset + (self.labels_count + 1) * 8
+            offsets = struct.unpack_from(
+                f"<{self.labels_count + 1}Q", self._mmap, self._labels_offset
+            )
+            self._labels = [
+                self._mmap[offsets_end + start : offsets_end + end].decode()
+                for start, end in zip(offsets, offsets[1:])
+            ]
+        return self._labels
+
+    def _get_path(self, file_idx: int) -> bytes:
+        path_offset, path_length, _, _ = file_entry_struct.unpack_from(
+            self._mmap, self._files_table_offset + file_idx * file_entry_struct.size
+        )
+        start = self._paths_offset + path_offset
+        return self._mmap[start : start + path_length]
+
+    def _find_file(self, path: str) -> typing.Optional[typing.Tuple[int, int]]:
+        """Returns the offset and number of lines of the file, if it's in the index"""
+        encoded_path = path.encode()
+        low, high = 0, self.files_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._get_path(middle) < encoded_path:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.files_count or self._get_path(low) != encoded_path:
+            return None
+        _, _, lines_offset, lines_count = file_entry_struct.unpack_from(
+            self._mmap, self._files_table_offset + low * file_entry_struct.size
+        )
+        return lines_offset, lines_count
+
+    def get_line_label_indexes(
+        self, path: str, line_numbers: typing.Iterable[int]
+    ) -> typing.Set[int]:
+        """Returns the indexes of the labels that executed any of the lines of the file"""
+        file_location = self._find_file(path)
+        if file_location is None:
+            return set()
+        lines_offset, lines_count = file_location
+        line_numbers_array = _U32Array(self._mmap, lines_offset, lines_count)
+        label_offsets_start = lines_offset + lines_count * 4
+        label_data_start = label_offsets_start + (lines_count + 1) * 4
+        label_indexes = set()
+        for line_number in line_numbers:
+            idx = bisect.bisect_left(line_numbers_array, line_number)
+            if idx == lines_count or line_numbers_array[idx] != line_number:
+                continue
+            start, end = struct.unpack_from(
+                "<2I", self._mmap, label_offsets_start + idx * 4
+            )
+            label_indexes.update(
+                decode_label_indexes_bytes(
+                    self._mmap[label_data_start + start : label_data_start + end]
+                )
+            )
+        return label_indexes
+
+    def get_result(
+        self, changed_lines: typing.Dict[str, typing.Set[int]]
+    ) -> LabelAnalysisRequestResult:
+        """Result of the label analysis for the changed lines"""
+        diff_label_indexes = set()
+        for path, file_changed_lines in changed_lines.items():
+            diff_label_indexes.update(
+                self.get_line_label_indexes(path, file_changed_lines)
+            )
+        return build_result(self.labels, diff_label_indexes)
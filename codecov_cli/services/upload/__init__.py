@@ -11,6 +11,7 @@ from codecov_cli.helpers.request import log_warnings_and_errors_if_any
 from codecov_cli.helpers.versioning_systems import VersioningSystemInterface
 from codecov_cli.plugins import select_preparation_plugins
 from codecov_cli.services.upload.coverage_file_finder import select_coverage_file_finder
+from codecov_cli.services.upload.file_fixes_cache import FileFixesCache
 from codecov_cli.services.upload.legacy_upload_sender import LegacyUploadSender
 from codecov_cli.services.upload.network_finder import select_network_finder
 from codecov_cli.services.upload.upload_collector import UploadCollector
@@ -51,6 +52,9 @@ def do_upload_logic(
     disable_search: bool = False,
     handle_no_reports_found: bool = False,
     disable_file_fixes: bool = False,
+    file_fixes_cache_file: typing.Optional[Path] = None,
+    limit_network_to_reports: bool = False,
+    network_format: str = "legacy",
 ):
     preparation_plugins = select_preparation_plugins(cli_config, plugin_names)
     coverage_file_selector = select_coverage_file_finder(
@@ -60,8 +64,18 @@ def do_upload_logic(
         disable_search,
     )
     network_finder = select_network_finder(versioning_system)
+    file_fixes_cache = None
+    if file_fixes_cache_file is not None and not disable_file_fixes:
+        file_fixes_cache = FileFixesCache.load(
+            file_fixes_cache_file, versioning_system.get_file_blob_ids()
+        )
     collector = UploadCollector(
-        preparation_plugins, network_finder, coverage_file_selector, disable_file_fixes
+        preparation_plugins,
+        network_finder,
+        coverage_file_selector,
+        disable_file_fixes,
+        file_fixes_cache,
+        limit_network_to_reports,
     )
     try:
         upload_data = collector.generate_upload_data()
@@ -87,9 +101,13 @@ def do_upload_logic(
         else:
             raise exp
     if use_legacy_uploader:
+        if network_format != "legacy":
+            logger.warning(
+                f"Network format {network_format} is not supported by the legacy uploader. Sending the network as a list of paths."
+            )
         sender = LegacyUploadSender()
     else:
-        sender = UploadSender()
+        sender = UploadSender(network_format=network_format)
     logger.debug(f"Selected uploader to use: {type(sender)}")
     ci_service = (
         ci_adapter.get_fallback_value(FallbackFieldEnum.service)
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import logging
+import pathlib
+import typing
+
+from codecov_cli.helpers.json_cache import load_json_cache
+from codecov_cli.types import UploadCollectionResultFileFixer
+
+logger = logging.getLogger("codecovcli")
+
+CACHE_FORMAT_VERSION = 1
+
+
+class FileFixesCache(object):
+    """
+    Stores file fixes keyed by the id of the file contents (e.g. git blob id),
+    so files that didn't change between runs don't need to be read again.
+
+    Only the entries used in the current run are saved back,
+    so the cache doesn't grow with files that no longer exist.
+    """
+
+    def __init__(
+        self,
+        cache_file: pathlib.Path,
+        blob_ids: typing.Dict[str, str],
+        entries: typing.Optional[typing.Dict[str, list]] = None,
+    ):
+        self.cache_file = cache_file
+        self.blob_ids = blob_ids
+        self.entries = entries or {}
+        self.used_entries = {}
+        self.hits = 0
+
+    @classmethod
+    def load(
+        cls, cache_file: pathlib.Path, blob_ids: typing.Dict[str, str]
+    ) -> "FileFixesCache":
+        entries = load_json_cache(
+            cache_file, CACHE_FORMAT_VERSION, "fixes", description="file fixes cache"
+        )
+        return cls(cache_file, blob_ids, entries)
+
+    def _get_key(self, filename: str, fix_patterns) -> typing.Optional[str]:
+        blob_id = self.blob_ids.get(filename)
+        if blob_id is None:
+            return None
+        # Results depend on the patterns too, so they are part of the key
+        patterns_id = hashlib.sha1(
+            f"{fix_patterns.regex.pattern}{fix_patterns.eof}".encode()
+        ).hexdigest()[:8]
+        return f"{blob_id}:{patterns_id}"
+
+    def get(
+        self, filename: str, fix_patterns
+    ) -> typing.Optional[UploadCollectionResultFileFixer]:
+        key = self._get_key(filename, fix_patterns)
+        if key is None or key not in self.entries:
+            return None
+        eof, fixed_lines_without_reason, fixed_lines_with_reason = self.entries[key]
+        self.used_entries[key] = self.entries[key]
+        self.hits += 1
+        return UploadCollectionResultFileFixer(
+            pathlib.Path(filename),
+            set(fixed_lines_without_reason),
+            set(tuple(line) for line in fixed_lines_with_reason),
+            eof,
+        )
+
+    def set(
+        self, filename: str, fix_patterns, file_fixer: UploadCollectionResultFileFixer
+    ) -> None:
+        key = self._get_key(filename, fix_patterns)
+        if key is None:
+            return
+        self.used_entries[key] = [
+            file_fixer.eof,
+            sorted(file_fixer.fixed_lines_without_reason),
+            sorted(file_fixer.fixed_lines_with_reason),
+        ]
+
+    def save(self) -> None:
+        try:
+            with open(self.cache_file, "w") as f:
+                json.dump(
+                    {"version": CACHE_FORMAT_VERSION, "fixes": self.used_entries},
+                    f,
+                    separators=(",", ":"),
+                )
+        except OSError as exp:
+            # The cache only saves time, failing to write it shouldn't fail the upload
+            logger.warning(
+                f"Unable to save file fixes cache to {self.cache_file}",
+                extra=dict(extra_log_attributes=dict(error=str(exp))),
+            )
+            return
+        logger.debug(
+            f"File fixes cache saved to {self.cache_file}",
+            extra=dict(
+                extra_log_attributes=dict(
+                    entries=len(self.used_entries), hits=self.hits
+                )
+            ),
+        )
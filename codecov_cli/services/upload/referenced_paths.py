@@ -0,0 +1,101 @@
+import logging
+import re
+import typing
+
+from codecov_cli.types import UploadCollectionResultFile
+
+logger = logging.getLogger("codecovcli")
+
+# Patterns that capture a source file path in the line of a coverage report.
+# Lines are scanned one by one, so reports are never fully loaded in memory.
+report_path_regexes = [
+    # lcov
+    re.compile(rb"^SF:(?P<path>.+?)\r?$"),
+    # gcov
+    re.compile(rb"^\s*-:\s*0:Source:(?P<path>.+?)\r?$"),
+    # cobertura (and coverage.py xml), clover
+    re.compile(rb"""\b(?:filename|path)=["'](?P<path>[^"']+)["']"""),
+    # go cover.out
+    re.compile(rb"^(?P<path>[^\s:]+\.go):\d+\.\d+,"),
+    # llvm-cov show (xcode), when it covers more than 1 file
+    re.compile(rb"^(?P<path>/[^|]+):\r?$"),
+]
+# JaCoCo only has the file name in 'sourcefile', the folder is in 'package'
+jacoco_package_regex = re.compile(rb"""<package\s+name=["'](?P<path>[^"']*)["']""")
+jacoco_sourcefile_regex = re.compile(
+    rb"""<sourcefile\s+name=["'](?P<path>[^"']+)["']"""
+)
+
+
+def _normalize_path(path: str) -> str:
+    path = path.strip().replace("\\", "/")
+    while path.startswith("./"):
+        path = path[2:]
+    return path
+
+
+def _path_suffixes(path: str) -> typing.Iterator[str]:
+    parts = path.split("/")
+    for idx in range(len(parts)):
+        yield "/".join(parts[idx:])
+
+
+def find_paths_referenced_by_report(
+    coverage_file: UploadCollectionResultFile,
+) -> typing.Set[str]:
+    paths = set()
+    current_package = None
+    with open(coverage_file.path, "rb") as f:
+        for line in f:
+            for regex in report_path_regexes:
+                for match in regex.finditer(line):
+                    paths.add(match.group("path"))
+            for match in jacoco_package_regex.finditer(line):
+                current_package = match.group("path")
+            for match in jacoco_sourcefile_regex.finditer(line):
+                if current_package:
+                    paths.add(current_package + b"/" + match.group("path"))
+                else:
+                    paths.add(match.group("path"))
+    return set(
+        _normalize_path(path.decode(errors="replace")) for path in paths if path.strip()
+    )
+
+
+def find_paths_referenced_by_reports(
+    coverage_files: typing.List[UploadCollectionResultFile],
+) -> typing.Optional[typing.Set[str]]:
+    """
+    Returns the paths of source files referenced in the coverage reports.
+    Returns None if any of the reports doesn't reference any file,
+    because then we can't tell which files it refers to.
+    """
+    referenced_paths = set()
+    for coverage_file in coverage_files:
+        paths = find_paths_referenced_by_report(coverage_file)
+        if not paths:
+            logger.info(
+                f"Unable to find source file paths in {coverage_file}. The full network will be used."
+            )
+            return None
+        referenced_paths.update(paths)
+    return referenced_paths
+
+
+def filter_network_by_referenced_paths(
+    network: typing.List[str], referenced_paths: typing.Set[str]
+) -> typing.List[str]:
+    """
+    Keeps the files in the network that are referenced in the reports.
+    Reports might use absolute paths or paths relative to a different folder,
+    so a network file is kept if either path ends with the other.
+    """
+    referenced_suffixes = set()
+    for path in referenced_paths:
+        referenced_suffixes.update(_path_suffixes(path))
+    return [
+        filename
+        for filename in network
+        if filename in referenced_suffixes
+        or any(suffix in referenced_paths for suffix in _path_suffixes(filename))
+    ]
@@ -1,26 +1,102 @@
 import logging
+import os
 import pathlib
 import re
 import typing
 import uuid
 from collections import namedtuple
-from fnmatch import fnmatch
 
 import click
 
+from codecov_cli.helpers.concurrency import run_in_threads
 from codecov_cli.services.upload.coverage_file_finder import CoverageFileFinder
+from codecov_cli.services.upload.file_fixes_cache import FileFixesCache
 from codecov_cli.services.upload.network_finder import NetworkFinder
+from codecov_cli.services.upload.referenced_paths import (
+    filter_network_by_referenced_paths,
+    find_paths_referenced_by_reports,
+)
 from codecov_cli.types import (
     PreparationPluginInterface,
     UploadCollectionResult,
+    UploadCollectionResultFile,
     UploadCollectionResultFileFixer,
 )
 
 logger = logging.getLogger("codecovcli")
 
-fix_patterns_to_apply = namedtuple(
-    "fix_patterns_to_apply", ["without_reason", "with_reason", "eof"]
+fix_patterns_to_apply = namedtuple("fix_patterns_to_apply", ["regex", "eof"])
+
+# All patterns are anchored to the start of a line and never cross a newline,
+# so they can run over a whole file at once in MULTILINE mode.
+# patterns that we don't need to specify a reason for
+empty_line_regex = r"^[^\S\n]*$"
+comment_regex = r"^[^\S\n]*\/\/.*$"
+bracket_regex = r"^[^\S\n]*[\{\}][^\S\n]*(\/\/.*)?$"
+list_regex = r"^[^\S\n]*[\]\[][^\S\n]*(\/\/.*)?$"
+go_function_regex = r"^[^\S\n]*func[^\S\n]*[\{][^\S\n]*(\/\/.*)?$"
+php_end_bracket_regex = r"^[^\S\n]*\);[^\S\n]*(\/\/.*)?$"
+
+# patterns to specify a reason for
+comment_block_regex = r"^[^\S\n]*(\/\*|\*\/)[^\S\n]*$"
+lcov_excel_regex = r"^\/\/ LCOV_EXCL"
+
+
+def _compile_fix_patterns(
+    without_reason: typing.List[str], with_reason: typing.List[str], eof: bool
+) -> fix_patterns_to_apply:
+    """
+    Merges the patterns of a language into a single regex.
+    Lines matching the 'with_reason' group take precedence, same as they
+    would if every pattern was checked one by one.
+    """
+    groups = []
+    if with_reason:
+        groups.append(f"(?P<with_reason>{'|'.join(with_reason)})")
+    if without_reason:
+        groups.append(f"(?P<without_reason>{'|'.join(without_reason)})")
+    return fix_patterns_to_apply(re.compile("|".join(groups), re.MULTILINE), eof)
+
+
+kt_patterns_to_apply = _compile_fix_patterns(
+    [bracket_regex], [comment_block_regex], True
+)
+go_patterns_to_apply = _compile_fix_patterns(
+    [empty_line_regex, comment_regex, bracket_regex, go_function_regex],
+    [comment_block_regex],
+    False,
+)
+dart_patterns_to_apply = _compile_fix_patterns(
+    [bracket_regex],
+    [],
+    False,
 )
+php_patterns_to_apply = _compile_fix_patterns(
+    [bracket_regex, list_regex, php_end_bracket_regex],
+    [],
+    False,
+)
+cpp_swift_vala_patterns_to_apply = _compile_fix_patterns(
+    [empty_line_regex, bracket_regex],
+    [lcov_excel_regex],
+    False,
+)
+
+# Keyed by file extension
+file_regex_patterns = {
+    ".kt": kt_patterns_to_apply,
+    ".go": go_patterns_to_apply,
+    ".dart": dart_patterns_to_apply,
+    ".php": php_patterns_to_apply,
+    ".c": cpp_swift_vala_patterns_to_apply,
+    ".cpp": cpp_swift_vala_patterns_to_apply,
+    ".cxx": cpp_swift_vala_patterns_to_apply,
+    ".h": cpp_swift_vala_patterns_to_apply,
+    ".hpp": cpp_swift_vala_patterns_to_apply,
+    ".m": cpp_swift_vala_patterns_to_apply,
+    ".swift": cpp_swift_vala_patterns_to_apply,
+    ".vala": cpp_swift_vala_patterns_to_apply,
+}
 
 
 class UploadCollector(object):
@@ -30,75 +106,54 @@ class UploadCollector(object):
         network_finder: NetworkFinder,
         coverage_file_finder: CoverageFileFinder,
         disable_file_fixes: bool = False,
+        file_fixes_cache: typing.Optional[FileFixesCache] = None,
+        limit_network_to_reports: bool = False,
     ):
         self.preparation_plugins = preparation_plugins
         self.network_finder = network_finder
         self.coverage_file_finder = coverage_file_finder
         self.disable_file_fixes = disable_file_fixes
+        self.file_fixes_cache = file_fixes_cache
+        self.limit_network_to_reports = limit_network_to_reports
 
     def _produce_file_fixes_for_network(
         self, network: typing.List[str]
     ) -> typing.List[UploadCollectionResultFileFixer]:
         if not network or self.disable_file_fixes:
             return []
-        # patterns that we don't need to specify a reason for
-        empty_line_regex = re.compile(r"^\s*$")
-        comment_regex = re.compile(r"^\s*\/\/.*$")
-        bracket_regex = re.compile(r"^\s*[\{\}]\s*(\/\/.*)?$")
-        list_regex = re.compile(r"^\s*[\]\[]\s*(\/\/.*)?$")
-        go_function_regex = re.compile(r"^\s*func\s*[\{]\s*(\/\/.*)?$")
-        php_end_bracket_regex = re.compile(r"^\s*\);\s*(\/\/.*)?$")
-
-        # patterns to specify a reason for
-        comment_block_regex = re.compile(r"^\s*(\/\*|\*\/)\s*$")
-        lcov_excel_regex = re.compile(r"\/\/ LCOV_EXCL")
-
-        kt_patterns_to_apply = fix_patterns_to_apply(
-            [bracket_regex], [comment_block_regex], True
-        )
-        go_patterns_to_apply = fix_patterns_to_apply(
-            [empty_line_regex, comment_regex, bracket_regex, go_function_regex],
-            [comment_block_regex],
-            False,
-        )
-        dart_patterns_to_apply = fix_patterns_to_apply(
-            [bracket_regex],
-            [],
-            False,
-        )
-        php_patterns_to_apply = fix_patterns_to_apply(
-            [bracket_regex, list_regex, php_end_bracket_regex],
-            [],
-            False,
-        )
 
-        cpp_swift_vala_patterns_to_apply = fix_patterns_to_apply(
-            [empty_line_regex, bracket_regex],
-            [lcov_excel_regex],
-            False,
-        )
-
-        file_regex_patterns = {
-            "*.kt": kt_patterns_to_apply,
-            "*.go": go_patterns_to_apply,
-            "*.dart": dart_patterns_to_apply,
-            "*.php": php_patterns_to_apply,
-            "*.c": cpp_swift_vala_patterns_to_apply,
-            "*.cpp": cpp_swift_vala_patterns_to_apply,
-            "*.cxx": cpp_swift_vala_patterns_to_apply,
-            "*.h": cpp_swift_vala_patterns_to_apply,
-            "*.hpp": cpp_swift_vala_patterns_to_apply,
-            "*.m": cpp_swift_vala_patterns_to_apply,
-            "*.swift": cpp_swift_vala_patterns_to_apply,
-            "*.vala": cpp_swift_vala_patterns_to_apply,
-        }
-
-        result = []
+        files_to_fix = []
         for filename in network:
-            for glob, fix_patterns in file_regex_patterns.items():
-                if fnmatch(filename, glob):
-                    result.append(self._get_file_fixes(filename, fix_patterns))
-                    break
+            fix_patterns = file_regex_patterns.get(os.path.splitext(filename)[1])
+            if fix_patterns is not None:
+                files_to_fix.append((filename, fix_patterns))
+        if not files_to_fix:
+            return []
+
+        result = [None] * len(files_to_fix)
+        files_to_read = []
+        for idx, (filename, fix_patterns) in enumerate(files_to_fix):
+            if self.file_fixes_cache is not None:
+                result[idx] = self.file_fixes_cache.get(filename, fix_patterns)
+            if result[idx] is None:
+                files_to_read.append(idx)
+
+        if files_to_read:
+            # Threads only overlap the file reads: the regex scan holds the GIL,
+            # so it doesn't use more than one core
+            file_fixes = run_in_threads(
+                lambda idx: self._get_file_fixes(*files_to_fix[idx]), files_to_read
+            )
+            for idx, file_fixer in zip(files_to_read, file_fixes):
+                result[idx] = file_fixer
+
+        if self.file_fixes_cache is not None:
+            for idx in files_to_read:
+                self.file_fixes_cache.set(*files_to_fix[idx], result[idx])
+            logger.info(
+                f"Reused file fixes of {len(files_to_fix) - len(files_to_read)} out of {len(files_to_fix)} files from cache"
+            )
+            self.file_fixes_cache.save()
 
         return result
 
@@ -112,20 +167,7 @@ class UploadCollector(object):
 
         try:
             with open(filename, "r") as f:
-                for lineno, line_content in enumerate(f):
-                    if any(
-                        pattern.match(line_content)
-                        for pattern in fix_patterns_to_apply.with_reason
-                    ):
-                        fixed_lines_with_reason.add((lineno + 1, line_content))
-                    elif any(
-                        pattern.match(line_content)
-                        for pattern in fix_patterns_to_apply.without_reason
-                    ):
-                        fixed_lines_without_reason.add(lineno + 1)
-
-                if fix_patterns_to_apply.eof:
-                    eof = lineno + 1
+                content = f.read()
         except UnicodeDecodeError as err:
             logger.warning(
                 f"There was an issue decoding: {filename}, file fixes were not applied to this file.",
@@ -134,11 +176,50 @@ class UploadCollector(object):
                     reason=err.reason,
                 ),
             )
+            return UploadCollectionResultFileFixer(
+                path, fixed_lines_without_reason, fixed_lines_with_reason, eof
+            )
+
+        lineno = 1
+        last_position = 0
+        for match in fix_patterns_to_apply.regex.finditer(content):
+            line_start = match.start()
+            if line_start == len(content):
+                # '^' also matches after the trailing newline, which is not a line
+                break
+            lineno += content.count("\n", last_position, line_start)
+            last_position = line_start
+            if match.lastgroup == "with_reason":
+                line_end = content.find("\n", line_start)
+                line_end = len(content) if line_end == -1 else line_end + 1
+                fixed_lines_with_reason.add((lineno, content[line_start:line_end]))
+            else:
+                fixed_lines_without_reason.add(lineno)
+
+        if fix_patterns_to_apply.eof and content:
+            eof = content.count("\n") + (0 if content.endswith("\n") else 1)
 
         return UploadCollectionResultFileFixer(
             path, fixed_lines_without_reason, fixed_lines_with_reason, eof
         )
 
+    def _limit_network_to_reports(
+        self,
+        network: typing.Optional[typing.List[str]],
+        coverage_files: typing.List[UploadCollectionResultFile],
+    ) -> typing.Optional[typing.List[str]]:
+        if not network:
+            # e.g. no versioning system, there's no network to limit
+            return network
+        referenced_paths = find_paths_referenced_by_reports(coverage_files)
+        if referenced_paths is None:
+            return network
+        limited_network = filter_network_by_referenced_paths(network, referenced_paths)
+        logger.info(
+            f"Limited network to {len(limited_network)} out of {len(network)} files referenced by the coverage reports"
+        )
+        return limited_network
+
     def generate_upload_data(self) -> UploadCollectionResult:
         for prep in self.preparation_plugins:
             logger.debug(f"Running preparation plugin: {type(prep)}")
@@ -156,6 +237,8 @@ class UploadCollector(object):
             )
         for file in coverage_files:
             logger.info(f"> {file}")
+        if self.limit_network_to_reports:
+            network = self._limit_network_to_reports(network, coverage_files)
         return UploadCollectionResult(
             network=network,
             coverage_files=coverage_files,
@@ -8,7 +8,7 @@ from typing import Any, Dict
 
 from codecov_cli import __version__ as codecov_cli_version
 from codecov_cli.helpers.config import CODECOV_API_URL
-from codecov_cli.helpers.encoder import encode_slug
+from codecov_cli.helpers.encoder import encode_slug, front_code_paths
 from codecov_cli.helpers.request import (
     get_token_header_or_fail,
     send_post_request,
@@ -24,6 +24,9 @@ logger = logging.getLogger("codecovcli")
 
 
 class UploadSender(object):
+    def __init__(self, network_format: str = "legacy"):
+        self.network_format = network_format
+
     def send_upload_data(
         self,
         upload_data: UploadCollectionResult,
@@ -91,7 +94,7 @@ class UploadSender(object):
                 "format": "legacy",
                 "value": self._get_file_fixers(upload_data),
             },
-            "network_files": network_files if network_files is not None else [],
+            "network_files": self._get_network_files(network_files or []),
             "coverage_files": self._get_coverage_files(upload_data),
             "metadata": {},
         }
@@ -99,6 +102,21 @@ class UploadSender(object):
         json_data = json.dumps(payload)
         return json_data.encode()
 
+    def _get_network_files(self, network_files: typing.List[str]):
+        """
+        Returns the network in the selected format.
+        'legacy' is a list of paths. 'front-coded' is the sorted list of paths
+        with the prefix shared with the previous path replaced by its length:
+
+        {
+            "format": "front-coded",
+            "value": [[0, "a/b/c.py"], [4, "d.py"], [2, "e.py"]],
+        }
+        """
+        if self.network_format == "front-coded":
+            return {"format": "front-coded", "value": front_code_paths(network_files)}
+        return network_files
+
     def _get_file_fixers(
         self, upload_data: UploadCollectionResult
     ) -> Dict[str, Dict[str, Any]]:
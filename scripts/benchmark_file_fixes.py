@@ -0,0 +1,132 @@
+"""
+Compares the file fixes scanner of the upload command with the previous one
+(one thread, several re.match calls per line, fnmatch against every glob).
+
+Both run over copies of tests/data/files_to_fix_examples, and must find the same fixes.
+The current scanner reads files in threads, which only overlaps the reads:
+the scan itself runs on one core, so the gain comes from the merged regexes.
+
+Usage: python scripts/benchmark_file_fixes.py [--copies 200] [--repeat 3]
+"""
+import argparse
+import pathlib
+import re
+import shutil
+import tempfile
+import time
+from fnmatch import fnmatch
+
+from codecov_cli.services.upload.upload_collector import UploadCollector
+from codecov_cli.types import UploadCollectionResultFileFixer
+
+examples_folder = (
+    pathlib.Path(__file__).parent.parent / "tests" / "data" / "files_to_fix_examples"
+)
+
+# The scanner before the patterns of each language were merged into a single regex
+empty_line_regex = re.compile(r"^\s*$")
+comment_regex = re.compile(r"^\s*\/\/.*$")
+bracket_regex = re.compile(r"^\s*[\{\}]\s*(\/\/.*)?$")
+list_regex = re.compile(r"^\s*[\]\[]\s*(\/\/.*)?$")
+go_function_regex = re.compile(r"^\s*func\s*[\{]\s*(\/\/.*)?$")
+php_end_bracket_regex = re.compile(r"^\s*\);\s*(\/\/.*)?$")
+comment_block_regex = re.compile(r"^\s*(\/\*|\*\/)\s*$")
+lcov_excel_regex = re.compile(r"\/\/ LCOV_EXCL")
+
+cpp_swift_vala_patterns = ([empty_line_regex, bracket_regex], [lcov_excel_regex], False)
+previous_file_regex_patterns = {
+    "*.kt": ([bracket_regex], [comment_block_regex], True),
+    "*.go": (
+        [empty_line_regex, comment_regex, bracket_regex, go_function_regex],
+        [comment_block_regex],
+        False,
+    ),
+    "*.dart": ([bracket_regex], [], False),
+    "*.php": ([bracket_regex, list_regex, php_end_bracket_regex], [], False),
+    "*.c": cpp_swift_vala_patterns,
+    "*.cpp": cpp_swift_vala_patterns,
+    "*.cxx": cpp_swift_vala_patterns,
+    "*.h": cpp_swift_vala_patterns,
+    "*.hpp": cpp_swift_vala_patterns,
+    "*.m": cpp_swift_vala_patterns,
+    "*.swift": cpp_swift_vala_patterns,
+    "*.vala": cpp_swift_vala_patterns,
+}
+
+
+def previous_get_file_fixes(filename, without_reason, with_reason, has_eof):
+    fixed_lines_without_reason = set()
+    fixed_lines_with_reason = set()
+    eof = None
+    try:
+        with open(filename, "r") as f:
+            for lineno, line_content in enumerate(f):
+                if any(pattern.match(line_content) for pattern in with_reason):
+                    fixed_lines_with_reason.add((lineno + 1, line_content))
+                elif any(pattern.match(line_content) for pattern in without_reason):
+                    fixed_lines_without_reason.add(lineno + 1)
+            if has_eof:
+                eof = lineno + 1
+    except UnicodeDecodeError:
+        pass
+    return UploadCollectionResultFileFixer(
+        pathlib.Path(filename), fixed_lines_without_reason, fixed_lines_with_reason, eof
+    )
+
+
+def previous_file_fixes(network):
+    result = []
+    for filename in network:
+        for glob, patterns in previous_file_regex_patterns.items():
+            if fnmatch(filename, glob):
+                result.append(previous_get_file_fixes(filename, *patterns))
+                break
+    return result
+
+
+def current_file_fixes(network):
+    return UploadCollector(None, None, None)._produce_file_fixes_for_network(network)
+
+
+def best_time(function, network, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(network)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--copies", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    examples = sorted(path for path in examples_folder.iterdir() if path.is_file())
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        network = []
+        for copy in range(args.copies):
+            copy_folder = pathlib.Path(tmp_dir) / str(copy)
+            copy_folder.mkdir()
+            for example in examples:
+                shutil.copyfile(example, copy_folder / example.name)
+                network.append(str(copy_folder / example.name))
+
+        previous_time, previous_result = best_time(
+            previous_file_fixes, network, args.repeat
+        )
+        current_time, current_result = best_time(
+            current_file_fixes, network, args.repeat
+        )
+
+    if previous_result != current_result:
+        raise SystemExit("The scanners found different file fixes")
+    print(f"{len(network)} files ({len(examples)} examples x {args.copies} copies)")
+    print(f"previous scanner: {previous_time:.3f}s")
+    print(f"current scanner:  {current_time:.3f}s")
+    print(f"speedup: {previous_time / current_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
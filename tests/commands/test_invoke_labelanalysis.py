@@ -1,4 +1,5 @@
 import json
+import threading
 from contextlib import redirect_stdout
 from io import StringIO
 from pathlib import Path
@@ -13,11 +14,15 @@ from codecov_cli.commands.labelanalysis import (
     _dry_run_json_output,
     _dry_run_list_output,
     _fallback_to_collected_labels,
+    _get_test_durations,
     _potentially_calculate_absent_labels,
     _send_labelanalysis_request,
 )
 from codecov_cli.commands.labelanalysis import time as labelanalysis_time
+from codecov_cli.helpers.request import PollBackoff
 from codecov_cli.main import cli
+from codecov_cli.runners import pytest_in_process
+from codecov_cli.runners.pytest_standard_runner import PytestStandardRunner
 from codecov_cli.runners.types import LabelAnalysisRequestResult
 from tests.factory import FakeProvider, FakeRunner, FakeVersioningSystem
 
@@ -145,6 +150,40 @@ class TestLabelAnalysisNotInvoke(object):
             == "TESTS_TO_RUN='--option=1' '--option=2' 'label_1' 'label_2'\nTESTS_TO_SKIP='--option=1' '--option=2' 'label_3' 'label_4'\n"
         )
 
+    def test__dry_run_list_output_shards(self):
+        with StringIO() as out:
+            with redirect_stdout(out):
+                _dry_run_list_output(
+                    labels_to_run=["label_1", "label_2"],
+                    labels_to_skip=[],
+                    runner_options=["--option=1"],
+                    durations={"label_1": 1.0, "label_2": None},
+                    shard_groups=[["label_2"], ["label_1"]],
+                )
+                stdout = out.getvalue()
+
+        assert stdout.splitlines() == [
+            "TESTS_TO_RUN='--option=1' 'label_1' 'label_2'",
+            "TESTS_TO_SKIP='--option=1'",
+            "TESTS_TO_RUN_SHARD_0='--option=1' 'label_2'",
+            "TESTS_TO_RUN_SHARD_1='--option=1' 'label_1'",
+        ]
+
+    def test__get_test_durations_only_when_requested(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        # e.g. left by pytest-split
+        Path(".test_durations").write_text(json.dumps({"test_a[1]": 1, "test_a[2]": 2}))
+        runner = FakeRunner(collect_tests_response=[])
+
+        assert _get_test_durations(runner, None, [], dry_run=True) is None
+        assert _get_test_durations(runner, None, [], dry_run=False, shards=2) is None
+        assert _get_test_durations(runner, None, [], dry_run=True, shards=2) == {
+            "test_a[1]": 1,
+            "test_a[2]": 2,
+            "test_a": 3,
+        }
+        assert _get_test_durations(runner, Path("missing.json"), [], dry_run=True) == {}
+
 
 class TestLabelAnalysisCommand(object):
     def test_labelanalysis_help(self, mocker, fake_ci_provider):
@@ -175,6 +214,30 @@ class TestLabelAnalysisCommand(object):
             "                                  prefixed with ATS_TESTS_TO_RUN= List of tests",
             "                                  to skip is prefixed with ATS_TESTS_TO_SKIP=",
             "  --dry-run-format [json|space-separated-list]",
+            "  --local-report FILE             Report with contexts of the base commit (e.g.",
+            "                                  coverage.codecov.json from the compress-",
+            "                                  pycoverage plugin), or its label index",
+            "                                  (label_index_file option of the plugin). If",
+            "                                  Codecov fails or takes longer than --max-wait-",
+            "                                  time, tests to run are selected locally, from",
+            "                                  the labels of the lines changed since the base",
+            "                                  commit, instead of running all tests.",
+            "  --offline                       Select tests to run locally with --local-",
+            "                                  report only, without requesting label analysis",
+            "                                  from Codecov.",
+            "  --shards INTEGER RANGE          Dry run only. Also split the tests to run in N",
+            "                                  groups that take about the same time, using",
+            "                                  the durations in --test-durations-file (e.g.",
+            "                                  one group per CI job).  [x>=1]",
+            "  --test-durations-file FILE      JSON file with the duration of each test (same",
+            "                                  format as pytest-split's .test_durations). Dry",
+            "                                  runs print the estimated duration of each test",
+            "                                  to run. Defaults to the test_durations_file of",
+            "                                  the runner, or .test_durations",
+            "  --junit-xml FILE                Junit xml report (pytest --junitxml) of a",
+            "                                  previous run, to add its test durations to",
+            "                                  --test-durations-file. Can be used multiple",
+            "                                  times.",
             "  -h, --help                      Show this message and exit.",
             "",
         ]
@@ -328,6 +391,65 @@ class TestLabelAnalysisCommand(object):
             "ats_tests_to_skip": ["test_present"],
         }
 
+    def test_invoke_label_analysis_collect_in_process(
+        self, get_labelanalysis_deps, mocker
+    ):
+        get_labelanalysis_deps["mock_get_runner"].return_value = PytestStandardRunner(
+            dict(collect_in_process=True)
+        )
+        get_context = mocker.spy(pytest_in_process.multiprocessing, "get_context")
+        request_sent = threading.Event()
+
+        def initial_request_callback(request):
+            request_sent.set()
+            return (201, {}, json.dumps({"external_id": "label-analysis-request-id"}))
+
+        # The labels are only sent (PATCH) if collection finishes before the first poll
+        with responses.RequestsMock(assert_all_requests_are_fired=False) as rsps:
+            rsps.add_callback(
+                responses.POST,
+                "https://api.codecov.io/labels/labels-analysis",
+                callback=initial_request_callback,
+            )
+            rsps.add(
+                responses.PATCH,
+                "https://api.codecov.io/labels/labels-analysis/label-analysis-request-id",
+                json={"external_id": "label-analysis-request-id"},
+                status=201,
+            )
+            rsps.add(
+                responses.GET,
+                "https://api.codecov.io/labels/labels-analysis/label-analysis-request-id",
+                json={
+                    "state": "finished",
+                    "result": {
+                        "present_report_labels": ["test_a.py::test_a"],
+                        "absent_labels": [],
+                        "present_diff_labels": ["test_a.py::test_a"],
+                        "global_level_labels": [],
+                    },
+                },
+            )
+            cli_runner = CliRunner(mix_stderr=False)
+            with cli_runner.isolated_filesystem():
+                Path("test_a.py").write_text("def test_a(): pass\n")
+                result = cli_runner.invoke(
+                    cli,
+                    [
+                        "label-analysis",
+                        "--token=STATIC_TOKEN",
+                        f"--base-sha={FAKE_BASE_SHA}",
+                        "--dry-run",
+                    ],
+                    obj={},
+                )
+        assert result.exit_code == 0, result.stderr
+        assert request_sent.is_set()
+        # The initial request runs in another thread while tests are collected,
+        # so collection doesn't fork
+        get_context.assert_called_once_with("spawn")
+        assert json.loads(result.stdout)["ats_tests_to_run"] == ["test_a.py::test_a"]
+
     def test_invoke_label_analysis_dry_run_pytest_format(
         self, get_labelanalysis_deps, mocker
     ):
@@ -482,6 +604,8 @@ class TestLabelAnalysisCommand(object):
                 },
                 fake_runner,
                 "json",
+                test_durations=None,
+                shards=None,
             )
         assert result.exit_code == 0
 
@@ -599,6 +723,187 @@ class TestLabelAnalysisCommand(object):
             }
         )
 
+    def test_labelanalysis_waits_retry_after_when_busy(
+        self, get_labelanalysis_deps, mocker, use_verbose_option
+    ):
+        fake_runner = get_labelanalysis_deps["fake_runner"]
+        collected_labels = get_labelanalysis_deps["collected_labels"]
+        mocker.patch.object(labelanalysis_time, "monotonic", side_effect=[0, 1, 6])
+
+        with responses.RequestsMock() as rsps:
+            rsps.add(
+                responses.POST,
+                "https://api.codecov.io/labels/labels-analysis",
+                json={"external_id": "label-analysis-request-id"},
+                status=201,
+            )
+            rsps.add(
+                responses.PATCH,
+                "https://api.codecov.io/labels/labels-analysis/label-analysis-request-id",
+                json={"external_id": "label-analysis-request-id"},
+                status=201,
+            )
+            rsps.add(
+                responses.GET,
+                "https://api.codecov.io/labels/labels-analysis/label-analysis-request-id",
+                status=503,
+                headers={"Retry-After": "2"},
+            )
+            rsps.add(
+                responses.GET,
+                "https://api.codecov.io/labels/labels-analysis/label-analysis-request-id",
+                json={"state": "processing"},
+            )
+            cli_runner = CliRunner()
+            result = cli_runner.invoke(
+                cli,
+                [
+                    "label-analysis",
+                    "--token=STATIC_TOKEN",
+                    f"--base-sha={FAKE_BASE_SHA}",
+                    "--max-wait-time=5",
+                ],
+                obj={},
+            )
+            assert result.exit_code == 0
+        # The first wait is short, the second is what the server asked for
+        sleep_calls = labelanalysis_time.sleep.call_args_list
+        assert len(sleep_calls) == 2
+        assert sleep_calls[0].args[0] <= 1
+        assert sleep_calls[1].args == (2,)
+        fake_runner.process_labelanalysis_result.assert_called_with(
+            {
+                "present_report_labels": [],
+                "absent_labels": collected_labels,
+                "present_diff_labels": [],
+                "global_level_labels": [],
+            }
+        )
+
+    def test_invoke_label_analysis_offline(self, get_labelanalysis_deps, mocker):
+        fake_runner = get_labelanalysis_deps["fake_runner"]
+        mock_local_analysis = mocker.patch(
+            "codecov_cli.commands.labelanalysis.local_label_analysis",
+            return_value={
+                "present_report_labels": [
+                    "test_present",
+                    "test_in_diff",
+                    "test_global",
+                    "test_removed",
+                ],
+                "absent_labels": [],
+                "present_diff_labels": ["test_in_diff"],
+                "global_level_labels": [],
+            },
+        )
+        mock_post = mocker.patch("codecov_cli.commands.labelanalysis.requests.post")
+
+        cli_runner = CliRunner(mix_stderr=False)
+        with cli_runner.isolated_filesystem():
+            Path("coverage.codecov.json").write_text("{}")
+            result = cli_runner.invoke(
+                cli,
+                [
+                    "label-analysis",
+                    "--token=STATIC_TOKEN",
+                    f"--base-sha={FAKE_BASE_SHA}",
+                    "--local-report=coverage.codecov.json",
+                    "--offline",
+                    "--dry-run",
+                ],
+                obj={},
+            )
+        assert result.exit_code == 0
+        mock_post.assert_not_called()
+        mock_local_analysis.assert_called_once()
+        assert mock_local_analysis.call_args.args[0] == Path("coverage.codecov.json")
+        fake_runner.process_labelanalysis_result.assert_not_called()
+        assert json.loads(result.stdout) == {
+            "runner_options": ["--labels"],
+            "ats_tests_to_run": ["test_absent", "test_in_diff"],
+            "ats_tests_to_skip": ["test_global", "test_present"],
+        }
+
+    def test_invoke_label_analysis_offline_requires_local_report(
+        self, get_labelanalysis_deps
+    ):
+        result = CliRunner().invoke(
+            cli,
+            [
+                "label-analysis",
+                "--token=STATIC_TOKEN",
+                f"--base-sha={FAKE_BASE_SHA}",
+                "--offline",
+            ],
+            obj={},
+        )
+        assert result.exit_code != 0
+        assert "--offline requires --local-report" in result.output
+
+    def test_invoke_label_analysis_local_report_not_found(self, get_labelanalysis_deps):
+        cli_runner = CliRunner()
+        with cli_runner.isolated_filesystem():
+            result = cli_runner.invoke(
+                cli,
+                [
+                    "label-analysis",
+                    "--token=STATIC_TOKEN",
+                    f"--base-sha={FAKE_BASE_SHA}",
+                    "--local-report=coverage.codecov.json",
+                    "--offline",
+                ],
+                obj={},
+            )
+        assert result.exit_code == 2
+        assert "'coverage.codecov.json' does not exist" in result.output
+
+    def test_fallback_to_local_report_codecov_error(
+        self, get_labelanalysis_deps, mocker
+    ):
+        fake_runner = get_labelanalysis_deps["fake_runner"]
+        mocker.patch(
+            "codecov_cli.commands.labelanalysis.local_label_analysis",
+            return_value={
+                "present_report_labels": ["test_present", "test_in_diff"],
+                "absent_labels": [],
+                "present_diff_labels": ["test_in_diff"],
+                "global_level_labels": [],
+            },
+        )
+        with responses.RequestsMock() as rsps:
+            rsps.add(
+                responses.POST,
+                "https://api.codecov.io/labels/labels-analysis",
+                status=502,
+            )
+            rsps.add(
+                responses.POST,
+                "https://api.codecov.io/labels/labels-analysis",
+                status=502,
+            )
+            cli_runner = CliRunner()
+            with cli_runner.isolated_filesystem():
+                Path("coverage.codecov.json").write_text("{}")
+                result = cli_runner.invoke(
+                    cli,
+                    [
+                        "label-analysis",
+                        "--token=STATIC_TOKEN",
+                        f"--base-sha={FAKE_BASE_SHA}",
+                        "--local-report=coverage.codecov.json",
+                    ],
+                    obj={},
+                )
+        assert result.exit_code == 0
+        fake_runner.process_labelanalysis_result.assert_called_with(
+            {
+                "present_report_labels": ["test_in_diff", "test_present"],
+                "present_diff_labels": ["test_in_diff"],
+                "absent_labels": ["test_absent", "test_global"],
+                "global_level_labels": [],
+            }
+        )
+
     def test_first_labelanalysis_request_fails_but_second_works(
         self, get_labelanalysis_deps, mocker, use_verbose_option
     ):
@@ -652,3 +957,169 @@ class TestLabelAnalysisCommand(object):
             label_analysis_result
         )
         print(result.output)
+
+    def test_labelanalysis_polls_while_collecting(
+        self, get_labelanalysis_deps, mocker, use_verbose_option
+    ):
+        fake_runner = get_labelanalysis_deps["fake_runner"]
+        collected_labels = get_labelanalysis_deps["collected_labels"]
+        mocker.patch(
+            "codecov_cli.commands.labelanalysis.PollBackoff",
+            return_value=PollBackoff(initial_delay=0.01, jitter=0),
+        )
+        polled = threading.Event()
+
+        def slow_collection():
+            # Collection only finishes after Codecov was polled
+            assert polled.wait(5)
+            return collected_labels
+
+        fake_runner.collect_tests = slow_collection
+
+        def finished_result(request):
+            polled.set()
+            return (
+                200,
+                {},
+                json.dumps(
+                    {
+                        "state": "finished",
+                        "result": {
+                            "present_report_labels": ["test_present", "test_gone"],
+                            "absent_labels": [],
+                            "present_diff_labels": ["test_present"],
+                            "global_level_labels": [],
+                        },
+                    }
+                ),
+            )
+
+        with responses.RequestsMock() as rsps:
+            rsps.add(
+                responses.POST,
+                "https://api.codecov.io/labels/labels-analysis",
+                json={"external_id": "label-analysis-request-id"},
+                status=201,
+            )
+            rsps.add_callback(
+                responses.GET,
+                "https://api.codecov.io/labels/labels-analysis/label-analysis-request-id",
+                callback=finished_result,
+            )
+            cli_runner = CliRunner()
+            result = cli_runner.invoke(
+                cli,
+                [
+                    "label-analysis",
+                    "--token=STATIC_TOKEN",
+                    f"--base-sha={FAKE_BASE_SHA}",
+                ],
+                obj={},
+            )
+            assert result.exit_code == 0
+            # Codecov was done before collection, labels are not sent
+            assert [call.request.method for call in rsps.calls] == ["POST", "GET"]
+        labelanalysis_time.sleep.assert_not_called()
+        fake_runner.process_labelanalysis_result.assert_called_with(
+            {
+                "present_report_labels": ["test_present"],
+                "absent_labels": ["test_absent", "test_global", "test_in_diff"],
+                "present_diff_labels": ["test_present"],
+                "global_level_labels": [],
+            }
+        )
+
+    def test_invoke_label_analysis_dry_run_shards(self, get_labelanalysis_deps, mocker):
+        label_analysis_result = {
+            "present_report_labels": [
+                "test_present",
+                "test_in_diff",
+                "test_global.py::test_g",
+            ],
+            "absent_labels": ["test_absent"],
+            "present_diff_labels": ["test_in_diff"],
+            "global_level_labels": ["test_global.py::test_g"],
+        }
+        get_labelanalysis_deps["fake_runner"].collect_tests_response = [
+            "test_absent",
+            "test_in_diff",
+            "test_global.py::test_g",
+            "test_present",
+        ]
+        with responses.RequestsMock() as rsps:
+            rsps.add(
+                responses.POST,
+                "https://api.codecov.io/labels/labels-analysis",
+                json={"external_id": "label-analysis-request-id"},
+                status=201,
+            )
+            rsps.add(
+                responses.PATCH,
+                "https://api.codecov.io/labels/labels-analysis/label-analysis-request-id",
+                json={"external_id": "label-analysis-request-id"},
+                status=201,
+            )
+            rsps.add(
+                responses.GET,
+                "https://api.codecov.io/labels/labels-analysis/label-analysis-request-id",
+                json={"state": "finished", "result": label_analysis_result},
+            )
+            cli_runner = CliRunner(mix_stderr=False)
+            with cli_runner.isolated_filesystem():
+                Path("durations.json").write_text(
+                    json.dumps({"test_in_diff": 4, "test_present": 100})
+                )
+                Path("test_global.py").write_text("")
+                Path("junit.xml").write_text(
+                    '<testsuite><testcase classname="test_global" name="test_g" time="3" />'
+                    "</testsuite>"
+                )
+                get_labelanalysis_deps["fake_runner"].collect_tests_response = [
+                    "test_absent",
+                    "test_in_diff",
+                    "test_global.py::test_g",
+                    "test_present",
+                ]
+                result = cli_runner.invoke(
+                    cli,
+                    [
+                        "label-analysis",
+                        "--token=STATIC_TOKEN",
+                        f"--base-sha={FAKE_BASE_SHA}",
+                        "--dry-run",
+                        "--shards=2",
+                        "--test-durations-file=durations.json",
+                        "--junit-xml=junit.xml",
+                    ],
+                    obj={},
+                )
+                # The junit durations are saved for the next runs
+                assert json.loads(Path("durations.json").read_text()) == {
+                    "test_global.py::test_g": 3.0,
+                    "test_in_diff": 4.0,
+                    "test_present": 100.0,
+                }
+        assert result.exit_code == 0
+        assert json.loads(result.stdout) == {
+            "runner_options": ["--labels"],
+            "ats_tests_to_run": [
+                "test_absent",
+                "test_global.py::test_g",
+                "test_in_diff",
+            ],
+            "ats_tests_to_skip": ["test_present"],
+            "ats_tests_durations": {
+                "test_absent": None,
+                "test_global.py::test_g": 3.0,
+                "test_in_diff": 4.0,
+            },
+            "ats_estimated_duration": 7.0,
+            # Tests without a known duration count as the average for the split
+            "ats_shards": [
+                {"tests": ["test_in_diff"], "estimated_duration": 4.0},
+                {
+                    "tests": ["test_absent", "test_global.py::test_g"],
+                    "estimated_duration": 3.0,
+                },
+            ],
+        }
@@ -94,6 +94,17 @@ def test_upload_process_options(mocker):
             "                                  uload with the --file option.",
             "  --disable-file-fixes            Disable file fixes to ignore common lines from",
             "                                  coverage (e.g. blank lines or empty brackets)",
+            "  --file-fixes-cache PATH         File to cache file fixes in between runs.",
+            "                                  Files that didn't change since they were",
+            "                                  cached are not read again.",
+            "  --limit-network-to-reports      Only include in the network (and apply file",
+            "                                  fixes to) files referenced by the coverage",
+            "                                  reports found. Reduces the upload size of big",
+            "                                  repositories.",
+            "  --network-format [legacy|front-coded]",
+            "                                  Format of the network section of the upload.",
+            "                                  'front-coded' is a compact encoding for",
+            "                                  repositories with deeply nested paths",
             "  -b, --build, --build-code TEXT  Specify the build number manually",
             "  --build-url TEXT                The URL of the build where this is running",
             "  --job-code TEXT",
@@ -0,0 +1,31 @@
+import threading
+import time
+
+from codecov_cli.helpers.concurrency import run_in_threads
+
+
+def test_run_in_threads_keeps_order():
+    def slow_double(item):
+        # Later items finish first
+        time.sleep((5 - item) / 100)
+        return item * 2
+
+    assert run_in_threads(slow_double, range(5), max_workers=5) == [0, 2, 4, 6, 8]
+    assert run_in_threads(slow_double, []) == []
+
+
+def test_run_in_threads_bounds_workers():
+    lock = threading.Lock()
+    running = []
+    max_running = []
+
+    def track(item):
+        with lock:
+            running.append(item)
+            max_running.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.remove(item)
+
+    run_in_threads(track, range(10), max_workers=2)
+    assert max(max_running) <= 2
@@ -1,6 +1,13 @@
 import pytest
 
-from codecov_cli.helpers.encoder import encode_slug, slug_without_subgroups_is_invalid
+from codecov_cli.helpers.encoder import (
+    decode_front_coded_paths,
+    decode_label_indexes,
+    encode_label_indexes,
+    encode_slug,
+    front_code_paths,
+    slug_without_subgroups_is_invalid,
+)
 
 
 @pytest.mark.parametrize(
@@ -53,3 +60,60 @@ def test_invalid_slug(slug):
 def test_valid_slug():
     slug = "owner/repo"
     assert not slug_without_subgroups_is_invalid(slug)
+
+
+def test_front_code_paths():
+    paths = ["a/e.py", "a/b/d.py", "a/b/c.py", "README.md"]
+    encoded = front_code_paths(paths)
+    assert encoded == [[0, "README.md"], [0, "a/b/c.py"], [4, "d.py"], [2, "e.py"]]
+    assert decode_front_coded_paths(encoded) == sorted(paths)
+
+
+@pytest.mark.parametrize(
+    "paths",
+    [
+        [],
+        ["single.py"],
+        ["same.py", "same.py"],
+        ["a", "ab", "abc", "b", "a/b/c/d/e/f.py", "a/b/c/d/e/g.py", "\u00e9/\u00e9.py"],
+    ],
+)
+def test_front_code_paths_roundtrip(paths):
+    assert decode_front_coded_paths(front_code_paths(paths)) == sorted(paths)
+
+
+def test_encode_label_indexes():
+    assert encode_label_indexes([]) == ""
+    assert encode_label_indexes([300, 1, 2]) == "AQGqAg=="
+    assert decode_label_indexes("AQGqAg==") == [1, 2, 300]
+
+
+@pytest.mark.parametrize(
+    "label_indexes",
+    [
+        [0],
+        [0, 1, 2, 3],
+        [127, 128, 16383, 16384],
+        [5, 2**32, 2**40 + 7],
+        list(range(0, 10000, 3)),
+    ],
+)
+def test_label_indexes_roundtrip(label_indexes):
+    assert decode_label_indexes(encode_label_indexes(label_indexes)) == sorted(
+        label_indexes
+    )
+
+
+def test_encode_label_indexes_removes_duplicates():
+    assert decode_label_indexes(encode_label_indexes([3, 1, 3])) == [1, 3]
+
+
+def test_encode_negative_label_index():
+    with pytest.raises(ValueError):
+        encode_label_indexes([-1])
+
+
+def test_decode_truncated_label_indexes():
+    # 0x80 says another byte follows, but there is none
+    with pytest.raises(ValueError):
+        decode_label_indexes("gA==")
@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from codecov_cli.helpers.json_cache import load_json_cache
+
+
+def test_load_json_cache(tmp_path):
+    cache_file = tmp_path / "cache.json"
+    assert load_json_cache(cache_file, 1, "entries") is None
+
+    cache_file.write_text(
+        json.dumps({"version": 1, "options": ["-x"], "entries": {"a": 1}})
+    )
+    assert load_json_cache(cache_file, 1, "entries") == {"a": 1}
+    assert load_json_cache(cache_file, 1, "entries", expected=dict(options=["-x"])) == {
+        "a": 1
+    }
+    # Built with other inputs, or by another version
+    assert load_json_cache(cache_file, 1, "entries", expected=dict(options=[])) is None
+    assert load_json_cache(cache_file, 2, "entries") is None
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "not json",
+        "[1, 2]",
+        json.dumps({"version": 1}),
+        json.dumps({"version": 1, "entries": {}}),
+    ],
+)
+def test_load_json_cache_invalid(tmp_path, content):
+    cache_file = tmp_path / "cache.json"
+    cache_file.write_text(content)
+    assert (
+        load_json_cache(cache_file, 1, "entries", expected=dict(options=["-x"])) is None
+    )
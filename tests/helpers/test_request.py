@@ -1,10 +1,15 @@
+import random
+import time
 import uuid
+from email.utils import formatdate
 
 import pytest
 import requests
 from requests import Response
 
 from codecov_cli.helpers.request import (
+    PollBackoff,
+    get_retry_after,
     get_token_header_or_fail,
     log_warnings_and_errors_if_any,
 )
@@ -103,3 +108,50 @@ def test_request_retry_too_many_errors(mocker):
     with pytest.raises(Exception) as exp:
         resp = send_post_request("my_url")
     assert str(exp.value) == "Request failed after too many retries"
+
+
+def test_poll_backoff_grows_up_to_max_delay():
+    poll_backoff = PollBackoff(initial_delay=0.5, max_delay=5, multiplier=2, jitter=0)
+    delays = [poll_backoff.next_delay() for _ in range(7)]
+    assert delays == [0.5, 1, 2, 4, 5, 5, 5]
+
+
+def test_poll_backoff_jitter():
+    poll_backoff = PollBackoff(
+        initial_delay=1, max_delay=1, jitter=0.2, rng=random.Random(0)
+    )
+    delays = [poll_backoff.next_delay() for _ in range(100)]
+    assert all(0.8 <= delay <= 1.2 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_poll_backoff_retry_after():
+    poll_backoff = PollBackoff(initial_delay=0.5, multiplier=2, jitter=0)
+    assert poll_backoff.next_delay() == 0.5
+    assert poll_backoff.next_delay(retry_after=3) == 3
+    # Backing off continues after the server's delay
+    assert poll_backoff.next_delay() == 2
+
+
+@pytest.mark.parametrize(
+    "header,expected",
+    [
+        (None, None),
+        ("3", 3),
+        ("1.5", 1.5),
+        ("-1", 0),
+        ("not a date", None),
+        ("Wed, 21 Oct 2015 07:28:00 GMT", 0),
+    ],
+)
+def test_get_retry_after(header, expected):
+    resp = Response()
+    if header is not None:
+        resp.headers["Retry-After"] = header
+    assert get_retry_after(resp) == expected
+
+
+def test_get_retry_after_http_date():
+    resp = Response()
+    resp.headers["Retry-After"] = formatdate(time.time() + 30, usegmt=True)
+    assert 28 <= get_retry_after(resp) <= 30
@@ -314,6 +314,21 @@ class TestPayloadGeneration(object):
         }
         assert actual_report == json.dumps(expected_report).encode()
 
+    def test_generate_payload_front_coded_network(self, mocked_coverage_file):
+        actual_report = UploadSender(network_format="front-coded")._generate_payload(
+            get_fake_upload_collection_result(mocked_coverage_file), None
+        )
+        assert json.loads(actual_report)["network_files"] == {
+            "format": "front-coded",
+            "value": [
+                [0, "./codecov.yaml"],
+                [0, "Makefile"],
+                [0, "awesome/__init__.py"],
+                [8, "code_fib.py"],
+                [0, "dev.sh"],
+            ],
+        }
+
     def test_formatting_file_coverage_info(self, mocker, mocked_coverage_file):
         format, formatted_content = UploadSender()._get_format_info(
             mocked_coverage_file
@@ -1,9 +1,14 @@
+import subprocess
+from io import BytesIO
 from unittest.mock import MagicMock
 
 import pytest
 
 from codecov_cli.fallbacks import FallbackFieldEnum
-from codecov_cli.helpers.versioning_systems import GitVersioningSystem
+from codecov_cli.helpers.versioning_systems import (
+    GitVersioningSystem,
+    NoVersioningSystem,
+)
 
 
 class TestGitVersioningSystem(object):
@@ -89,24 +94,66 @@ class TestGitVersioningSystem(object):
         )
 
     def test_list_relevant_files_returns_correct_network_files(self, mocker, tmp_path):
-        mocked_subprocess = MagicMock()
-        mocker.patch(
-            "codecov_cli.helpers.versioning_systems.subprocess.run",
-            return_value=mocked_subprocess,
+        mocked_popen = mocker.patch(
+            "codecov_cli.helpers.versioning_systems.subprocess.Popen"
         )
-        # git ls-files diplays a single \n as \\\\n
-        mocked_subprocess.stdout = b'a.txt\nb.txt\n"a\\\\nb.txt"\nc.txt\nd.txt'
+        process = mocked_popen.return_value.__enter__.return_value
+        process.stdout = BytesIO(
+            b"a.txt\x00b.txt\x00a\nb.txt\x00c d.txt\x00\xc3\xa9.txt\x00"
+        )
+        process.stderr = BytesIO(b"")
+        process.wait.return_value = 0
 
         vs = GitVersioningSystem()
 
         assert vs.list_relevant_files(tmp_path) == [
             "a.txt",
             "b.txt",
-            "a\\nb.txt",
-            "c.txt",
-            "d.txt",
+            "a\nb.txt",
+            "c d.txt",
+            "\u00e9.txt",
+        ]
+        mocked_popen.assert_called_with(
+            ["git", "-C", str(tmp_path), "ls-files", "-z"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+
+    def test_list_relevant_files_across_chunks(self, mocker, tmp_path):
+        mocker.patch("codecov_cli.helpers.versioning_systems.LS_FILES_CHUNK_SIZE", 4)
+        mocked_popen = mocker.patch(
+            "codecov_cli.helpers.versioning_systems.subprocess.Popen"
+        )
+        process = mocked_popen.return_value.__enter__.return_value
+        process.stdout = BytesIO(b"first_file.txt\x00b\x00some/long/path.txt")
+        process.stderr = BytesIO(b"")
+        process.wait.return_value = 0
+
+        vs = GitVersioningSystem()
+
+        assert list(vs.iter_relevant_files(tmp_path)) == [
+            "first_file.txt",
+            "b",
+            "some/long/path.txt",
         ]
 
+    def test_list_relevant_files_logs_git_errors(self, mocker, tmp_path, capsys):
+        mocked_popen = mocker.patch(
+            "codecov_cli.helpers.versioning_systems.subprocess.Popen"
+        )
+        process = mocked_popen.return_value.__enter__.return_value
+        process.stdout = BytesIO(b"")
+        process.stderr = BytesIO(b"fatal: detected dubious ownership in repository")
+        process.wait.return_value = 128
+        process.returncode = 128
+
+        vs = GitVersioningSystem()
+
+        assert vs.list_relevant_files(tmp_path) == []
+        err = capsys.readouterr().err
+        assert "Unable to list the files tracked by git" in err
+        assert "detected dubious ownership" in err
+
     def test_list_relevant_files_fails_if_no_root_is_found(self, mocker):
         mocker.patch(
             "codecov_cli.helpers.versioning_systems.GitVersioningSystem.get_network_root",
@@ -116,3 +163,25 @@ class TestGitVersioningSystem(object):
         vs = GitVersioningSystem()
         with pytest.raises(ValueError) as ex:
             vs.list_relevant_files()
+
+    def test_get_file_blob_ids(self, mocker, tmp_path):
+        def side_effect(command, *args, **kwargs):
+            m = MagicMock()
+            if "-s" in command:
+                m.stdout = b"100644 aaa 0\ta.txt\x00100644 bbb 0\tdir/b c.txt\x00100644 ccc 0\tmodified.txt\x00"
+            if "-m" in command:
+                m.stdout = b"modified.txt\x00"
+            return m
+
+        mocker.patch(
+            "codecov_cli.helpers.versioning_systems.subprocess.run",
+            side_effect=side_effect,
+        )
+
+        vs = GitVersioningSystem()
+
+        assert vs.get_file_blob_ids(root_folder=tmp_path) == {
+            "a.txt": "aaa",
+            "dir/b c.txt": "bbb",
+        }
+        assert NoVersioningSystem().get_file_blob_ids(root_folder=tmp_path) == {}
@@ -1,12 +1,16 @@
 import json
 import pathlib
-from io import BytesIO
+from decimal import Decimal
+from io import BytesIO, StringIO
 from unittest.mock import call
 
+import ijson
 import pytest
 
+from codecov_cli.helpers.encoder import decode_label_indexes
 from codecov_cli.plugins.compress_pycoverage_contexts import CompressPycoverageContexts
 from codecov_cli.plugins.types import PreparationPluginReturn
+from codecov_cli.services.labelanalysis.label_index_file import MappedLabelIndex
 
 sample = {
     "meta": {
@@ -62,23 +66,122 @@ sample = {
 
 
 class TestCompressPycoverageContexts_CompressionFunctions(object):
-    def test_copy_meta(self, mocker):
-        fd_in_mock = BytesIO(bytearray(json.dumps(sample), encoding="utf-8"))
+    def test_copy_entries(self, mocker):
         fd_out_mock = mocker.MagicMock()
         plugin = CompressPycoverageContexts()
-        plugin._copy_meta(fd_in_mock, fd_out_mock)
+        plugin._copy_entries(
+            [("meta", {"version": "6.5.0"}), ("totals", {"percent": Decimal("95.1")})],
+            fd_out_mock,
+        )
         fd_out_mock.write.assert_has_calls(
             [
-                call(
-                    '"meta": {"version": "6.5.0", "timestamp": "2023-05-15T18:35:30.641570", "branch_coverage": false, "show_contexts": true},'
-                ),
-                call(
-                    '"totals": {"covered_lines": 416, "num_statements": 437, "percent_covered": "95.19450800915332", "percent_covered_display": "95", "missing_lines": 21, "excluded_lines": 0},'
-                ),
-            ],
-            any_order=True,
+                call(',"meta": {"version": "6.5.0"}'),
+                call(',"totals": {"percent": "95.1"}'),
+            ]
         )
 
+    def test_compress_report(self):
+        fd_out = StringIO()
+        events = ijson.parse(BytesIO(json.dumps(sample).encode()))
+        plugin = CompressPycoverageContexts()
+        plugin._compress_report(events, fd_out)
+        result = json.loads(fd_out.getvalue())
+        assert set(result.keys()) == {"meta", "totals", "files", "labels_table"}
+        assert result["meta"] == sample["meta"]
+        assert result["totals"]["percent_covered"] == "95.19450800915332"
+        assert result["files"]["awesome.py"]["contexts"] == {
+            "1": [0],
+            "2": [1, 2],
+            "3": [2, 3],
+            "5": [4],
+        }
+        assert result["files"]["__init__.py"]["contexts"] == {}
+
+    def test_compress_report_files_first(self):
+        fd_out = StringIO()
+        report = {"files": {}, "totals": {"covered_lines": 0}, "format": 2}
+        events = ijson.parse(BytesIO(json.dumps(report).encode()))
+        plugin = CompressPycoverageContexts()
+        plugin._compress_report(events, fd_out)
+        assert json.loads(fd_out.getvalue()) == {
+            "files": {},
+            "labels_table": {},
+            "totals": {"covered_lines": 0},
+            "format": 2,
+        }
+
+    def test_compress_report_varint_labels(self):
+        fd_out = StringIO()
+        events = ijson.parse(BytesIO(json.dumps(sample).encode()))
+        plugin = CompressPycoverageContexts({"label_encoding": "varint"})
+        plugin._compress_report(events, fd_out)
+        result = json.loads(fd_out.getvalue())
+        assert result["labels_encoding"] == "varint"
+        contexts = result["files"]["awesome.py"]["contexts"]
+        assert {
+            line: decode_label_indexes(labels) for line, labels in contexts.items()
+        } == {
+            "1": [0],
+            "2": [1, 2],
+            "3": [2, 3],
+            "5": [4],
+        }
+        assert result["labels_table"]["4"] == "label_5"
+
+    def test_build_labels_table(self, tmp_path):
+        file_to_compress = tmp_path / "coverage.json"
+        file_to_compress.write_text(json.dumps(sample))
+        plugin = CompressPycoverageContexts({"file_to_compress": file_to_compress})
+        assert plugin._build_labels_table() == {
+            "": 0,
+            "label_1": 1,
+            "label_2": 2,
+            "label_3": 3,
+            "label_5": 4,
+        }
+
+    @pytest.mark.parametrize("label_encoding", ["list", "varint"])
+    def test_compress_report_in_parallel(self, tmp_path, mocker, label_encoding):
+        mocker.patch(
+            "codecov_cli.plugins.compress_pycoverage_contexts.FILES_PER_CHUNK", 3
+        )
+        report = {
+            "meta": sample["meta"],
+            "files": {
+                f"file_{idx}.py": {
+                    **sample["files"]["awesome.py"],
+                    "contexts": {"1": [f"label_{idx % 4}|run", f"label_{idx}|run"]},
+                }
+                for idx in range(10)
+            },
+        }
+        file_to_compress = tmp_path / "coverage.json"
+        file_to_compress.write_text(json.dumps(report))
+        outputs = []
+        for workers in [1, 2]:
+            plugin = CompressPycoverageContexts(
+                {
+                    "file_to_compress": file_to_compress,
+                    "label_encoding": label_encoding,
+                    "workers": workers,
+                }
+            )
+            labels_table = plugin._build_labels_table() if workers > 1 else None
+            fd_out = StringIO()
+            with open(file_to_compress, "rb") as fd_in:
+                plugin._compress_report(ijson.parse(fd_in), fd_out, labels_table)
+            outputs.append(fd_out.getvalue())
+        assert outputs[0] == outputs[1]
+        assert list(json.loads(outputs[1])["files"]) == [
+            f"file_{idx}.py" for idx in range(10)
+        ]
+
+    def test_compress_report_not_an_object(self):
+        events = ijson.parse(BytesIO(b"[]"))
+        plugin = CompressPycoverageContexts()
+        with pytest.raises(ValueError):
+            plugin._compress_report(events, StringIO())
+
     def test_copy_file_details(self, mocker):
         fd_out_mock = mocker.MagicMock()
         file_name = "awesome.py"
@@ -104,14 +207,8 @@ class TestCompressPycoverageContexts_CompressionFunctions(object):
             nonlocal out_stream
             out_stream += str(msg)
 
-        def seek_site_effect(offset):
-            nonlocal out_stream
-            out_stream = out_stream[:offset]
-
         fd_out_mock = mocker.MagicMock()
         fd_out_mock.write.side_effect = write_side_effect
-        fd_out_mock.tell.side_effect = lambda: len(out_stream)
-        fd_out_mock.seek.side_effect = seek_site_effect
 
         files_in_report = [
             ("awesome.py", sample["files"]["awesome.py"]),
@@ -173,6 +270,8 @@ class TestCompressPycoverageContexts(object):
         plugin = CompressPycoverageContexts()
         assert plugin.config.file_to_compress == pathlib.Path("coverage.json")
         assert plugin.config.delete_uncompressed == True
+        assert plugin.config.label_encoding == "list"
+        assert plugin.config.workers == 1
         assert plugin.file_to_compress == pathlib.Path("coverage.json")
         assert plugin.file_to_write == pathlib.Path("coverage.codecov.json")
 
@@ -187,6 +286,14 @@ class TestCompressPycoverageContexts(object):
         assert plugin.file_to_compress == pathlib.Path("label.coverage.json")
         assert plugin.file_to_write == pathlib.Path("label.coverage.codecov.json")
 
+    def test_run_preparation_unknown_label_encoding(self):
+        plugin = CompressPycoverageContexts({"label_encoding": "roaring"})
+        res = plugin.run_preparation(None)
+        assert res == PreparationPluginReturn(
+            success=False,
+            messages=["label encoding roaring unknown"],
+        )
+
     def test_run_preparation_fail_fast_no_file(self):
         plugin = CompressPycoverageContexts()
         res = plugin.run_preparation(None)
@@ -215,10 +322,9 @@ class TestCompressPycoverageContexts(object):
         mock_ijson = mocker.patch(
             "codecov_cli.plugins.compress_pycoverage_contexts.ijson"
         )
-        mock_ijson.kvitems.return_value = "files_in_report"
-        mock_copy_meta = mocker.patch.object(CompressPycoverageContexts, "_copy_meta")
-        mock_compress_files = mocker.patch.object(
-            CompressPycoverageContexts, "_compress_files"
+        mock_ijson.parse.return_value = "report_events"
+        mock_compress_report = mocker.patch.object(
+            CompressPycoverageContexts, "_compress_report"
         )
 
         config = {"file_to_compress": (tmp_path / "coverage.json")}
@@ -231,14 +337,38 @@ class TestCompressPycoverageContexts(object):
                 call((tmp_path / "coverage.codecov.json"), "w"),
             ]
         )
-        mock_copy_meta.assert_called_with(mock_fd_in, mock_fd_out)
-        mock_ijson.kvitems.assert_called_with(mock_fd_in, "files")
-        mock_compress_files.assert_called_with("files_in_report", mock_fd_out)
+        mock_ijson.parse.assert_called_with(mock_fd_in)
+        mock_compress_report.assert_called_with("report_events", mock_fd_out, None)
         mock_fd_in.close.assert_called()
         mock_fd_out.close.assert_called()
-        mock_fd_out.write.assert_has_calls([call("{"), call("}")])
         assert not (tmp_path / "coverage.json").exists()
 
+    def test_run_preparation_sample_in_parallel(self, tmp_path):
+        file_to_compress = tmp_path / "coverage.json"
+        file_to_compress.write_text(json.dumps(sample))
+        config = {"file_to_compress": file_to_compress, "workers": 2}
+        res = CompressPycoverageContexts(config).run_preparation(None)
+        assert res == PreparationPluginReturn(success=True, messages=[])
+        result = json.loads((tmp_path / "coverage.codecov.json").read_text())
+        assert result["files"]["awesome.py"]["contexts"] == {
+            "1": [0],
+            "2": [1, 2],
+            "3": [2, 3],
+            "5": [4],
+        }
+        assert result["labels_table"]["1"] == "label_1"
+
+    def test_run_preparation_writes_label_index(self, tmp_path):
+        file_to_compress = tmp_path / "coverage.json"
+        file_to_compress.write_text(json.dumps(sample))
+        index_file = tmp_path / "labels.index"
+        config = {"file_to_compress": file_to_compress, "label_index_file": index_file}
+        res = CompressPycoverageContexts(config).run_preparation(None)
+        assert res == PreparationPluginReturn(success=True, messages=[])
+        with MappedLabelIndex(index_file) as label_index:
+            assert label_index.labels[1] == "label_1"
+            assert label_index.get_line_label_indexes("awesome.py", [2]) == {1, 2}
+
     def test_run_preparation_sample(self, tmp_path):
         file_to_compress = tmp_path / "coverage.json"
         file_to_compress.write_text(json.dumps(sample))
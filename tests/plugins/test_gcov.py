@@ -1,4 +1,32 @@
-from codecov_cli.plugins.gcov import GcovPlugin
+import json
+import pathlib
+
+from codecov_cli.plugins.gcov import GcovPlugin, _mangle_path
+
+
+def _gcov_popen_mock(mocker):
+    def gcov_side_effect(command, cwd, **kwargs):
+        stdout = []
+        for path in command[2:]:
+            gcda_path = pathlib.Path(path).with_suffix(".gcda")
+            counters = gcda_path.read_text() if gcda_path.exists() else "0"
+            graph = f"        -:    0:Graph:{path}\n".encode()
+            # Every object covers the same header
+            stdout += [
+                f"        -:    0:Source:src/{pathlib.Path(path).stem}.c\n".encode(),
+                graph,
+                f"        {counters}:    1:int main() {{}}\n".encode(),
+                b"        -:    0:Source:src/common.h\n",
+                graph,
+                b"        1:    1:x\n",
+            ]
+        process = mocker.MagicMock(stdout=iter(stdout), returncode=0)
+        process.__enter__.return_value = process
+        return process
+
+    return mocker.patch(
+        "codecov_cli.plugins.gcov.subprocess.Popen", side_effect=gcov_side_effect
+    )
 
 
 class TestGcov(object):
@@ -25,3 +53,192 @@ class TestGcov(object):
         res = GcovPlugin(tmp_path).run_preparation(collector=None)
 
         assert res.messages == [mock.stdout]
+
+    def test_run_preparation_in_batches(self, mocker, tmp_path):
+        for name in ["a", "b", "c", "d", "e"]:
+            (tmp_path / f"{name}.gcno").touch()
+        mocker.patch("codecov_cli.plugins.gcov.shutil.which", return_value=True)
+        mock_popen = _gcov_popen_mock(mocker)
+
+        res = GcovPlugin(tmp_path, batch_size=2, max_workers=4).run_preparation(
+            collector=None
+        )
+
+        assert mock_popen.call_count == 3
+        for call in mock_popen.call_args_list:
+            assert call.args[0][:2] == ["gcov", "-pbt"]
+            assert call.kwargs["cwd"] == tmp_path
+        assert sorted(res.messages) == [
+            b"Created 2 .gcov files from 1 files",
+            b"Created 4 .gcov files from 2 files",
+            b"Created 4 .gcov files from 2 files",
+        ]
+        gcov_files = sorted(path.name for path in tmp_path.glob("*.gcov"))
+        assert gcov_files == [
+            "src#a.c.gcov",
+            "src#b.c.gcov",
+            "src#c.c.gcov",
+            "src#common.h.1.gcov",
+            "src#common.h.2.gcov",
+            "src#common.h.3.gcov",
+            "src#common.h.4.gcov",
+            "src#common.h.gcov",
+            "src#d.c.gcov",
+            "src#e.c.gcov",
+        ]
+        assert (tmp_path / "src#a.c.gcov").read_bytes() == (
+            b"        -:    0:Source:src/a.c\n"
+            + f"        -:    0:Graph:{tmp_path / 'a.gcno'}\n".encode()
+            + b"        0:    1:int main() {}\n"
+        )
+
+    def test_run_preparation_incremental(self, mocker, tmp_path):
+        for name in ["a", "b", "c"]:
+            (tmp_path / f"{name}.gcno").touch()
+            (tmp_path / f"{name}.gcda").write_text("1")
+        mocker.patch("codecov_cli.plugins.gcov.shutil.which", return_value=True)
+        mock_popen = _gcov_popen_mock(mocker)
+        plugin = GcovPlugin(tmp_path, max_workers=2, manifest_file="gcov.json")
+
+        plugin.run_preparation(collector=None)
+        # Changed objects run in batches too
+        assert mock_popen.call_count == 2
+        assert len(list(tmp_path.glob("*.gcov"))) == 6
+        manifest = json.loads((tmp_path / "gcov.json").read_text())["objects"]
+        for name in ["a", "b", "c"]:
+            outputs = manifest[str(tmp_path / f"{name}.gcno")]["outputs"]
+            assert len(outputs) == 2
+            assert outputs[0] == f"src#{name}.c.gcov"
+            assert (
+                f"Graph:{tmp_path / name}.gcno" in (tmp_path / outputs[1]).read_text()
+            )
+
+        # Nothing changed
+        mock_popen.reset_mock()
+        res = plugin.run_preparation(collector=None)
+        assert res.messages == []
+        assert not mock_popen.called
+        assert len(list(tmp_path.glob("*.gcov"))) == 6
+
+        # Only the object with new counters runs again, its old outputs are replaced
+        (tmp_path / "b.gcda").write_text("5")
+        (tmp_path / "c.gcno").unlink()
+        plugin.run_preparation(collector=None)
+        assert mock_popen.call_count == 1
+        assert mock_popen.call_args.args[0][2:] == [str(tmp_path / "b.gcno")]
+        gcov_files = sorted(path.name for path in tmp_path.glob("*.gcov"))
+        # One copy of the header for a, one for b
+        assert len(gcov_files) == 4
+        assert gcov_files[:2] == ["src#a.c.gcov", "src#b.c.gcov"]
+        assert all(name.startswith("src#common.h.") for name in gcov_files[2:])
+        assert b"5:    1:" in (tmp_path / "src#b.c.gcov").read_bytes()
+
+    def test_run_preparation_incremental_unknown_object(self, mocker, tmp_path):
+        for name in ["a", "b"]:
+            (tmp_path / f"{name}.gcno").touch()
+        mocker.patch("codecov_cli.plugins.gcov.shutil.which", return_value=True)
+
+        def gcov_side_effect(command, cwd, **kwargs):
+            # gcov ran with -o, the graph is not the file it was given
+            stdout = [
+                b"        -:    0:Source:src/a.c\n",
+                b"        -:    0:Graph:objects/a.gcno\n",
+                b"        1:    1:x\n",
+            ]
+            process = mocker.MagicMock(stdout=iter(stdout), returncode=0)
+            process.__enter__.return_value = process
+            return process
+
+        mocker.patch(
+            "codecov_cli.plugins.gcov.subprocess.Popen", side_effect=gcov_side_effect
+        )
+        GcovPlugin(tmp_path, max_workers=1, manifest_file="gcov.json").run_preparation(
+            None
+        )
+        manifest = json.loads((tmp_path / "gcov.json").read_text())["objects"]
+        assert manifest[str(tmp_path / "a.gcno")]["outputs"] == ["src#a.c.gcov"]
+        assert manifest[str(tmp_path / "b.gcno")]["outputs"] == ["src#a.c.gcov"]
+
+    def test_run_preparation_incremental_manifest_not_saved(
+        self, mocker, tmp_path, capsys
+    ):
+        (tmp_path / "a.gcno").touch()
+        mocker.patch("codecov_cli.plugins.gcov.shutil.which", return_value=True)
+        _gcov_popen_mock(mocker)
+
+        res = GcovPlugin(tmp_path, manifest_file="missing/gcov.json").run_preparation(
+            None
+        )
+        assert res.success
+        assert sorted(path.name for path in tmp_path.glob("*.gcov")) == [
+            "src#a.c.gcov",
+            "src#common.h.gcov",
+        ]
+        assert "Unable to save gcov manifest" in capsys.readouterr().err
+
+    def test_run_preparation_incremental_invalid_manifest(self, mocker, tmp_path):
+        (tmp_path / "a.gcno").touch()
+        (tmp_path / "gcov.json").write_text("not json")
+        mocker.patch("codecov_cli.plugins.gcov.shutil.which", return_value=True)
+        mock_popen = _gcov_popen_mock(mocker)
+
+        GcovPlugin(tmp_path, manifest_file="gcov.json").run_preparation(None)
+        assert mock_popen.call_count == 1
+        assert json.loads((tmp_path / "gcov.json").read_text())["objects"][
+            str(tmp_path / "a.gcno")
+        ]["outputs"] == ["src#a.c.gcov", "src#common.h.gcov"]
+
+    def test_run_preparation_lcov(self, mocker, tmp_path):
+        for name in ["a", "b", "c"]:
+            (tmp_path / f"{name}.gcno").touch()
+        mocker.patch("codecov_cli.plugins.gcov.shutil.which", return_value=True)
+
+        def gcov_side_effect(command, cwd, **kwargs):
+            stdout = []
+            for path in command[4:]:
+                gcov_object = {
+                    "current_working_directory": str(cwd),
+                    "files": [
+                        {
+                            "file": "src/common.h",
+                            "functions": [],
+                            "lines": [{"line_number": 1, "count": 1, "branches": []}],
+                        }
+                    ],
+                }
+                stdout.append(json.dumps(gcov_object).encode() + b"\n")
+            process = mocker.MagicMock(stdout=iter(stdout), returncode=0)
+            process.__enter__.return_value = process
+            return process
+
+        mock_popen = mocker.patch(
+            "codecov_cli.plugins.gcov.subprocess.Popen", side_effect=gcov_side_effect
+        )
+        res = GcovPlugin(
+            tmp_path, batch_size=2, max_workers=2, output_format="lcov"
+        ).run_preparation(collector=None)
+
+        assert mock_popen.call_count == 2
+        for call in mock_popen.call_args_list:
+            assert call.args[0][:4] == ["gcov", "-b", "--json-format", "--stdout"]
+            assert call.kwargs["cwd"] == tmp_path
+        assert res.messages == [
+            f"Wrote 1 sources from 3 files to {tmp_path / 'coverage.gcov.lcov'}".encode()
+        ]
+        assert "DA:1,3\n" in (tmp_path / "coverage.gcov.lcov").read_text()
+        assert not list(tmp_path.glob("*.gcov"))
+
+    def test_split_in_batches(self, tmp_path):
+        paths = [f"{idx}.gcno" for idx in range(10)]
+        assert GcovPlugin(tmp_path, batch_size=4, max_workers=1)._split_in_batches(
+            paths
+        ) == [paths[0:4], paths[4:8], paths[8:10]]
+        # Split across workers even if batches would be smaller than batch_size
+        assert GcovPlugin(tmp_path, batch_size=100, max_workers=2)._split_in_batches(
+            paths
+        ) == [paths[0:5], paths[5:10]]
+
+    def test_mangle_path(self):
+        assert _mangle_path(b"src/a.c") == "src#a.c"
+        assert _mangle_path(b"../include/b.h") == "^#include#b.h"
+        assert _mangle_path(b"/usr/include/stdio.h") == "#usr#include#stdio.h"
@@ -0,0 +1,137 @@
+import io
+import json
+
+from codecov_cli.plugins.gcov_json import MergedGcovReport, add_gcov_json_output
+
+
+def _gcov_object(data_file, files):
+    return {
+        "format_version": "1",
+        "gcc_version": "12.2.0",
+        "current_working_directory": "/project/build",
+        "data_file": data_file,
+        "files": files,
+    }
+
+
+object_a = _gcov_object(
+    "a.gcno",
+    [
+        {
+            "file": "../src/a.c",
+            "functions": [
+                {"name": "f_a", "start_line": 2, "execution_count": 3},
+            ],
+            "lines": [
+                {"line_number": 2, "count": 3, "branches": []},
+                {
+                    "line_number": 3,
+                    "count": 3,
+                    "branches": [{"count": 3}, {"count": 0}],
+                },
+                {"line_number": 4, "count": 0, "branches": []},
+            ],
+        },
+        {
+            "file": "/project/src/common.h",
+            "functions": [
+                {"name": "twice", "start_line": 1, "execution_count": 3},
+            ],
+            "lines": [{"line_number": 1, "count": 3, "branches": []}],
+        },
+    ],
+)
+object_b = _gcov_object(
+    "b.gcno",
+    [
+        {
+            "file": "/project/src/common.h",
+            "functions": [
+                {"name": "twice", "start_line": 1, "execution_count": 2},
+            ],
+            "lines": [{"line_number": 1, "count": 2, "branches": []}],
+        },
+        {
+            "file": "/usr/include/stdio.h",
+            "functions": [],
+            "lines": [{"line_number": 10, "count": 0, "branches": [{"count": 0}]}],
+        },
+    ],
+)
+
+
+def test_add_gcov_json_output():
+    report = MergedGcovReport()
+    stdout = [
+        json.dumps(object_a).encode() + b"\n",
+        b"\n",
+        json.dumps(object_b).encode() + b"\n",
+    ]
+    assert add_gcov_json_output(report, stdout, "/project") == 2
+    assert report.lines == {
+        "src/a.c": {2: 3, 3: 3, 4: 0},
+        "src/common.h": {1: 5},
+        "/usr/include/stdio.h": {10: 0},
+    }
+    assert report.branches["src/a.c"] == {3: {0: 3, 1: 0}}
+    assert report.functions["src/common.h"] == {"twice": [1, 5]}
+
+
+def test_merge_reports():
+    report = MergedGcovReport()
+    report.add_object(object_a, "/project")
+    other_report = MergedGcovReport()
+    other_report.add_object(object_a, "/project")
+    other_report.add_object(object_b, "/project")
+    report.merge(other_report)
+    assert report.lines["src/a.c"] == {2: 6, 3: 6, 4: 0}
+    assert report.lines["src/common.h"] == {1: 8}
+    assert report.branches["src/a.c"] == {3: {0: 6, 1: 0}}
+    assert report.functions["src/a.c"] == {"f_a": [2, 6]}
+
+
+def test_write_lcov():
+    report = MergedGcovReport()
+    report.add_object(object_a, "/project")
+    report.add_object(object_b, "/project")
+    fd_out = io.StringIO()
+    assert report.write_lcov(fd_out) == 3
+    assert fd_out.getvalue().split("\n") == [
+        "SF:/usr/include/stdio.h",
+        "FNF:0",
+        "FNH:0",
+        "BRDA:10,0,0,-",
+        "BRF:1",
+        "BRH:0",
+        "DA:10,0",
+        "LF:1",
+        "LH:0",
+        "end_of_record",
+        "SF:src/a.c",
+        "FN:2,f_a",
+        "FNDA:3,f_a",
+        "FNF:1",
+        "FNH:1",
+        "BRDA:3,0,0,3",
+        "BRDA:3,0,1,0",
+        "BRF:2",
+        "BRH:1",
+        "DA:2,3",
+        "DA:3,3",
+        "DA:4,0",
+        "LF:3",
+        "LH:2",
+        "end_of_record",
+        "SF:src/common.h",
+        "FN:1,twice",
+        "FNDA:5,twice",
+        "FNF:1",
+        "FNH:1",
+        "BRF:0",
+        "BRH:0",
+        "DA:1,5",
+        "LF:1",
+        "LH:1",
+        "end_of_record",
+        "",
+    ]
@@ -108,12 +108,32 @@ def test_load_plugin_from_yaml_empty_params(mocker):
 def test_get_plugin_gcov():
     res = _get_plugin({}, "gcov")
     assert isinstance(res, GcovPlugin)
+    assert res.batch_size == 500
+    assert res.manifest_file is None
+    assert res.output_format == "gcov"
+
+    gcov_config = {
+        "batch_size": 10,
+        "max_workers": 3,
+        "manifest_file": "gcov-manifest.json",
+        "output_format": "lcov",
+    }
+    res = _get_plugin({"plugins": {"gcov": gcov_config}}, "gcov")
+    assert isinstance(res, GcovPlugin)
+    assert res.batch_size == 10
+    assert res.max_workers == 3
+    assert res.manifest_file == res.project_root / "gcov-manifest.json"
+    assert res.output_format == "lcov"
 
 
 def test_get_plugin_xcode():
     res = _get_plugin({}, "xcode")
     assert isinstance(res, XcodePlugin)
 
+    res = _get_plugin({"plugins": {"xcode": {"max_workers": 2}}}, "xcode")
+    assert isinstance(res, XcodePlugin)
+    assert res.max_workers == 2
+
 
 def test_get_plugin_pycoverage():
     res = _get_plugin({}, "pycoverage")
@@ -1,34 +1,36 @@
+import json
 import pathlib
-from unittest.mock import MagicMock
+import subprocess
 
 import pytest
+from coverage import CoverageData
 
 from codecov_cli.helpers.folder_searcher import globs_to_regex
 from codecov_cli.plugins.pycoverage import Pycoverage
+from codecov_cli.plugins.types import PreparationPluginReturn
 
 
-@pytest.fixture
-def xml_subprocess_mock(mocker):
-    def xml_subprocess_side_effect(*args, cwd, **kwargs):
-        (cwd / "coverage.xml").touch()
-        return mocker.MagicMock(stdout=b"Wrote XML report to coverage.xml\n")
+def _popen_mock(mocker, report_file, output, returncode=0):
+    def popen_side_effect(*args, cwd, **kwargs):
+        (cwd / report_file).touch()
+        process = mocker.MagicMock(stdout=iter([output]), returncode=returncode)
+        process.__enter__.return_value = process
+        return process
 
-    yield mocker.patch(
-        "codecov_cli.plugins.pycoverage.subprocess.run",
-        side_effect=xml_subprocess_side_effect,
+    return mocker.patch(
+        "codecov_cli.plugins.pycoverage.subprocess.Popen",
+        side_effect=popen_side_effect,
     )
 
 
 @pytest.fixture
-def json_subprocess_mock(mocker):
-    def json_subprocess_side_effect(*args, cwd, **kwargs):
-        (cwd / "coverage.json").touch()
-        return mocker.MagicMock(stdout=b"Wrote JSON report to coverage.json\n")
+def xml_subprocess_mock(mocker):
+    yield _popen_mock(mocker, "coverage.xml", "Wrote XML report to coverage.xml\n")
 
-    yield mocker.patch(
-        "codecov_cli.plugins.pycoverage.subprocess.run",
-        side_effect=json_subprocess_side_effect,
-    )
+
+@pytest.fixture
+def json_subprocess_mock(mocker):
+    yield _popen_mock(mocker, "coverage.json", "Wrote JSON report to coverage.json\n")
 
 
 @pytest.fixture
@@ -48,6 +50,7 @@ def combine_subprocess_mock(mocker):
 def mocked_generator(mocker):
     def generate_XML_report_side_effect(working_dir, *args, **kwargs):
         (working_dir / "coverage.xml").touch()
+        return PreparationPluginReturn(success=True, messages=[])
 
     yield mocker.patch.object(
         Pycoverage,
@@ -66,9 +69,7 @@ class TestPycoveragePathToCoverage(object):
         plugin = Pycoverage(config)
 
         mock_search_path = mocker.patch("codecov_cli.plugins.pycoverage.search_files")
-        path = plugin._get_path_to_coverage()
-        assert path == pathlib.Path.joinpath(tmp_path, ".coverage")
-        assert path.parent == tmp_path
+        assert plugin._get_coverage_dirs() == [tmp_path]
         mock_search_path.assert_not_called()
 
     def test_path_from_config_fallback(self, tmp_path, mocker):
@@ -78,19 +79,27 @@ class TestPycoveragePathToCoverage(object):
         }
         plugin = Pycoverage(config)
 
-        mock_search_path_return = MagicMock()
         mock_search_path = mocker.patch(
             "codecov_cli.plugins.pycoverage.search_files",
-            return_value=mock_search_path_return,
+            return_value=iter([tmp_path / "a" / ".coverage"]),
         )
-        path = plugin._get_path_to_coverage()
+        assert plugin._get_coverage_dirs() == [tmp_path / "a"]
         mock_search_path.assert_called_with(
             tmp_path,
             [],
             filename_include_regex=globs_to_regex([".coverage", ".coverage.*"]),
             filename_exclude_regex=None,
         )
-        assert path == mock_search_path_return.__next__.return_value
+
+    def test_all_dirs_found_once(self, tmp_path):
+        for name in ["a/.coverage", "a/.coverage.1", "b/c/.coverage.1"]:
+            (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+            (tmp_path / name).touch()
+        config = {"project_root": tmp_path}
+        assert sorted(Pycoverage(config)._get_coverage_dirs()) == [
+            tmp_path / "a",
+            tmp_path / "b" / "c",
+        ]
 
 
 class TestPycoverageXMLReportGeneration(object):
@@ -115,6 +124,33 @@ class TestPycoverageXMLReportGeneration(object):
         )
         assert (tmp_path / ".coverage").exists()
 
+    def test_parallel_combine_if_configured(
+        self, tmp_path, mocker, xml_subprocess_mock
+    ):
+        mock_combine = mocker.patch(
+            "codecov_cli.plugins.pycoverage.combine_coverage_data_files"
+        )
+        (tmp_path / ".coverage.a").touch()
+        config = {"project_root": tmp_path, "parallel_combine": True}
+        Pycoverage(config)._generate_XML_report(tmp_path)
+        mock_combine.assert_called_with(tmp_path, None)
+        for call in xml_subprocess_mock.call_args_list:
+            assert call.args[0][1] != "combine"
+
+    def test_parallel_combine_falls_back_to_coverage_combine(
+        self, tmp_path, mocker, combine_subprocess_mock
+    ):
+        mocker.patch(
+            "codecov_cli.plugins.pycoverage.combine_coverage_data_files",
+            side_effect=ValueError("Can't combine line data with branch data"),
+        )
+        (tmp_path / ".coverage.a").touch()
+        config = {"project_root": tmp_path, "parallel_combine": True}
+        Pycoverage(config)._generate_XML_report(tmp_path)
+        combine_subprocess_mock.assert_any_call(
+            ["coverage", "combine", "-a"], cwd=tmp_path
+        )
+
     def test_xml_reports_generated_if_coverage_file_exists(
         self, tmp_path, mocker, xml_subprocess_mock
     ):
@@ -126,10 +162,22 @@ class TestPycoverageXMLReportGeneration(object):
         (tmp_path / ".coverage").touch()
         Pycoverage(config)._generate_XML_report(tmp_path)
         xml_subprocess_mock.assert_called_with(
-            ["coverage", "xml", "-i"], cwd=tmp_path, capture_output=True
+            ["coverage", "xml", "-i"],
+            cwd=tmp_path,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
         )
         assert (tmp_path / ".coverage").exists()
 
+    def test_xml_report_failure(self, tmp_path, mocker):
+        _popen_mock(mocker, "coverage.xml", "No data to report.\n", returncode=1)
+        config = {"project_root": tmp_path}
+        (tmp_path / ".coverage").touch()
+        res = Pycoverage(config)._generate_XML_report(tmp_path)
+        assert not res.success
+        assert res.messages == [f"coverage xml failed in {tmp_path}."]
+
 
 class TestPycoverageJSONReportGeneration(object):
     def test_report_not_generated_if_coverage_not_there(
@@ -146,7 +194,11 @@ class TestPycoverageJSONReportGeneration(object):
         (tmp_path / ".coverage").touch()
         Pycoverage(config)._generate_JSON_report(tmp_path)
         json_subprocess_mock.assert_called_with(
-            ["coverage", "json", "--show-contexts"], cwd=tmp_path, capture_output=True
+            ["coverage", "json", "--show-contexts"],
+            cwd=tmp_path,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
         )
         assert (tmp_path / ".coverage").exists()
 
@@ -157,7 +209,11 @@ class TestPycoverageJSONReportGeneration(object):
         (tmp_path / ".coverage").touch()
         Pycoverage(config)._generate_JSON_report(tmp_path)
         json_subprocess_mock.assert_called_with(
-            ["coverage", "json"], cwd=tmp_path, capture_output=True
+            ["coverage", "json"],
+            cwd=tmp_path,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
         )
 
 
@@ -169,7 +225,7 @@ class TestPycoverageRunPreparation(object):
         config = {"project_root": tmp_path}
         Pycoverage(config).run_preparation(None)
         assert (tmp_path / "coverage.xml").exists()
-        mocked_generator.assert_called_with(tmp_path)
+        mocked_generator.assert_called_with(tmp_path, None)
 
     def test_run_preparation_creates_reports_in_sub_dirs(
         self, mocked_generator, tmp_path, mocker
@@ -180,7 +236,41 @@ class TestPycoverageRunPreparation(object):
         Pycoverage(config).run_preparation(None)
 
         assert (tmp_path / "sub" / "coverage.xml").exists()
-        mocked_generator.assert_called_with(tmp_path / "sub")
+        mocked_generator.assert_called_with(tmp_path / "sub", None)
+
+    def test_run_preparation_creates_reports_in_every_dir(
+        self, mocked_generator, tmp_path, mocker
+    ):
+        for package in ["a", "b", "c"]:
+            (tmp_path / package).mkdir()
+            (tmp_path / package / ".coverage").touch()
+        config = {"project_root": tmp_path, "max_workers": 2}
+        res = Pycoverage(config).run_preparation(None)
+
+        assert res.success
+        for package in ["a", "b", "c"]:
+            assert (tmp_path / package / "coverage.xml").exists()
+            mocked_generator.assert_any_call(tmp_path / package, mocker.ANY)
+        assert mocked_generator.call_count == 3
+
+    def test_run_preparation_splits_combine_workers_across_dirs(
+        self, tmp_path, mocker, xml_subprocess_mock
+    ):
+        mocker.patch("codecov_cli.plugins.pycoverage.os.cpu_count", return_value=8)
+        mock_combine = mocker.patch(
+            "codecov_cli.plugins.pycoverage.combine_coverage_data_files"
+        )
+        for package in ["a", "b", "c"]:
+            (tmp_path / package).mkdir()
+            (tmp_path / package / ".coverage.1").touch()
+        config = {"project_root": tmp_path, "max_workers": 2, "parallel_combine": True}
+        res = Pycoverage(config).run_preparation(None)
+
+        assert res.success
+        # 2 folders combine at the same time, with half of the cores each
+        for package in ["a", "b", "c"]:
+            mock_combine.assert_any_call(tmp_path / package, 4)
+        assert mock_combine.call_count == 3
 
     def test_aborts_plugin_if_coverage_is_not_installed(
         self, tmp_path, mocker, mocked_generator
@@ -197,3 +287,74 @@ class TestPycoverageRunPreparation(object):
         Pycoverage(config).run_preparation(None)
         assert not (tmp_path / "coverage.xml").exists()
         assert not mocked_generator.called
+
+
+class TestPycoverageCodecovReportGeneration(object):
+    def test_report_not_generated_if_coverage_not_there(self, tmp_path):
+        config = {"project_root": tmp_path, "report_type": "codecov"}
+        res = Pycoverage(config)._generate_codecov_report(tmp_path)
+        assert not res.success
+        assert not (tmp_path / "coverage.codecov.json").exists()
+
+    def test_report_generated_from_coverage_data(self, tmp_path):
+        (tmp_path / "a.py").write_text("a = 1\nb = 2\nc = 3\n")
+        data = CoverageData(basename=str(tmp_path / ".coverage"))
+        data.set_context("test_a")
+        data.add_lines({str(tmp_path / "a.py"): [1, 2]})
+        data.write()
+        config = {"project_root": tmp_path, "report_type": "codecov"}
+        res = Pycoverage(config)._generate_codecov_report(tmp_path)
+        assert res.success
+        report = json.loads((tmp_path / "coverage.codecov.json").read_text())
+        assert report["files"]["a.py"]["executed_lines"] == [1, 2]
+        assert report["files"]["a.py"]["missing_lines"] == [3]
+        assert report["labels_table"] == {"0": "test_a"}
+
+    def test_report_not_generated_if_source_missing(self, tmp_path):
+        data = CoverageData(basename=str(tmp_path / ".coverage"))
+        data.add_lines({str(tmp_path / "a.py"): [1]})
+        data.write()
+        config = {"project_root": tmp_path, "report_type": "codecov"}
+        res = Pycoverage(config)._generate_codecov_report(tmp_path)
+        assert not res.success
+        assert not (tmp_path / "coverage.codecov.json").exists()
+
+    def test_report_not_generated_if_config_invalid(self, tmp_path, capsys):
+        (tmp_path / "a.py").write_text("a = 1\n")
+        (tmp_path / ".coveragerc").write_text("[run]\nbranch = maybe\n")
+        data = CoverageData(basename=str(tmp_path / ".coverage"))
+        data.add_lines({str(tmp_path / "a.py"): [1]})
+        data.write()
+        config = {"project_root": tmp_path, "report_type": "codecov"}
+        res = Pycoverage(config)._generate_codecov_report(tmp_path)
+        assert not res.success
+        assert not (tmp_path / "coverage.codecov.json").exists()
+        assert "Couldn't read config file" in capsys.readouterr().err
+
+    def test_falls_back_to_json_if_coverage_not_importable(
+        self, tmp_path, mocker, json_subprocess_mock
+    ):
+        mocker.patch(
+            "codecov_cli.plugins.pycoverage.importlib.util.find_spec",
+            return_value=None,
+        )
+        mocker.patch(
+            "codecov_cli.plugins.pycoverage.shutil.which",
+            return_value="/usr/bin/coverage",
+        )
+        (tmp_path / ".coverage").touch()
+        config = {"project_root": tmp_path, "report_type": "codecov"}
+        res = Pycoverage(config)._generate_codecov_report(tmp_path)
+        assert res.success
+        assert (tmp_path / "coverage.json").exists()
+        assert not (tmp_path / "coverage.codecov.json").exists()
+
+    def test_run_preparation_doesnt_need_coverage_installed(self, tmp_path, mocker):
+        mocker.patch("codecov_cli.plugins.pycoverage.shutil.which", return_value=None)
+        (tmp_path / "a.py").write_text("a = 1\n")
+        data = CoverageData(basename=str(tmp_path / ".coverage"))
+        data.add_lines({str(tmp_path / "a.py"): [1]})
+        data.write()
+        config = {"project_root": tmp_path, "report_type": "codecov"}
+        Pycoverage(config).run_preparation(None)
+        assert (tmp_path / "coverage.codecov.json").exists()
@@ -0,0 +1,253 @@
+import io
+import json
+
+import pytest
+from coverage import CoverageData
+
+from codecov_cli.plugins.pycoverage_sqlite import (
+    combine_coverage_data_files,
+    load_source_analysis,
+    merge_coverage_data,
+    numbits_to_lines,
+    numbits_union,
+    write_codecov_report_from_coverage_data,
+)
+
+
+def _write_coverage_data(path, context, lines=None, arcs=None):
+    data = CoverageData(basename=str(path))
+    data.set_context(context)
+    if lines is not None:
+        data.add_lines(lines)
+    if arcs is not None:
+        data.add_arcs(arcs)
+    data.write()
+
+
+def _read_coverage_data(path):
+    data = CoverageData(basename=str(path))
+    data.read()
+    return data
+
+
+def test_numbits_to_lines():
+    assert numbits_to_lines(b"") == []
+    assert numbits_to_lines(bytes([0b00000110, 0, 0b10000001])) == [1, 2, 16, 23]
+
+
+def test_write_report_with_contexts(tmp_path):
+    data = CoverageData(basename=str(tmp_path / ".coverage"))
+    data.set_context("test_a|run")
+    data.add_lines({str(tmp_path / "a.py"): [1, 2, 10], "/elsewhere/b.py": [3]})
+    data.set_context("test_b|run")
+    data.add_lines({str(tmp_path / "a.py"): [2, 4]})
+    data.write()
+
+    analyses = {
+        str(tmp_path / "a.py"): ([1, 2, 3, 4, 10, 11], [12], [3, 11]),
+        "/elsewhere/b.py": ([3], [], []),
+    }
+
+    output = io.StringIO()
+    files_written = write_codecov_report_from_coverage_data(
+        tmp_path / ".coverage", output, analyses.get, relative_to=tmp_path
+    )
+    report = json.loads(output.getvalue())
+    assert files_written == 2
+    assert report["meta"]["branch_coverage"] is False
+    assert report["labels_table"] == {"0": "test_a", "1": "test_b"}
+    assert report["files"]["a.py"] == {
+        "executed_lines": [1, 2, 4, 10],
+        "summary": {
+            "covered_lines": 4,
+            "num_statements": 6,
+            "missing_lines": 2,
+            "excluded_lines": 1,
+        },
+        "missing_lines": [3, 11],
+        "excluded_lines": [12],
+        "contexts": {"1": [0], "2": [0, 1], "4": [1], "10": [0]},
+    }
+    # Files outside of the folder keep their absolute path
+    assert report["files"]["/elsewhere/b.py"]["executed_lines"] == [3]
+    assert report["files"]["/elsewhere/b.py"]["contexts"] == {"3": [0]}
+
+
+def test_write_report_with_arcs_no_contexts(tmp_path):
+    data = CoverageData(basename=str(tmp_path / ".coverage"))
+    data.set_context("test_a")
+    data.add_arcs({str(tmp_path / "a.py"): [(-1, 1), (1, 2), (2, 5), (5, -1)]})
+    data.write()
+
+    output = io.StringIO()
+    write_codecov_report_from_coverage_data(
+        tmp_path / ".coverage",
+        output,
+        lambda path: ([1, 2, 3, 5], [], [3]),
+        include_contexts=False,
+        relative_to=tmp_path,
+    )
+    report = json.loads(output.getvalue())
+    # Branches themselves are not exported
+    assert report["meta"]["branch_coverage"] is False
+    assert "labels_table" not in report
+    assert report["files"] == {
+        "a.py": {
+            "executed_lines": [1, 2, 5],
+            "summary": {
+                "covered_lines": 3,
+                "num_statements": 4,
+                "missing_lines": 1,
+                "excluded_lines": 0,
+            },
+            "missing_lines": [3],
+            "excluded_lines": [],
+        }
+    }
+
+
+def test_write_report_skips_files_without_analysis(tmp_path):
+    data = CoverageData(basename=str(tmp_path / ".coverage"))
+    data.add_lines({"/a.py": [1], "/b.py": [1]})
+    data.write()
+
+    output = io.StringIO()
+    files_written = write_codecov_report_from_coverage_data(
+        tmp_path / ".coverage", output, {"/b.py": ([1], [], [])}.get
+    )
+    assert files_written == 1
+    assert list(json.loads(output.getvalue())["files"]) == ["/b.py"]
+
+
+def test_write_report_empty_data(tmp_path):
+    data = CoverageData(basename=str(tmp_path / ".coverage"))
+    data.add_lines({})
+    data.write()
+
+    output = io.StringIO()
+    assert (
+        write_codecov_report_from_coverage_data(
+            tmp_path / ".coverage", output, lambda path: ([], [], [])
+        )
+        == 0
+    )
+    assert json.loads(output.getvalue())["files"] == {}
+
+
+def test_load_source_analysis(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.py").write_text(
+        "x = 1\nif x:\n    y = 2\nelse:\n    y = 3  # pragma: no cover\nz = 4\n"
+    )
+    source = str(tmp_path / "a.py")
+    _write_coverage_data(tmp_path / ".coverage", "", lines={source: [1, 2]})
+
+    analyse_file = load_source_analysis(tmp_path / ".coverage")
+    statements, excluded, missing = analyse_file(source)
+    assert statements == [1, 2, 3, 6]
+    assert excluded == [5]
+    assert missing == [3, 6]
+
+
+def test_load_source_analysis_missing_source(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    source = str(tmp_path / "a.py")
+    _write_coverage_data(tmp_path / ".coverage", "", lines={source: [1]})
+
+    with pytest.raises(ValueError):
+        load_source_analysis(tmp_path / ".coverage")(source)
+
+    (tmp_path / ".coveragerc").write_text("[report]\nignore_errors = True\n")
+    assert load_source_analysis(tmp_path / ".coverage")(source) is None
+
+
+def test_load_source_analysis_invalid_config(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _write_coverage_data(tmp_path / ".coverage", "", lines={"/a.py": [1]})
+    (tmp_path / ".coveragerc").write_text("[run]\nbranch = maybe\n")
+
+    with pytest.raises(ValueError, match="Couldn't read config file"):
+        load_source_analysis(tmp_path / ".coverage")
+
+
+def test_numbits_union():
+    assert numbits_union(b"", b"") == b""
+    assert numbits_union(bytes([1, 2]), bytes([4])) == bytes([5, 2])
+
+
+def test_merge_coverage_data(tmp_path):
+    _write_coverage_data(tmp_path / "a", "test_a", lines={"/a.py": [1, 2]})
+    _write_coverage_data(
+        tmp_path / "b", "test_a", lines={"/a.py": [2, 3], "/b.py": [1]}
+    )
+    merge_coverage_data(tmp_path / "a", tmp_path / "b")
+    # Merging is idempotent
+    merge_coverage_data(tmp_path / "a", tmp_path / "b")
+
+    data = _read_coverage_data(tmp_path / "a")
+    assert data.measured_files() == {"/a.py", "/b.py"}
+    assert sorted(data.lines("/a.py")) == [1, 2, 3]
+    assert data.measured_contexts() == {"test_a"}
+
+
+def test_combine_coverage_data_files(tmp_path):
+    _write_coverage_data(tmp_path / ".coverage", "existing", lines={"/a.py": [1]})
+    for idx in range(5):
+        _write_coverage_data(
+            tmp_path / f".coverage.shard{idx}",
+            f"test_{idx}",
+            lines={"/a.py": [idx + 2], f"/{idx}.py": [1]},
+        )
+
+    assert combine_coverage_data_files(tmp_path, max_workers=2) == (
+        tmp_path / ".coverage"
+    )
+    assert list(tmp_path.glob(".coverage*")) == [tmp_path / ".coverage"]
+    data = _read_coverage_data(tmp_path / ".coverage")
+    assert sorted(data.lines("/a.py")) == [1, 2, 3, 4, 5, 6]
+    assert data.measured_files() == {
+        "/a.py",
+        "/0.py",
+        "/1.py",
+        "/2.py",
+        "/3.py",
+        "/4.py",
+    }
+    assert data.measured_contexts() == {"existing"} | {
+        f"test_{idx}" for idx in range(5)
+    }
+
+
+def test_combine_coverage_data_files_without_coverage_file(tmp_path):
+    _write_coverage_data(
+        tmp_path / ".coverage.shard0", "test_0", arcs={"/a.py": [(-1, 1), (1, -1)]}
+    )
+    _write_coverage_data(
+        tmp_path / ".coverage.shard1", "test_1", arcs={"/a.py": [(-1, 2), (2, -1)]}
+    )
+
+    combine_coverage_data_files(tmp_path)
+    assert list(tmp_path.glob(".coverage*")) == [tmp_path / ".coverage"]
+    data = _read_coverage_data(tmp_path / ".coverage")
+    assert data.has_arcs()
+    assert sorted(data.arcs("/a.py")) == [(-1, 1), (-1, 2), (1, -1), (2, -1)]
+
+
+def test_combine_coverage_data_files_nothing_to_combine(tmp_path):
+    assert combine_coverage_data_files(tmp_path) is None
+    assert not (tmp_path / ".coverage").exists()
+
+
+def test_combine_coverage_data_files_lines_and_arcs(tmp_path):
+    _write_coverage_data(tmp_path / ".coverage.shard0", "test_0", lines={"/a.py": [1]})
+    _write_coverage_data(
+        tmp_path / ".coverage.shard1", "test_1", arcs={"/a.py": [(-1, 1)]}
+    )
+
+    with pytest.raises(ValueError):
+        combine_coverage_data_files(tmp_path)
+    # Nothing was changed
+    assert sorted(tmp_path.glob(".coverage*")) == [
+        tmp_path / ".coverage.shard0",
+        tmp_path / ".coverage.shard1",
+    ]
@@ -1,8 +1,10 @@
+import os
 import pathlib
 from functools import partial
 
 import pytest
 
+import codecov_cli.plugins.xcode
 from codecov_cli.plugins.xcode import XcodePlugin
 from tests.test_helpers import parse_outstreams_into_log_lines
 
@@ -117,3 +119,56 @@ class TestXcode(object):
         file_path = pathlib.Path("llvm-output-test")
         assert file_path.is_file()
         file_path.unlink()
+
+    def test_finds_bundles_in_one_walk(self, tmp_path, mocker):
+        build_dir = tmp_path / "Build"
+        for bundle in ["Tests.xctest", "App.app", "Kit.framework", "App.dSYM"]:
+            (build_dir / "Products" / bundle).mkdir(parents=True)
+        search_files = mocker.spy(codecov_cli.plugins.xcode, "search_files")
+
+        bundles = XcodePlugin()._find_bundles(build_dir)
+
+        assert search_files.call_count == 1
+        assert bundles == [
+            (build_dir / "Products" / "App.app", "app"),
+            (build_dir / "Products" / "Kit.framework", "framework"),
+            (build_dir / "Products" / "Tests.xctest", "xctest"),
+        ]
+
+    def test_run_preparation_with_stub_llvm_cov(self, tmp_path, mocker, monkeypatch):
+        # A stub xcrun, so llvm-cov can run without a Mac
+        bin_dir = tmp_path / "bin"
+        bin_dir.mkdir()
+        xcrun = bin_dir / "xcrun"
+        xcrun.write_text(
+            '#!/bin/sh\n# xcrun llvm-cov show -instr-profile <profile> <binary>\necho "$5:"\necho "    1|    1|func run() {}"\n'
+        )
+        xcrun.chmod(0o755)
+        monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+        monkeypatch.chdir(tmp_path)
+
+        derived_data = tmp_path / "DerivedData"
+        build_dir = derived_data / "Project" / "Build"
+        profiles_dir = build_dir / "ProfileData" / "device"
+        profiles_dir.mkdir(parents=True)
+        (profiles_dir / "first.profdata").touch()
+        (profiles_dir / "second.profdata").touch()
+        app = build_dir / "Products" / "Swift Example.app"
+        app.mkdir(parents=True)
+        (app / "Swift Example").touch()
+        framework = build_dir / "Products" / "Kit.framework"
+        (framework / "Contents" / "MacOS").mkdir(parents=True)
+        find_bundles = mocker.spy(XcodePlugin, "_find_bundles")
+
+        res = XcodePlugin(
+            derived_data_folder=derived_data, max_workers=2
+        ).run_preparation(collector=None)
+
+        assert res.success
+        assert find_bundles.call_count == 1
+        assert (tmp_path / "SwiftExample.app.coverage.txt").read_text() == (
+            f"{app / 'Swift Example'}:\n    1|    1|func run() {{}}\n"
+        )
+        assert (tmp_path / "Kit.framework.coverage.txt").read_text() == (
+            f"{framework / 'Contents' / 'MacOS' / 'Kit'}:\n    1|    1|func run() {{}}\n"
+        )
@@ -0,0 +1,118 @@
+import json
+
+from codecov_cli.runners.collection_cache import CollectionCache, get_label_file
+
+
+def _write_project(tmp_path):
+    (tmp_path / "tests").mkdir()
+    (tmp_path / "tests" / "conftest.py").write_text("")
+    (tmp_path / "tests" / "test_a.py").write_text("def test_a(): pass\n")
+    (tmp_path / "tests" / "test_b.py").write_text("def test_b(): pass\n")
+    (tmp_path / "tests" / "test_empty.py").write_text("")
+    (tmp_path / "pytest.ini").write_text("[pytest]\n")
+
+
+labels = ["tests/test_a.py::test_a", "tests/test_b.py::test_b[x::y]"]
+
+
+def _load(tmp_path, options=None):
+    return CollectionCache.load(
+        tmp_path / ".collection_cache",
+        options or ["-q", "--collect-only"],
+        ["test_*.py"],
+        root=tmp_path,
+    )
+
+
+def _save_full_collection(tmp_path):
+    cache = _load(tmp_path)
+    assert cache.get_files_to_collect() is None
+    assert cache.set_labels(labels)
+    cache.save()
+
+
+def test_get_label_file():
+    assert get_label_file("tests/test_a.py::TestA::test_a[a::b]") == "tests/test_a.py"
+
+
+def test_nothing_changed(tmp_path):
+    _write_project(tmp_path)
+    _save_full_collection(tmp_path)
+
+    cache = _load(tmp_path)
+    assert cache.get_files_to_collect() == []
+    assert cache.get_labels() == labels
+    content = json.loads((tmp_path / ".collection_cache").read_text())
+    assert content["test_files"]["tests/test_empty.py"]["labels"] == []
+    assert sorted(content["config_files"]) == ["pytest.ini", "tests/conftest.py"]
+
+
+def test_changed_test_file(tmp_path):
+    _write_project(tmp_path)
+    _save_full_collection(tmp_path)
+    (tmp_path / "tests" / "test_b.py").write_text("def test_c(): pass\n")
+
+    cache = _load(tmp_path)
+    assert cache.get_files_to_collect() == ["tests/test_b.py"]
+    cache.update_files(["tests/test_b.py"], ["tests/test_b.py::test_c"])
+    cache.save()
+    assert cache.get_labels() == ["tests/test_a.py::test_a", "tests/test_b.py::test_c"]
+    assert _load(tmp_path).get_files_to_collect() == []
+
+
+def test_deleted_test_file(tmp_path):
+    _write_project(tmp_path)
+    _save_full_collection(tmp_path)
+    (tmp_path / "tests" / "test_b.py").unlink()
+
+    cache = _load(tmp_path)
+    assert cache.get_files_to_collect() == []
+    assert cache.get_labels() == ["tests/test_a.py::test_a"]
+
+
+def test_full_collection_needed(tmp_path):
+    _write_project(tmp_path)
+    _save_full_collection(tmp_path)
+    # Different options
+    assert (
+        _load(tmp_path, ["-q", "--collect-only", "-x"]).get_files_to_collect() is None
+    )
+
+    (tmp_path / "tests" / "test_empty.py").write_text("def test_new(): pass\n")
+    assert _load(tmp_path).get_files_to_collect() is None
+    _save_full_collection(tmp_path)
+
+    (tmp_path / "tests" / "test_new.py").write_text("def test_new(): pass\n")
+    assert _load(tmp_path).get_files_to_collect() is None
+    _save_full_collection(tmp_path)
+
+    (tmp_path / "tests" / "conftest.py").write_text("import pytest\n")
+    assert _load(tmp_path).get_files_to_collect() is None
+
+
+def test_invalid_cache_file(tmp_path):
+    _write_project(tmp_path)
+    (tmp_path / ".collection_cache").write_text("not json")
+    assert _load(tmp_path).get_files_to_collect() is None
+
+
+def test_save_cache_fails(tmp_path, capsys):
+    _write_project(tmp_path)
+    cache = CollectionCache.load(
+        tmp_path / "missing" / ".collection_cache",
+        ["-q", "--collect-only"],
+        ["test_*.py"],
+        root=tmp_path,
+    )
+    assert cache.set_labels(labels)
+    cache.save()
+    assert "Unable to save collection cache" in capsys.readouterr().err
+    assert not (tmp_path / "missing").exists()
+
+
+def test_labels_from_unknown_files_are_not_cached(tmp_path):
+    _write_project(tmp_path)
+    cache = _load(tmp_path)
+    assert not cache.set_labels(["other/test_a.py::test_a"])
+    cache.save()
+    assert not (tmp_path / ".collection_cache").exists()
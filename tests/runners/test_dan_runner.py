@@ -1,3 +1,7 @@
+import json
+import os
+import subprocess
+import sys
 from unittest.mock import MagicMock, patch
 
 import pytest
@@ -6,25 +10,23 @@ from codecov_cli.runners.dan_runner import DoAnythingNowRunner
 
 
 class TestDoAnythingNowRunner(object):
-    @patch("codecov_cli.runners.dan_runner.subprocess.run")
-    def test_collect_tests(self, mock_run):
-        test_list = ["test_1", "test_2", "test_3"]
-        mock_stdout = MagicMock()
-        mock_stdout.configure_mock(
-            **{"stdout.decode.return_value": "\n".join(test_list)}
-        )
-        mock_run.return_value = mock_stdout
-
-        config_options = {"collect_tests_command": ["mycommand", "--option"]}
+    def test_collect_tests(self):
+        script = "for idx in range(1, 4): print(f'test_{idx}')\nprint()"
+        config_options = {"collect_tests_command": [sys.executable, "-c", script]}
         runner = DoAnythingNowRunner(config_options)
         assert runner.params == config_options
         resp = runner.collect_tests()
-        assert resp == test_list
-        mock_run.assert_called_with(
-            ["mycommand", "--option"],
-            capture_output=True,
-            check=True,
+        assert resp == ["test_1", "test_2", "test_3"]
+
+    def test_collect_tests_command_fails(self):
+        script = "import sys; print('test_1'); sys.exit('collection broke')"
+        runner = DoAnythingNowRunner(
+            {"collect_tests_command": [sys.executable, "-c", script]}
         )
+        with pytest.raises(subprocess.CalledProcessError) as exp:
+            runner.collect_tests()
+        assert exp.value.returncode == 1
+        assert b"collection broke" in exp.value.stderr
 
     def test_collect_test_no_config(self):
         runner = DoAnythingNowRunner()
@@ -102,3 +104,58 @@ class TestDoAnythingNowRunner(object):
             str(exp.value)
             == "DAN runner missing 'process_labelanalysis_result_command' configuration value"
         )
+
+    @pytest.mark.parametrize("delivery", ["stdin", "file"])
+    def test_process_labelanalysis_result_delivery(self, delivery):
+        label_analysis_result = {
+            "present_report_labels": ["test_present"],
+            "absent_labels": [f"test_absent_{idx}" for idx in range(100000)],
+            "present_diff_labels": ["test_in_diff"],
+            "global_level_labels": ["test_global"],
+        }
+        script = (
+            "import json, sys\n"
+            "f = open(sys.argv[1]) if len(sys.argv) > 1 else sys.stdin\n"
+            "result = json.load(f)\n"
+            "print(len(result['absent_labels']), result['global_level_labels'][0])"
+        )
+        runner = DoAnythingNowRunner(
+            {
+                "process_labelanalysis_result_command": [sys.executable, "-c", script],
+                "process_labelanalysis_result_delivery": delivery,
+            }
+        )
+        output = runner.process_labelanalysis_result(label_analysis_result)
+        assert output.split() == ["100000", "test_global"]
+
+    @patch("codecov_cli.runners.dan_runner.subprocess.run")
+    def test_process_labelanalysis_result_file_is_removed(self, mock_run):
+        result_files = []
+
+        def run(command, **kwargs):
+            result_files.append(command[-1])
+            with open(command[-1]) as f:
+                assert json.load(f) == {"absent_labels": ["test_absent"]}
+            return MagicMock()
+
+        mock_run.side_effect = run
+        runner = DoAnythingNowRunner(
+            {
+                "process_labelanalysis_result_command": "mycommand",
+                "process_labelanalysis_result_delivery": "file",
+            }
+        )
+        runner.process_labelanalysis_result({"absent_labels": ["test_absent"]})
+        assert len(result_files) == 1
+        assert not os.path.exists(result_files[0])
+
+    def test_process_labelanalysis_result_unknown_delivery(self):
+        runner = DoAnythingNowRunner(
+            {
+                "process_labelanalysis_result_command": "mycommand",
+                "process_labelanalysis_result_delivery": "carrier-pigeon",
+            }
+        )
+        with pytest.raises(Exception) as exp:
+            runner.process_labelanalysis_result({})
+        assert "process_labelanalysis_result_delivery" in str(exp.value)
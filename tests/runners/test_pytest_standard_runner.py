@@ -1,3 +1,7 @@
+import json
+import os
+import pathlib
+import threading
 from subprocess import CalledProcessError
 from unittest.mock import MagicMock, call, patch
 
@@ -5,6 +9,7 @@ import click
 import pytest
 from pytest import ExitCode
 
+from codecov_cli.runners import pytest_in_process
 from codecov_cli.runners.pytest_standard_runner import PytestStandardRunner
 from codecov_cli.runners.pytest_standard_runner import logger as runner_logger
 from codecov_cli.runners.pytest_standard_runner import stdout as pyrunner_stdout
@@ -152,6 +157,128 @@ class TestPythonStandardRunner(object):
         )
         assert collected_tests_from_runner == collected_test_list
 
+    def test_collect_tests_with_cache(self, mocker, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "test_a.py").write_text("def test_a(): pass\n")
+        (tmp_path / "test_b.py").write_text("def test_b(): pass\n")
+        mock_execute = mocker.patch.object(
+            PytestStandardRunner,
+            "_execute_pytest",
+            return_value="test_a.py::test_a\ntest_b.py::test_b\n\n2 tests collected",
+        )
+        runner = PytestStandardRunner(dict(collection_cache_file=".collection_cache"))
+
+        assert runner.collect_tests() == ["test_a.py::test_a", "test_b.py::test_b"]
+        mock_execute.assert_called_once_with(["-q", "--collect-only"])
+
+        # Nothing changed
+        mock_execute.reset_mock()
+        assert runner.collect_tests() == ["test_a.py::test_a", "test_b.py::test_b"]
+        mock_execute.assert_not_called()
+
+        # Only the changed file is collected
+        (tmp_path / "test_b.py").write_text("def test_c(): pass\n")
+        mock_execute.return_value = "test_b.py::test_c\n\n1 test collected"
+        assert runner.collect_tests() == ["test_a.py::test_a", "test_b.py::test_c"]
+        mock_execute.assert_called_once_with(["-q", "--collect-only", "test_b.py"])
+
+    def test_collect_tests_with_cache_changed_file_fails(
+        self, mocker, tmp_path, monkeypatch
+    ):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "test_a.py").write_text("def test_a(): pass\n")
+        mock_execute = mocker.patch.object(
+            PytestStandardRunner, "_execute_pytest", return_value="test_a.py::test_a"
+        )
+        runner = PytestStandardRunner(dict(collection_cache_file=".collection_cache"))
+        runner.collect_tests()
+
+        # All tests removed from the file, pytest exits with code 5
+        (tmp_path / "test_a.py").write_text("\n")
+        mock_execute.reset_mock()
+        mock_execute.side_effect = [click.ClickException("no tests"), ""]
+        assert runner.collect_tests() == []
+        assert mock_execute.call_args_list == [
+            call(["-q", "--collect-only", "test_a.py"]),
+            call(["-q", "--collect-only"]),
+        ]
+
+    def test_collect_tests_in_process(self, mocker, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "test_a.py").write_text(
+            "import pytest\n"
+            "@pytest.mark.parametrize('x', ['a::b', 'c'])\n"
+            "def test_a(x): pass\n"
+            "class TestB:\n"
+            "    def test_b(self): pass\n"
+        )
+        mock_execute = mocker.patch.object(PytestStandardRunner, "_execute_pytest")
+        runner = PytestStandardRunner(dict(collect_in_process=True))
+
+        assert runner.collect_tests() == [
+            "test_a.py::test_a[a::b]",
+            "test_a.py::test_a[c]",
+            "test_a.py::TestB::test_b",
+        ]
+        mock_execute.assert_not_called()
+
+    def test_collect_tests_in_process_spawned_outside_linux(
+        self, mocker, tmp_path, monkeypatch
+    ):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "test_a.py").write_text("def test_a(): pass\n")
+        mocker.patch("codecov_cli.runners.pytest_in_process.sys.platform", "darwin")
+        get_context = mocker.spy(pytest_in_process.multiprocessing, "get_context")
+        runner = PytestStandardRunner(dict(collect_in_process=True))
+
+        assert runner.collect_tests() == ["test_a.py::test_a"]
+        get_context.assert_called_once_with("spawn")
+
+    def test_collect_tests_in_process_spawned_with_other_threads(
+        self, mocker, tmp_path, monkeypatch
+    ):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "test_a.py").write_text("def test_a(): pass\n")
+        mocker.patch("codecov_cli.runners.pytest_in_process.sys.platform", "linux")
+        get_context = mocker.spy(pytest_in_process.multiprocessing, "get_context")
+        runner = PytestStandardRunner(dict(collect_in_process=True))
+
+        stop = threading.Event()
+        thread = threading.Thread(target=stop.wait)
+        thread.start()
+        try:
+            assert runner.collect_tests() == ["test_a.py::test_a"]
+        finally:
+            stop.set()
+            thread.join()
+        get_context.assert_called_once_with("spawn")
+
+        get_context.reset_mock()
+        assert runner.collect_tests() == ["test_a.py::test_a"]
+        get_context.assert_called_once_with("fork")
+
+    def test_collect_tests_in_process_fails(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "test_a.py").write_text("import missing_module\n")
+        runner = PytestStandardRunner(dict(collect_in_process=True))
+
+        with pytest.raises(click.ClickException) as exp:
+            runner.collect_tests()
+        assert "Pytest exited with non-zero code 2." in str(exp.value)
+        assert "ERROR collecting test_a.py" in str(exp.value)
+
+    def test_collect_tests_in_process_pytest_not_available(self, mocker):
+        mocker.patch(
+            "codecov_cli.runners.pytest_standard_runner.is_pytest_available",
+            return_value=False,
+        )
+        mock_execute = mocker.patch.object(
+            PytestStandardRunner, "_execute_pytest", return_value="test_a.py::test_a"
+        )
+        runner = PytestStandardRunner(dict(collect_in_process=True))
+        assert runner.collect_tests() == ["test_a.py::test_a"]
+        mock_execute.assert_called_with(["-q", "--collect-only"])
+
     def test_process_label_analysis_result(self, mocker):
         label_analysis_result = {
             "present_report_labels": ["test_present"],
@@ -178,6 +305,174 @@ class TestPythonStandardRunner(object):
             "test_in_diff",
         ]
 
+    def test_process_label_analysis_result_tests_in_file(self, mocker):
+        label_analysis_result = {
+            "present_report_labels": [],
+            "absent_labels": ["test_a.py::test_a", "test_a.py::test_b[1]"],
+            "present_diff_labels": ["test_b.py::test_c"],
+            "global_level_labels": [],
+        }
+
+        def execute_pytest(pytest_args, capture_output, env):
+            tests_file = env["CODECOV_SELECTED_TESTS_FILE"]
+            with open(tests_file) as f:
+                assert sorted(f.read().splitlines()) == [
+                    "test_a.py::test_a",
+                    "test_a.py::test_b",
+                    "test_b.py::test_c",
+                ]
+            assert env["PYTHONPATH"].split(os.pathsep)[0] == os.path.dirname(tests_file)
+
+        mock_execute = mocker.patch.object(
+            PytestStandardRunner, "_execute_pytest", side_effect=execute_pytest
+        )
+        runner = PytestStandardRunner(dict(max_tests_in_command_line=2))
+        runner.process_labelanalysis_result(
+            LabelAnalysisRequestResult(label_analysis_result)
+        )
+        args, _ = mock_execute.call_args
+        assert args[0][:4] == [
+            "--cov=./",
+            "--cov-context=test",
+            "-p",
+            "codecov_select_tests",
+        ]
+        assert sorted(args[0][4:]) == ["test_a.py", "test_b.py"]
+
+    @patch("codecov_cli.runners.pytest_standard_runner.subprocess")
+    def test_execute_pytest_with_env(self, mock_subprocess, monkeypatch):
+        monkeypatch.setenv("EXISTING_VAR", "value")
+        mock_subprocess.run.return_value = MagicMock(stdout=b"")
+
+        self.runner._execute_pytest(["--option"], env={"NEW_VAR": "new"})
+        _, kwargs = mock_subprocess.run.call_args
+        assert kwargs["env"]["EXISTING_VAR"] == "value"
+        assert kwargs["env"]["NEW_VAR"] == "new"
+
+    def test_process_label_analysis_result_in_shards(
+        self, mocker, tmp_path, monkeypatch
+    ):
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.delenv("COVERAGE_FILE", raising=False)
+        (tmp_path / ".test_durations").write_text(
+            '{"test_absent": 10, "test_global": 1, "test_in_diff[1]": 2, "test_in_diff[2]": 3}'
+        )
+        label_analysis_result = {
+            "present_report_labels": ["test_present"],
+            "absent_labels": ["test_absent"],
+            "present_diff_labels": ["test_in_diff[1]", "test_in_diff[2]"],
+            "global_level_labels": ["test_global"],
+        }
+
+        def run_shard(command, env, **kwargs):
+            pathlib.Path(env["COVERAGE_FILE"]).write_text(",".join(command[5:]))
+            return MagicMock(returncode=0, stdout=b"shard output\n")
+
+        mock_run = mocker.patch(
+            "codecov_cli.runners.pytest_standard_runner.subprocess.run",
+            side_effect=run_shard,
+        )
+
+        def combine(data_dir):
+            shards = sorted(data_dir.glob(".coverage.*"))
+            (data_dir / ".coverage").write_text(
+                ",".join(shard.read_text() for shard in shards)
+            )
+            return data_dir / ".coverage"
+
+        mocker.patch(
+            "codecov_cli.runners.pytest_standard_runner.combine_coverage_data_files",
+            side_effect=combine,
+        )
+        runner = PytestStandardRunner(dict(shards=2))
+        runner.process_labelanalysis_result(
+            LabelAnalysisRequestResult(label_analysis_result)
+        )
+
+        shard_tests = sorted(
+            sorted(call_args.args[0][5:]) for call_args in mock_run.call_args_list
+        )
+        assert shard_tests == [["test_absent"], ["test_global", "test_in_diff"]]
+        for call_args in mock_run.call_args_list:
+            assert call_args.args[0][:5] == [
+                "python",
+                "-m",
+                "pytest",
+                "--cov=./",
+                "--cov-context=test",
+            ]
+        # Coverage data of both shards is combined
+        assert sorted((tmp_path / ".coverage").read_text().split(",")) == [
+            "test_absent",
+            "test_global",
+            "test_in_diff",
+        ]
+
+    def test_process_label_analysis_result_records_durations(
+        self, mocker, tmp_path, monkeypatch
+    ):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "test_a.py").write_text("")
+        (tmp_path / ".test_durations").write_text('{"test_a.py::test_old": 5}')
+
+        def run_pytest(command, **kwargs):
+            junit_option = [arg for arg in command if arg.startswith("--junitxml=")]
+            assert len(junit_option) == 1
+            pathlib.Path(junit_option[0].split("=", 1)[1]).write_text(
+                '<testsuite><testcase classname="test_a" name="test_new" time="0.5" />'
+                "</testsuite>"
+            )
+            return MagicMock()
+
+        mocker.patch(
+            "codecov_cli.runners.pytest_standard_runner.subprocess.run",
+            side_effect=run_pytest,
+        )
+        runner = PytestStandardRunner(dict(record_test_durations=True))
+        runner.process_labelanalysis_result(
+            LabelAnalysisRequestResult(
+                {
+                    "present_report_labels": [],
+                    "absent_labels": ["test_a.py::test_new"],
+                    "present_diff_labels": [],
+                    "global_level_labels": [],
+                }
+            )
+        )
+        assert json.loads((tmp_path / ".test_durations").read_text()) == {
+            "test_a.py::test_new": 0.5,
+            "test_a.py::test_old": 5,
+        }
+
+    def test_process_label_analysis_result_in_shards_fails(
+        self, mocker, tmp_path, monkeypatch
+    ):
+        monkeypatch.chdir(tmp_path)
+        mocker.patch(
+            "codecov_cli.runners.pytest_standard_runner.subprocess.run",
+            side_effect=[
+                MagicMock(returncode=0, stdout=b""),
+                MagicMock(returncode=1, stdout=b"1 failed"),
+            ],
+        )
+        mocker.patch(
+            "codecov_cli.runners.pytest_standard_runner.combine_coverage_data_files",
+            return_value=None,
+        )
+        runner = PytestStandardRunner(dict(shards=2))
+        with pytest.raises(click.ClickException) as exp:
+            runner.process_labelanalysis_result(
+                LabelAnalysisRequestResult(
+                    {
+                        "present_report_labels": [],
+                        "absent_labels": ["test_a", "test_b"],
+                        "present_diff_labels": [],
+                        "global_level_labels": [],
+                    }
+                )
+            )
+        assert "Pytest exited with non-zero code in shards [1]." in str(exp.value)
+
     def test_process_label_analysis_result_diff_coverage_root(self, mocker):
         label_analysis_result = {
             "present_report_labels": ["test_present"],
@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+
+from codecov_cli.runners.selected_tests_file import prepare_selected_tests_file
+
+
+def test_prepare_selected_tests_file(tmp_path, monkeypatch):
+    monkeypatch.setenv("PYTHONPATH", "existing")
+    tests = ["tests/test_a.py::test_a", "tests/test_a.py::test_b", "test_c.py::test_c"]
+    args, env = prepare_selected_tests_file(tests, tmp_path, "shard_tests")
+
+    assert args == ["-p", "codecov_select_tests", "tests/test_a.py", "test_c.py"]
+    assert env == {
+        "PYTHONPATH": f"{tmp_path}{os.pathsep}existing",
+        "CODECOV_SELECTED_TESTS_FILE": str(tmp_path / "shard_tests"),
+    }
+    assert (tmp_path / "shard_tests").read_text().splitlines() == tests
+    assert (tmp_path / "codecov_select_tests.py").exists()
+
+
+def test_selected_tests_run_with_plugin(tmp_path):
+    project = tmp_path / "project"
+    project.mkdir()
+    (project / "test_a.py").write_text(
+        "import pytest\n"
+        "@pytest.mark.parametrize('x', [1, 2])\n"
+        "def test_param(x): pass\n"
+        "def test_selected(): pass\n"
+        "def test_not_selected(): assert False\n"
+    )
+    (project / "test_b.py").write_text("def test_b(): assert False\n")
+    selection_dir = tmp_path / "selection"
+    selection_dir.mkdir()
+    args, env = prepare_selected_tests_file(
+        ["test_a.py::test_param", "test_a.py::test_selected"], selection_dir
+    )
+
+    result = subprocess.run(
+        [sys.executable, "-m", "pytest", "-p", "no:cacheprovider", *args],
+        cwd=project,
+        env={**os.environ, **env},
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stdout
+    assert "3 passed, 1 deselected" in result.stdout
@@ -0,0 +1,117 @@
+import json
+
+from codecov_cli.runners.sharding import (
+    index_test_durations,
+    load_test_durations,
+    read_junit_durations,
+    split_in_shards,
+    update_test_durations,
+)
+
+junit_report = """<?xml version="1.0" encoding="utf-8"?>
+<testsuites><testsuite name="pytest" tests="5">
+<testcase classname="tests.test_a" name="test_a[1]" time="1.5" />
+<testcase classname="tests.test_a.TestA" name="test_method" time="0.25" />
+<testcase classname="tests.test_a" name="test_skipped" time="0.0"><skipped /></testcase>
+<testcase classname="tests.test_a" name="test_failed" time="2"><failure /></testcase>
+<testcase classname="other.test_missing" name="test_x" time="1" />
+</testsuite></testsuites>
+"""
+
+
+def test_load_test_durations(tmp_path):
+    durations_file = tmp_path / ".test_durations"
+    assert load_test_durations(durations_file) == {}
+    durations_file.write_text(json.dumps({"test_a.py::test_a": 1, "test_b": 0.5}))
+    assert load_test_durations(durations_file) == {
+        "test_a.py::test_a": 1.0,
+        "test_b": 0.5,
+    }
+    durations_file.write_text("[1, 2]")
+    assert load_test_durations(durations_file) == {}
+    durations_file.write_text("not json")
+    assert load_test_durations(durations_file) == {}
+
+
+def test_index_test_durations():
+    durations = {"test_a[1]": 1, "test_a[2]": 2, "test_b": 3, "test_c[x[1]]": 4}
+    assert index_test_durations(durations) == {
+        "test_a[1]": 1,
+        "test_a[2]": 2,
+        "test_a": 3,
+        "test_b": 3,
+        "test_c[x[1]]": 4,
+        "test_c": 4,
+    }
+    # A duration recorded without parameters is kept
+    assert index_test_durations({"test_a": 5, "test_a[1]": 1})["test_a"] == 5
+
+
+def test_split_in_shards_parametrized_durations():
+    durations = index_test_durations({"a[1]": 3, "a[2]": 3, "b": 2, "c": 2, "d": 1})
+    assert split_in_shards(["a", "b", "c", "d"], 2, durations) == [
+        ["a"],
+        ["b", "c", "d"],
+    ]
+
+
+def test_split_in_shards_balanced_by_duration():
+    durations = {"a": 8, "b": 7, "c": 6, "d": 5, "e": 4}
+    shards = split_in_shards(["a", "b", "c", "d", "e"], 2, durations)
+    # a -> 0, b -> 1, c -> 1 (7 < 8), d -> 0 (8 < 13), e -> 0 (13, first of the tie)
+    assert shards == [["a", "d", "e"], ["b", "c"]]
+
+
+def test_split_in_shards_unknown_durations_use_average():
+    durations = {"a": 10, "b": 2}
+    shards = split_in_shards(["a", "b", "c", "d"], 2, durations)
+    # c and d count as 6 seconds each
+    assert shards == [["a", "b"], ["c", "d"]]
+
+
+def test_split_in_shards_without_durations():
+    assert split_in_shards(["a", "b", "c", "d", "e"], 2, {}) == [
+        ["a", "c", "e"],
+        ["b", "d"],
+    ]
+
+
+def test_split_in_shards_more_shards_than_tests():
+    assert split_in_shards(["a", "b"], 4, {}) == [["a"], ["b"]]
+    assert split_in_shards(["a"], 0, {}) == [["a"]]
+
+
+def test_read_junit_durations(tmp_path):
+    (tmp_path / "tests").mkdir()
+    (tmp_path / "tests" / "test_a.py").write_text("")
+    junit_file = tmp_path / "junit.xml"
+    junit_file.write_text(junit_report)
+    assert read_junit_durations(junit_file, tmp_path) == {
+        "tests/test_a.py::test_a[1]": 1.5,
+        "tests/test_a.py::TestA::test_method": 0.25,
+        "tests/test_a.py::test_failed": 2.0,
+    }
+
+
+def test_update_test_durations(tmp_path):
+    (tmp_path / "tests").mkdir()
+    (tmp_path / "tests" / "test_a.py").write_text("")
+    junit_file = tmp_path / "junit.xml"
+    junit_file.write_text(junit_report)
+    durations_file = tmp_path / ".test_durations"
+    durations_file.write_text(
+        json.dumps({"tests/test_a.py::test_a[1]": 10, "tests/test_b.py::test_b": 3})
+    )
+    expected = {
+        "tests/test_a.py::TestA::test_method": 0.25,
+        "tests/test_a.py::test_a[1]": 1.5,
+        "tests/test_a.py::test_failed": 2.0,
+        "tests/test_b.py::test_b": 3.0,
+    }
+    assert (
+        update_test_durations(
+            durations_file, [junit_file, tmp_path / "missing.xml"], tmp_path
+        )
+        == expected
+    )
+    assert load_test_durations(durations_file) == expected
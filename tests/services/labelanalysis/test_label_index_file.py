@@ -0,0 +1,106 @@
+import json
+
+import pytest
+
+from codecov_cli.helpers.encoder import encode_label_indexes
+from codecov_cli.services.labelanalysis import LabelIndex
+from codecov_cli.services.labelanalysis.label_index_file import (
+    MappedLabelIndex,
+    is_label_index_file,
+    write_label_index,
+)
+
+compressed_report = {
+    "meta": {"show_contexts": True},
+    "files": {
+        "app/b.py": {
+            "executed_lines": [1],
+            "contexts": {"1": encode_label_indexes([4])},
+        },
+        "app/a.py": {
+            "executed_lines": [1, 3, 10, 20],
+            "contexts": {
+                "1": encode_label_indexes([0]),
+                "3": encode_label_indexes([1, 2]),
+                "10": encode_label_indexes([2]),
+                "20": encode_label_indexes([3]),
+            },
+        },
+        "app/empty.py": {"executed_lines": [], "contexts": {}},
+    },
+    "labels_table": {
+        "0": "",
+        "1": "test_a",
+        "2": "test_b",
+        "3": "test_c",
+        "4": "test_other",
+    },
+    "labels_encoding": "varint",
+}
+
+
+@pytest.fixture
+def report_file(tmp_path):
+    report_file = tmp_path / "coverage.codecov.json"
+    report_file.write_text(json.dumps(compressed_report))
+    return report_file
+
+
+def test_write_label_index(tmp_path, report_file):
+    index_file = tmp_path / "labels.index"
+    assert write_label_index(report_file, index_file) == 3
+    assert is_label_index_file(index_file)
+    assert not is_label_index_file(report_file)
+    assert not (tmp_path / "labels.index.tmp").exists()
+    with MappedLabelIndex(index_file) as label_index:
+        assert label_index.files_count == 3
+        assert label_index.labels == ["", "test_a", "test_b", "test_c", "test_other"]
+        assert label_index.get_line_label_indexes("app/a.py", [3, 10, 11]) == {1, 2}
+        assert label_index.get_line_label_indexes("app/a.py", [2, 21]) == set()
+        assert label_index.get_line_label_indexes("app/b.py", [1]) == {4}
+        assert label_index.get_line_label_indexes("app/empty.py", [1]) == set()
+        assert label_index.get_line_label_indexes("app/c.py", [1]) == set()
+        assert label_index.get_line_label_indexes("app/0.py", [1]) == set()
+
+
+@pytest.mark.parametrize(
+    "changed_lines",
+    [
+        {"app/a.py": {3, 4}, "app/new.py": {1}},
+        {"app/a.py": {20}, "app/b.py": {1, 2}},
+        {"app/a.py": {1}},
+        {},
+    ],
+)
+def test_mapped_label_index_same_result_as_label_index(
+    tmp_path, report_file, changed_lines
+):
+    index_file = tmp_path / "labels.index"
+    write_label_index(report_file, index_file)
+    with MappedLabelIndex(index_file) as label_index:
+        assert label_index.get_result(changed_lines) == LabelIndex.from_report(
+            report_file
+        ).get_result(changed_lines)
+
+
+def test_write_label_index_uncompressed_report(tmp_path):
+    report = {
+        "files": {
+            str(tmp_path / "app" / "a.py"): {
+                "contexts": {"1": [""], "3": ["test_a|run", "test_b|run"]}
+            }
+        }
+    }
+    report_file = tmp_path / "coverage.json"
+    report_file.write_text(json.dumps(report))
+    index_file = tmp_path / "labels.index"
+    assert write_label_index(report_file, index_file, root=tmp_path) == 1
+    with MappedLabelIndex(index_file) as label_index:
+        assert label_index.labels == ["", "test_a", "test_b"]
+        assert label_index.get_line_label_indexes("app/a.py", [3]) == {1, 2}
+
+
+def test_mapped_label_index_unknown_file(tmp_path, report_file):
+    with pytest.raises(ValueError) as exp:
+        MappedLabelIndex(report_file)
+    assert "is not a label index" in str(exp.value)
@@ -0,0 +1,251 @@
+import json
+import subprocess
+
+import click
+import pytest
+
+from codecov_cli.helpers.encoder import encode_label_indexes
+from codecov_cli.services.labelanalysis import (
+    LabelIndex,
+    get_changed_lines,
+    local_label_analysis,
+    parse_diff_changed_lines,
+)
+from codecov_cli.services.labelanalysis.label_index_file import write_label_index
+
+diff = """diff --git a/app/a.py b/app/a.py
+index 1111111..2222222 100644
+--- a/app/a.py
++++ b/app/a.py
+@@ -3 +3 @@ def a():
+-    return 1
++    return 2
+@@ -10,2 +10,0 @@ def b():
+-    x = 1
+-    y = 2
+@@ -20,0 +19,3 @@ def c():
++    z = 3
+diff --git a/app/new.py b/app/new.py
+new file mode 100644
+--- /dev/null
++++ b/app/new.py
+@@ -0,0 +1 @@
++print("new")
+diff --git a/app/old.py b/app/renamed.py
+similarity index 90%
+rename from app/old.py
+rename to app/renamed.py
+--- a/app/old.py
++++ b/app/renamed.py
+@@ -5,2 +5,3 @@
+-    a = 1
+-    b = 2
++    a = 2
++    b = 2
++    c = 3
+"""
+
+
+def test_parse_diff_changed_lines():
+    assert parse_diff_changed_lines(diff) == {
+        "app/a.py": {3, 10, 11, 20, 21},
+        "app/old.py": {5, 6},
+    }
+
+
+def test_parse_diff_changed_lines_special_paths():
+    special_paths_diff = (
+        "diff --git a/app/x y.py b/app/x y.py\n"
+        "--- a/app/x y.py\t\n"
+        "+++ b/app/x y.py\t\n"
+        "@@ -2 +2 @@\n"
+        "--- removed line that looks like a header\n"
+        "+x = 2\n"
+        'diff --git "a/app/\\303\\251.py" "b/app/\\303\\251.py"\n'
+        '--- "a/app/\\303\\251.py"\n'
+        '+++ "b/app/\\303\\251.py"\n'
+        "@@ -4 +4 @@\n"
+        "-y = 1\n"
+        "+y = 2\n"
+        'diff --git "a/app/tab\\t\\"q\\".py" "b/app/tab\\t\\"q\\".py"\n'
+        '--- "a/app/tab\\t\\"q\\".py"\n'
+        '+++ "b/app/tab\\t\\"q\\".py"\n'
+        "@@ -6 +6 @@\n"
+        "-z = 1\n"
+        "+z = 2\n"
+    )
+    assert parse_diff_changed_lines(special_paths_diff) == {
+        "app/x y.py": {2},
+        "app/\u00e9.py": {4},
+        'app/tab\t"q".py': {6},
+    }
+
+
+def test_parse_diff_changed_lines_file_without_header():
+    # Binary files and mode changes have no '--- ' header
+    diff_without_header = (
+        "diff --git a/app/a.py b/app/a.py\n"
+        "--- a/app/a.py\n"
+        "+++ b/app/a.py\n"
+        "@@ -1 +1 @@\n"
+        "-a = 1\n"
+        "+a = 2\n"
+        "diff --git a/app/image.png b/app/image.png\n"
+        "Binary files a/app/image.png and b/app/image.png differ\n"
+        "@@ -3 +3 @@\n"
+    )
+    assert parse_diff_changed_lines(diff_without_header) == {"app/a.py": {1}}
+
+
+compressed_report = {
+    "meta": {"show_contexts": True},
+    "files": {
+        "app/a.py": {
+            "executed_lines": [1, 3, 10, 20],
+            "contexts": {"1": [0], "3": [1, 2], "10": [2], "20": [3]},
+        },
+        "app/other.py": {"executed_lines": [1], "contexts": {"1": [4]}},
+    },
+    "labels_table": {
+        "0": "",
+        "1": "test_a",
+        "2": "test_b",
+        "3": "test_c",
+        "4": "test_other",
+    },
+}
+
+
+def test_label_index_from_report(tmp_path):
+    report_file = tmp_path / "coverage.codecov.json"
+    report_file.write_text(json.dumps(compressed_report))
+    label_index = LabelIndex.from_report(report_file)
+    assert label_index.labels == ["", "test_a", "test_b", "test_c", "test_other"]
+    assert label_index.lines == {
+        "app/a.py": {1: [0], 3: [1, 2], 10: [2], 20: [3]},
+        "app/other.py": {1: [4]},
+    }
+
+
+def test_label_index_from_report_varint(tmp_path):
+    report = json.loads(json.dumps(compressed_report))
+    for file_details in report["files"].values():
+        file_details["contexts"] = {
+            line: encode_label_indexes(labels)
+            for line, labels in file_details["contexts"].items()
+        }
+    report["labels_encoding"] = "varint"
+    report_file = tmp_path / "coverage.codecov.json"
+    report_file.write_text(json.dumps(report))
+    assert LabelIndex.from_report(report_file).lines == {
+        "app/a.py": {1: [0], 3: [1, 2], 10: [2], 20: [3]},
+        "app/other.py": {1: [4]},
+    }
+
+
+def test_label_index_from_uncompressed_report(tmp_path):
+    report = {
+        "files": {
+            str(tmp_path / "app" / "a.py"): {
+                "contexts": {"1": [""], "3": ["test_a|run", "test_b|run"]}
+            }
+        }
+    }
+    report_file = tmp_path / "coverage.json"
+    report_file.write_text(json.dumps(report))
+    label_index = LabelIndex.from_report(report_file, root=tmp_path)
+    assert label_index.labels == ["", "test_a", "test_b"]
+    assert label_index.lines == {"app/a.py": {1: [0], 3: [1, 2]}}
+
+
+def test_label_index_get_result():
+    label_index = LabelIndex(
+        ["", "test_a", "test_b", "test_c"],
+        {"app/a.py": {1: [0], 3: [1, 2], 10: [2]}},
+    )
+    assert label_index.get_result({"app/a.py": {3, 4}, "app/new.py": {1}}) == {
+        "present_report_labels": ["test_a", "test_b", "test_c"],
+        "absent_labels": [],
+        "present_diff_labels": ["test_a", "test_b"],
+        "global_level_labels": [],
+    }
+    # Module level code changed, every test might be affected
+    assert label_index.get_result({"app/a.py": {1}}) == {
+        "present_report_labels": ["test_a", "test_b", "test_c"],
+        "absent_labels": [],
+        "present_diff_labels": [],
+        "global_level_labels": ["test_a", "test_b", "test_c"],
+    }
+
+
+def _git(cwd, *args):
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True
+    ).stdout.decode()
+
+
+def test_local_label_analysis(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _git(tmp_path, "init", "-q")
+    _git(tmp_path, "config", "user.email", "ci@example.com")
+    _git(tmp_path, "config", "user.name", "CI")
+    (tmp_path / "app").mkdir()
+    source = [f"line_{idx} = {idx}" for idx in range(1, 25)]
+    (tmp_path / "app" / "a.py").write_text("\n".join(source) + "\n")
+    _git(tmp_path, "add", ".")
+    _git(tmp_path, "commit", "-q", "-m", "base")
+    base_sha = _git(tmp_path, "rev-parse", "HEAD").strip()
+    source[9] = "line_10 = 'changed'"
+    (tmp_path / "app" / "a.py").write_text("\n".join(source) + "\n")
+    _git(tmp_path, "commit", "-q", "-am", "head")
+    head_sha = _git(tmp_path, "rev-parse", "HEAD").strip()
+
+    report_file = tmp_path / "coverage.codecov.json"
+    report_file.write_text(json.dumps(compressed_report))
+    assert local_label_analysis(report_file, base_sha, head_sha) == {
+        "present_report_labels": ["test_a", "test_b", "test_c", "test_other"],
+        "absent_labels": [],
+        "present_diff_labels": ["test_b"],
+        "global_level_labels": [],
+    }
+    assert get_changed_lines(base_sha, head_sha) == {"app/a.py": {10}}
+
+    index_file = tmp_path / "labels.index"
+    write_label_index(report_file, index_file)
+    assert local_label_analysis(index_file, base_sha, head_sha) == {
+        "present_report_labels": ["test_a", "test_b", "test_c", "test_other"],
+        "absent_labels": [],
+        "present_diff_labels": ["test_b"],
+        "global_level_labels": [],
+    }
+
+
+def test_get_changed_lines_special_paths(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _git(tmp_path, "init", "-q")
+    _git(tmp_path, "config", "user.email", "ci@example.com")
+    _git(tmp_path, "config", "user.name", "CI")
+    paths = [tmp_path / "a.py", tmp_path / "x y.py", tmp_path / "\u00e9.py"]
+    for path in paths:
+        path.write_text("a = 1\nb = 1\n")
+    _git(tmp_path, "add", ".")
+    _git(tmp_path, "commit", "-q", "-m", "base")
+    base_sha = _git(tmp_path, "rev-parse", "HEAD").strip()
+    for path in paths:
+        path.write_text("a = 1\nb = 2\n")
+    _git(tmp_path, "commit", "-q", "-am", "head")
+    head_sha = _git(tmp_path, "rev-parse", "HEAD").strip()
+
+    assert get_changed_lines(base_sha, head_sha) == {
+        "a.py": {2},
+        "x y.py": {2},
+        "\u00e9.py": {2},
+    }
+
+
+def test_get_changed_lines_unknown_commit(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _git(tmp_path, "init", "-q")
+    with pytest.raises(click.ClickException) as exp:
+        get_changed_lines("0" * 40, "1" * 40)
+    assert "Unable to get the diff" in str(exp.value)
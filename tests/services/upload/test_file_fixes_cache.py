@@ -0,0 +1,97 @@
+import json
+from pathlib import Path
+
+from codecov_cli.services.upload.file_fixes_cache import FileFixesCache
+from codecov_cli.services.upload.upload_collector import (
+    UploadCollector,
+    go_patterns_to_apply,
+    kt_patterns_to_apply,
+)
+from codecov_cli.types import UploadCollectionResultFileFixer
+
+
+def test_cache_roundtrip(tmp_path):
+    cache_file = tmp_path / "file_fixes.json"
+    file_fixer = UploadCollectionResultFileFixer(
+        Path("sample.go"), set([1, 4]), set([(21, "/*\n")]), None
+    )
+
+    cache = FileFixesCache.load(cache_file, {"sample.go": "abc123"})
+    assert cache.get("sample.go", go_patterns_to_apply) is None
+    cache.set("sample.go", go_patterns_to_apply, file_fixer)
+    cache.save()
+
+    cache = FileFixesCache.load(cache_file, {"sample.go": "abc123"})
+    assert cache.get("sample.go", go_patterns_to_apply) == file_fixer
+    assert cache.hits == 1
+    # Same content, different patterns
+    assert cache.get("sample.go", kt_patterns_to_apply) is None
+    # Different content
+    cache = FileFixesCache.load(cache_file, {"sample.go": "def456"})
+    assert cache.get("sample.go", go_patterns_to_apply) is None
+
+
+def test_cache_only_saves_used_entries(tmp_path):
+    cache_file = tmp_path / "file_fixes.json"
+    file_fixer = UploadCollectionResultFileFixer(Path("a.go"), set([1]), set(), None)
+    cache = FileFixesCache.load(cache_file, {"a.go": "aaa", "b.go": "bbb"})
+    cache.set("a.go", go_patterns_to_apply, file_fixer)
+    cache.set("b.go", go_patterns_to_apply, file_fixer)
+    cache.save()
+
+    cache = FileFixesCache.load(cache_file, {"a.go": "aaa"})
+    assert cache.get("a.go", go_patterns_to_apply) is not None
+    cache.save()
+    assert len(json.loads(cache_file.read_text())["fixes"]) == 1
+
+
+def test_cache_ignores_files_without_blob_id(tmp_path):
+    cache_file = tmp_path / "file_fixes.json"
+    file_fixer = UploadCollectionResultFileFixer(Path("a.go"), set([1]), set(), None)
+    cache = FileFixesCache.load(cache_file, {})
+    cache.set("a.go", go_patterns_to_apply, file_fixer)
+    assert cache.get("a.go", go_patterns_to_apply) is None
+    assert cache.used_entries == {}
+
+
+def test_cache_ignores_invalid_file(tmp_path):
+    cache_file = tmp_path / "file_fixes.json"
+    cache_file.write_text("not json")
+    cache = FileFixesCache.load(cache_file, {"a.go": "aaa"})
+    assert cache.entries == {}
+
+    cache_file.write_text(json.dumps({"version": 0, "fixes": {"a": []}}))
+    cache = FileFixesCache.load(cache_file, {"a.go": "aaa"})
+    assert cache.entries == {}
+
+
+def test_collector_warm_cache_reads_no_files(tmp_path, mocker):
+    go_file = "tests/data/files_to_fix_examples/sample.go"
+    cache_file = tmp_path / "file_fixes.json"
+
+    cache = FileFixesCache.load(cache_file, {go_file: "abc123"})
+    cold_fixes = UploadCollector(
+        None, None, None, file_fixes_cache=cache
+    )._produce_file_fixes_for_network([go_file])
+
+    mock_open = mocker.patch("codecov_cli.services.upload.upload_collector.open")
+    cache = FileFixesCache.load(cache_file, {go_file: "abc123"})
+    warm_fixes = UploadCollector(
+        None, None, None, file_fixes_cache=cache
+    )._produce_file_fixes_for_network([go_file])
+
+    assert not mock_open.called
+    assert warm_fixes == cold_fixes
+    assert cache.hits == 1
+
+
+def test_cache_save_error_is_not_fatal(tmp_path):
+    cache_file = tmp_path / "missing_folder" / "file_fixes.json"
+    cache = FileFixesCache.load(cache_file, {"a.go": "aaa"})
+    cache.set(
+        "a.go",
+        go_patterns_to_apply,
+        UploadCollectionResultFileFixer(Path("a.go"), set([1]), set(), None),
+    )
+    cache.save()
+    assert not cache_file.exists()
@@ -0,0 +1,109 @@
+from pathlib import Path
+
+from codecov_cli.services.upload.referenced_paths import (
+    filter_network_by_referenced_paths,
+    find_paths_referenced_by_report,
+    find_paths_referenced_by_reports,
+)
+from codecov_cli.types import UploadCollectionResultFile
+
+
+def test_find_paths_lcov(tmp_path):
+    report = tmp_path / "lcov.info"
+    report.write_text(
+        "TN:\nSF:/home/ci/repo/src/a.c\nDA:1,1\nend_of_record\nSF:./src/b.c\nDA:2,0\nend_of_record\n"
+    )
+    assert find_paths_referenced_by_report(UploadCollectionResultFile(report)) == {
+        "/home/ci/repo/src/a.c",
+        "src/b.c",
+    }
+
+
+def test_find_paths_cobertura(tmp_path):
+    report = tmp_path / "coverage.xml"
+    report.write_text(
+        '<?xml version="1.0" ?>\n<coverage><packages><package name="codecov_cli">\n'
+        '<classes><class name="main.py" filename="codecov_cli/main.py" line-rate="1">'
+        '</class><class name="types.py" filename="codecov_cli/types.py"></class>\n'
+        "</classes></package></packages></coverage>"
+    )
+    assert find_paths_referenced_by_report(UploadCollectionResultFile(report)) == {
+        "codecov_cli/main.py",
+        "codecov_cli/types.py",
+    }
+
+
+def test_find_paths_jacoco(tmp_path):
+    report = tmp_path / "jacoco.xml"
+    report.write_text(
+        '<report name="app"><package name="com/example/app">\n'
+        '<class name="com/example/app/Main"></class>\n'
+        '<sourcefile name="Main.java"><line nr="3" mi="0" ci="3"/></sourcefile>\n'
+        '</package><package name="com/example/util">\n'
+        '<sourcefile name="Util.java"></sourcefile>\n'
+        "</package></report>"
+    )
+    assert find_paths_referenced_by_report(UploadCollectionResultFile(report)) == {
+        "com/example/app/Main.java",
+        "com/example/util/Util.java",
+    }
+
+
+def test_find_paths_gcov_and_go(tmp_path):
+    gcov_report = tmp_path / "main.c.gcov"
+    gcov_report.write_text(
+        "        -:    0:Source:src/main.c\n        -:    0:Graph:main.gcno\n        1:    1:int main() {\n"
+    )
+    go_report = tmp_path / "cover.out"
+    go_report.write_text(
+        "mode: set\ngithub.com/org/repo/pkg/a.go:3.10,5.2 1 1\ngithub.com/org/repo/pkg/a.go:7.10,9.2 1 0\n"
+    )
+    assert find_paths_referenced_by_report(UploadCollectionResultFile(gcov_report)) == {
+        "src/main.c"
+    }
+    assert find_paths_referenced_by_report(UploadCollectionResultFile(go_report)) == {
+        "github.com/org/repo/pkg/a.go"
+    }
+
+
+def test_find_paths_unknown_report_disables_filter(tmp_path):
+    lcov_report = tmp_path / "lcov.info"
+    lcov_report.write_text("SF:src/a.c\nend_of_record\n")
+    unknown_report = tmp_path / "coverage.json"
+    unknown_report.write_text('{"some": "format"}')
+
+    assert find_paths_referenced_by_reports(
+        [UploadCollectionResultFile(lcov_report)]
+    ) == {"src/a.c"}
+    assert (
+        find_paths_referenced_by_reports(
+            [
+                UploadCollectionResultFile(lcov_report),
+                UploadCollectionResultFile(unknown_report),
+            ]
+        )
+        is None
+    )
+
+
+def test_filter_network_by_referenced_paths():
+    network = [
+        "README.md",
+        "src/a.c",
+        "src/b.c",
+        "other/b.c",
+        "pkg/a.go",
+        "java/src/main/java/com/example/app/Main.java",
+    ]
+    referenced_paths = {
+        "/home/ci/repo/src/a.c",
+        "src/b.c",
+        "github.com/org/repo/pkg/a.go",
+        "com/example/app/Main.java",
+    }
+    assert filter_network_by_referenced_paths(network, referenced_paths) == [
+        "src/a.c",
+        "src/b.c",
+        "pkg/a.go",
+        "java/src/main/java/com/example/app/Main.java",
+    ]
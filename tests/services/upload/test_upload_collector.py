@@ -1,7 +1,10 @@
 from pathlib import Path
 from unittest.mock import patch
 
+import pytest
+
 from codecov_cli.services.upload.upload_collector import UploadCollector
+from codecov_cli.types import UploadCollectionResultFile
 
 
 def test_fix_kt_files():
@@ -109,3 +112,84 @@ def test_fix_when_disabled_fixes(tmp_path):
 
     assert len(fixes) == 0
     assert fixes == []
+
+
+def test_fix_multiple_files_keeps_network_order():
+    network = [
+        "tests/data/files_to_fix_examples/sample.php",
+        "tests/data/files_to_fix_examples/not_fixable.txt",
+        "tests/data/files_to_fix_examples/sample.kt",
+        "tests/data/files_to_fix_examples/sample.go",
+        "tests/data/files_to_fix_examples/sample.cpp",
+    ]
+
+    col = UploadCollector(None, None, None)
+
+    fixes = col._produce_file_fixes_for_network(network)
+
+    assert [fix.path for fix in fixes] == [
+        Path("tests/data/files_to_fix_examples/sample.php"),
+        Path("tests/data/files_to_fix_examples/sample.kt"),
+        Path("tests/data/files_to_fix_examples/sample.go"),
+        Path("tests/data/files_to_fix_examples/sample.cpp"),
+    ]
+
+
+def test_fix_last_line_without_newline(tmp_path):
+    kt_file = tmp_path / "sample.kt"
+    kt_file.write_text("fun main() {\n}\n\n/*\n}")
+
+    col = UploadCollector(None, None, None)
+
+    fixes = col._produce_file_fixes_for_network([str(kt_file)])
+
+    assert len(fixes) == 1
+    assert fixes[0].eof == 5
+    assert fixes[0].fixed_lines_without_reason == set([2, 5])
+    assert fixes[0].fixed_lines_with_reason == set([(4, "/*\n")])
+
+
+def test_generate_upload_data_limit_network_to_reports(tmp_path, mocker):
+    report = tmp_path / "lcov.info"
+    report.write_text("SF:tests/data/files_to_fix_examples/sample.cpp\nend_of_record\n")
+    network_finder = mocker.MagicMock()
+    network_finder.find_files.return_value = [
+        "tests/data/files_to_fix_examples/sample.cpp",
+        "tests/data/files_to_fix_examples/sample.go",
+    ]
+    coverage_file_finder = mocker.MagicMock()
+    coverage_file_finder.find_coverage_files.return_value = [
+        UploadCollectionResultFile(report)
+    ]
+
+    col = UploadCollector(
+        [], network_finder, coverage_file_finder, limit_network_to_reports=True
+    )
+    upload_data = col.generate_upload_data()
+
+    assert upload_data.network == ["tests/data/files_to_fix_examples/sample.cpp"]
+    assert [fix.path for fix in upload_data.file_fixes] == [
+        Path("tests/data/files_to_fix_examples/sample.cpp")
+    ]
+
+
+@pytest.mark.parametrize("network", [None, []])
+def test_generate_upload_data_limit_network_to_reports_without_network(
+    tmp_path, mocker, network
+):
+    report = tmp_path / "lcov.info"
+    report.write_text("SF:tests/data/files_to_fix_examples/sample.cpp\nend_of_record\n")
+    network_finder = mocker.MagicMock()
+    network_finder.find_files.return_value = network
+    coverage_file_finder = mocker.MagicMock()
+    coverage_file_finder.find_coverage_files.return_value = [
+        UploadCollectionResultFile(report)
+    ]
+
+    col = UploadCollector(
+        [], network_finder, coverage_file_finder, limit_network_to_reports=True
+    )
+    upload_data = col.generate_upload_data()
+
+    assert upload_data.network == network
+    assert upload_data.file_fixes == []
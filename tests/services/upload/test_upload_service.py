@@ -459,3 +459,46 @@ def test_do_upload_rase_no_cov_reports_found_error(mocker):
     mock_select_coverage_file_finder.assert_called_with(None, None, None, False)
     mock_select_network_finder.assert_called_with(versioning_system)
     mock_generate_upload_data.assert_called_with()
+
+
+def test_do_upload_logic_legacy_uploader_warns_network_format(mocker):
+    mocker.patch("codecov_cli.services.upload.select_preparation_plugins")
+    mocker.patch("codecov_cli.services.upload.select_coverage_file_finder")
+    mocker.patch("codecov_cli.services.upload.select_network_finder")
+    mocker.patch.object(UploadCollector, "generate_upload_data")
+    ci_adapter = mocker.MagicMock()
+    ci_adapter.get_fallback_value.return_value = "service"
+    runner = CliRunner()
+    with runner.isolation() as outstreams:
+        do_upload_logic(
+            {},
+            mocker.MagicMock(),
+            ci_adapter,
+            commit_sha="commit_sha",
+            report_code="report_code",
+            build_code="build_code",
+            build_url="build_url",
+            job_code="job_code",
+            env_vars=None,
+            flags=None,
+            name="name",
+            network_root_folder=None,
+            coverage_files_search_root_folder=None,
+            coverage_files_search_exclude_folders=None,
+            coverage_files_search_explicitly_listed_files=None,
+            plugin_names=[],
+            token="token",
+            branch="branch",
+            slug="slug",
+            use_legacy_uploader=True,
+            network_format="front-coded",
+            pull_request_number="pr",
+            dry_run=True,
+            git_service="git_service",
+            enterprise_url=None,
+        )
+    out_bytes = parse_outstreams_into_log_lines(outstreams[0].getvalue())
+    assert (
+        "warning",
+        "Network format front-coded is not supported by the legacy uploader. Sending the network as a list of paths.",
+    ) in out_bytes